@@ -0,0 +1,75 @@
+"""
+Compare the Excel export paths on synthetic activities frames.
+
+- to_excel: `DataFrame.to_excel`, the export used before the streaming one.
+- streaming: `save_to_excel`, which streams rows in openpyxl write-only mode.
+
+Each case runs in its own interpreter and reports its wall time and peak
+RSS. The RSS before the export, once the frame is built, is reported too.
+
+Usage:
+    python benchmarks/bench_excel.py [--rows 1000 10000 100000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from memory import peak_rss_mb, run_case
+
+METHODS = ["to_excel", "streaming"]
+
+
+def run(method: str, rows: int) -> dict:
+    from synthetic import make_activities_data
+    from utils.base_utils import save_to_excel
+
+    data = make_activities_data(rows)
+    rss_before = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = os.path.join(tmp_dir, "activities.xlsx")
+        start = time.perf_counter()
+        if method == "to_excel":
+            data.to_excel(dump_path, index=False)
+        else:
+            save_to_excel(data, None, None, dump_path=dump_path)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "seconds": elapsed,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--case", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        method, rows = args.case
+        print(json.dumps(run(method, int(rows))))
+        return
+
+    print(f"{'rows':>8} {'method':>10} {'time (s)':>9} "
+          f"{'RSS before (MB)':>16} {'peak RSS (MB)':>14}")
+    for rows in args.rows:
+        for method in METHODS:
+            result = run_case(__file__, method, rows)
+            print(
+                f"{rows:>8} {method:>10} {result['seconds']:>9.2f} "
+                f"{result['rss_before_mb']:>16.1f} "
+                f"{result['peak_rss_mb']:>14.1f}"
+            )
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
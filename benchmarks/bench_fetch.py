@@ -0,0 +1,162 @@
+"""
+Measure the end-to-end fetch path of `get_activities` against the local
+stand-in of Garmin Connect of `mock_server.py`.
+
+- threads: `get_activities`, with its pool of MAX_WORKERS threads.
+- async: `get_activities_async`, with up to MAX_CONCURRENT_REQUESTS requests
+  in flight. Only run when aiohttp is installed.
+
+The server runs in its own process, with the given latency, share of 429
+answers and TCX size. Each case runs in a fresh interpreter, from the login
+to the processed frame, and reports its throughput in activities per
+second, the number of requests received by the server per activity, 429
+answers included, and its peak RSS.
+
+Usage:
+    python benchmarks/bench_fetch.py [--activities 100 1000 10000]
+        [--latency 0.01] [--throttle 0.0] [--trackpoints 0] [--workers N]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from urllib.request import urlopen
+
+from memory import peak_rss_mb, run_case
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+METHODS = ["threads", "async"]
+FIRST_DAY = datetime(2015, 1, 1)  # first synthetic activity
+
+
+def run(method: str, url: str, activities: str, tcx: str, workers: str):
+    import asyncio
+
+    from mock_server import make_api
+    from utils.api_utils import get_activities
+    from utils.async_utils import get_activities_async
+
+    # One synthetic activity every 8 hours, see `make_activities`
+    enddate = FIRST_DAY + timedelta(hours=8 * int(activities))
+    options = dict(
+        startdate=FIRST_DAY.strftime("%Y-%m-%d"),
+        enddate=enddate.strftime("%Y-%m-%d"),
+        include_tcx=tcx == "1",
+    )
+    if int(workers):
+        key = "max_workers" if method == "threads" else "max_concurrency"
+        options[key] = int(workers)
+
+    with tempfile.TemporaryDirectory() as tmp_dir, patch(
+        "utils.base_utils.get_output_dir", lambda: tmp_dir
+    ), patch("utils.tcx_utils.get_output_dir", lambda: tmp_dir):
+        api = make_api(url)
+        start = time.perf_counter()
+        if method == "threads":
+            data, _ = get_activities(api, **options)
+        else:
+            data, _ = asyncio.run(get_activities_async(api, **options))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "rows": len(data),
+        "seconds": elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def get_stats(url: str) -> dict:
+    """Return the requests counters of a running mock server."""
+    root = url.rsplit("/modern", 1)[0]
+    with urlopen(f"{root}/stats") as response:
+        return json.load(response)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--activities", type=int, nargs="+", default=[100, 1000, 10000]
+    )
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--throttle", type=float, default=0.0)
+    parser.add_argument("--trackpoints", type=int, default=0)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Threads or requests in flight, defaults to those of the app.",
+    )
+    parser.add_argument("--case", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run(*args.case)))
+        return
+
+    methods = METHODS
+    if importlib.util.find_spec("aiohttp") is None:
+        print("aiohttp is not installed, the async client is skipped")
+        methods = ["threads"]
+
+    print(f"latency {args.latency * 1000:.0f} ms, 429 share {args.throttle}, "
+          f"{args.trackpoints} trackpoints per TCX")
+    print(f"{'activities':>10} {'method':>8} {'time (s)':>9} "
+          f"{'activities/s':>13} {'calls/activity':>15} {'429':>5} "
+          f"{'peak RSS (MB)':>14}")
+    for activities in args.activities:
+        # A server per size, in its own process so that its payloads do not
+        # count in the peak RSS of the cases
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(os.path.dirname(__file__), "mock_server.py"),
+                "--activities", str(activities),
+                "--latency", str(args.latency),
+                "--throttle", str(args.throttle),
+                "--trackpoints", str(args.trackpoints),
+                "--port", "0",
+            ],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            url = server.stdout.readline().strip()
+            for method in methods:
+                before = get_stats(url)
+                result = run_case(
+                    __file__,
+                    method,
+                    url,
+                    activities,
+                    int(args.trackpoints > 0),
+                    args.workers,
+                )
+                after = get_stats(url)
+
+                calls = sum(after["calls"].values()) - sum(
+                    before["calls"].values()
+                )
+                throttled = after["throttled"] - before["throttled"]
+                print(
+                    f"{activities:>10} {method:>8} "
+                    f"{result['seconds']:>9.2f} "
+                    f"{result['rows'] / result['seconds']:>13.1f} "
+                    f"{calls / result['rows']:>15.2f} {throttled:>5} "
+                    f"{result['peak_rss_mb']:>14.1f}"
+                )
+                sys.stdout.flush()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
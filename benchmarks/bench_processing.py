@@ -0,0 +1,123 @@
+"""
+Compare the processing of the activities data on a synthetic frame.
+
+- legacy: the former `process_activities_data`, which turned every column
+  into display strings and objects.
+- typed: the current `process_activities_data`, which keeps typed columns.
+- typed + format: the typed processing followed by `format_activities_data`,
+  the display formatting done at Excel export time.
+
+Reports the best wall time over several runs and the memory used by the
+resulting frame.
+
+Usage:
+    python benchmarks/bench_processing.py [--rows 50000] [--repeat 5]
+"""
+import time
+import argparse
+
+from synthetic import make_raw_activities_data
+from utils.data_utils import process_activities_data, format_activities_data
+
+
+def legacy_process_activities_data(data):
+    """The `process_activities_data` implementation replaced by typed one."""
+    data["Identifiant Garmin de l'activité"] = data[
+        "Identifiant Garmin de l'activité"
+    ].astype(str)
+    data["Identifiant Garmin de l'appareil"] = data[
+        "Identifiant Garmin de l'appareil"
+    ].astype(str)
+
+    data["Avantage principal Training Effect"] = data[
+        "Avantage principal Training Effect"
+    ].map(
+        {
+            'RECOVERY': "Récupération",
+            "TEMPO": "Tempo",
+            "AEROBIC_BASE": "Base",
+            "LACTATE_THRESHOLD": "Seuil",
+            "UNKNOWN": "",
+            "VO2MAX": "VO2 Max",
+        }
+    )
+    if "Comment vous êtes-vous senti ?" in data.columns:
+        data["Comment vous êtes-vous senti ?"] = data[
+            "Comment vous êtes-vous senti ?"
+        ].map(
+            {
+                0: "Très faible",
+                25: "Faible",
+                50: "Normal(e)",
+                75: "Fort(e)",
+                100: "Très fort(e)",
+            }
+        )
+
+    if "Effort perçu" in data.columns:
+        data["Effort perçu"] = (
+            (data["Effort perçu"].replace({"": -10}) / 10)
+            .fillna(-1)
+            .astype(int)
+            .astype(str)
+            .replace(str(-1), "")
+        )
+
+    data["Favori"] = (
+        data["Favori"]
+        .astype(str)
+        .str.lower()
+        .replace({"true": "Oui", "false": "Non"})
+    )
+    data["Présence d'un RP (Record personnel)"] = (
+        data["Présence d'un RP (Record personnel)"]
+        .astype(str)
+        .str.lower()
+        .replace({"true": "Oui", "false": "Non"})
+    )
+    data["Allure moyenne (km/h)"] = data["Allure moyenne (km/h)"] * 3.6
+    data["Allure maximale (km/h)"] = data["Allure maximale (km/h)"] * 3.6
+
+    if "Allure moyenne en déplacement (km/h)" in data.columns:
+        data["Allure moyenne en déplacement (km/h)"] = (
+            data["Allure moyenne en déplacement (km/h)"] * 3.6
+        )
+
+    data = data.fillna("")
+
+    return data
+
+
+METHODS = {
+    "legacy": legacy_process_activities_data,
+    "typed": process_activities_data,
+    "typed + format": lambda data: format_activities_data(
+        process_activities_data(data)
+    ),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    raw_data = make_raw_activities_data(args.rows)
+    print(f"{args.rows} rows, best of {args.repeat} runs")
+    print(f"{'method':>15} {'time (ms)':>10} {'memory (MB)':>12}")
+
+    for name, method in METHODS.items():
+        timings = []
+        for _ in range(args.repeat):
+            data = raw_data.copy()
+            start = time.perf_counter()
+            result = method(data)
+            timings.append(time.perf_counter() - start)
+
+        memory = result.memory_usage(deep=True).sum() / 2**20
+        print(f"{name:>15} {min(timings) * 1000:>10.1f} {memory:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Measure the cold start of the application.
+
+- import: time to import `app` in a fresh interpreter, and time to import
+  the modules now loaded only when a download starts (pandas, garminconnect,
+  openpyxl), which used to be imported before the window appeared.
+- first frame: wall time from the launch of the application to its first
+  drawn frame, and to the loaded logo. The application is started by a
+  wrapper patching `load_assets`, called once the first frame is drawn,
+  to report both steps on its output and close the window. This needs a
+  display.
+
+Usage:
+    python benchmarks/bench_startup.py
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+SRC_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"
+)
+
+DEFERRED_MODULES = ["pandas", "garminconnect", "openpyxl"]
+
+# Runs the application like `python src/app.py`, reporting its first frame
+# and its loaded logo
+FIRST_FRAME_WRAPPER = f"""
+import sys
+sys.path.insert(0, {SRC_DIR!r})
+
+import app
+
+load_assets = app.load_assets
+
+
+def probed_load_assets(root, *args):
+    print("first frame", flush=True)
+    logo = load_assets(root, *args)
+    root.update()
+    print("assets loaded", flush=True)
+    root.after(0, root.destroy)
+    return logo
+
+
+app.load_assets = probed_load_assets
+app.create_main_window()
+"""
+
+
+def time_import(modules: list) -> float:
+    """Import modules in a fresh interpreter and return the time it took."""
+    code = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {SRC_DIR!r})\n"
+        "start = time.perf_counter()\n"
+        + "".join(f"import {module}\n" for module in modules)
+        + "print(time.perf_counter() - start)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_first_frame() -> tuple:
+    """
+    Launch the application and return the time to its first frame and to
+    its loaded logo.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", FIRST_FRAME_WRAPPER],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+    timings = []
+    for line in process.stdout:
+        if line.strip() in ("first frame", "assets loaded"):
+            timings.append(time.perf_counter() - start)
+
+    if process.wait() != 0 or len(timings) != 2:
+        raise RuntimeError(process.stderr.read().strip().splitlines()[-1])
+    return tuple(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"median of {args.repeat} runs")
+    print(f"{'import':>32} {'time (ms)':>10}")
+    for modules in [["app"], DEFERRED_MODULES]:
+        timings = [time_import(modules) for _ in range(args.repeat)]
+        name = ", ".join(modules)
+        print(f"{name:>32} {statistics.median(timings) * 1000:>10.1f}")
+
+    print(f"{'first frame (ms)':>17} {'logo loaded (ms)':>17}")
+    try:
+        timings = [time_first_frame() for _ in range(args.repeat)]
+    except RuntimeError as e:
+        print(f"failed: {e}")
+        return
+    first_frame, loaded = zip(*timings)
+    print(
+        f"{statistics.median(first_frame) * 1000:>17.1f} "
+        f"{statistics.median(loaded) * 1000:>17.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Measure the throughput of the TCX parser on synthetic TCX files.
+
+- tree: `ElementTree.parse` of the whole document, then the same reading
+  of each trackpoint, the straightforward parser it is compared to.
+- streaming: `parse_tcx`, which reads the file incrementally and removes
+  each trackpoint from the tree once read.
+
+Each case runs in its own interpreter and reports its wall time, its
+throughput in trackpoints per second and its peak RSS. The RSS before the
+parse, once the modules are imported, is reported too.
+
+Usage:
+    python benchmarks/bench_tcx.py [--trackpoints 10000 50000 200000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from memory import peak_rss_mb, run_case
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+METHODS = ["tree", "streaming"]
+
+
+def tree_parse_tcx(path: str) -> dict:
+    """Parse a TCX file in a full tree into the arrays of `parse_tcx`."""
+    import numpy as np
+
+    from datetime import datetime
+    from xml.etree import ElementTree
+    from utils.tcx_utils import (
+        TCX_NAMESPACE,
+        TRACKPOINT_ARRAYS,
+        TRACKPOINT_FIELDS,
+    )
+
+    tree = ElementTree.parse(path)
+    columns = {name: [] for name in TRACKPOINT_ARRAYS}
+    for trackpoint in tree.iter(f"{TCX_NAMESPACE}Trackpoint"):
+        texts = {}
+        for child in trackpoint.iter():
+            name = TRACKPOINT_FIELDS.get(child.tag)
+            if name is not None and child.text:
+                texts[name] = child.text
+        for name, values in columns.items():
+            text = texts.get(name)
+            if text is None:
+                values.append(np.nan)
+            elif name == "time":
+                values.append(datetime.fromisoformat(text).timestamp())
+            else:
+                values.append(float(text))
+
+    return {
+        name: np.array(columns[name], dtype=typecode)
+        for name, typecode in TRACKPOINT_ARRAYS.items()
+    }
+
+
+def run(method: str, path: str) -> dict:
+    from utils.tcx_utils import parse_tcx
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    if method == "tree":
+        arrays = tree_parse_tcx(path)
+    else:
+        arrays = parse_tcx(path)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "seconds": elapsed,
+        "trackpoints_per_second": len(arrays["time"]) / elapsed,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--trackpoints", type=int, nargs="+", default=[10000, 50000, 200000]
+    )
+    parser.add_argument("--case", nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument("--write", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run(*args.case)))
+        return
+    if args.write:
+        from synthetic import make_tcx
+
+        trackpoints, path = args.write
+        with open(path, "wb") as file:
+            file.write(make_tcx(0, int(trackpoints)))
+        return
+
+    print(f"{'points':>8} {'method':>10} {'time (s)':>9} {'points/s':>9} "
+          f"{'RSS before (MB)':>16} {'peak RSS (MB)':>14}")
+    for trackpoints in args.trackpoints:
+        # The file is written by another interpreter, as the peak RSS of
+        # this one is inherited by the cases on Linux
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "activity.tcx")
+            subprocess.run(
+                [sys.executable, __file__, "--write", str(trackpoints), path],
+                check=True,
+            )
+            results = {
+                method: run_case(__file__, method, path)
+                for method in METHODS
+            }
+
+        for method, result in results.items():
+            print(
+                f"{trackpoints:>8} {method:>10} {result['seconds']:>9.2f} "
+                f"{result['trackpoints_per_second']:>9.0f} "
+                f"{result['rss_before_mb']:>16.1f} "
+                f"{result['peak_rss_mb']:>14.1f}"
+            )
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""Helpers to measure the peak memory of a benchmark case."""
+import sys
+import json
+import resource
+import subprocess
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of the current process, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_case(script: str, *args) -> dict:
+    """
+    Run a benchmark case in a fresh interpreter, so that its peak RSS is not
+    polluted by the other cases, and return the JSON it prints.
+    """
+    output = subprocess.run(
+        [sys.executable, script, "--case", *map(str, args)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
@@ -0,0 +1,247 @@
+"""
+Local stand-in of the Garmin Connect endpoints used by `get_activities`.
+
+The server answers the activities list, evaluation, HR zones and TCX
+download requests with the synthetic payloads of `synthetic.py`, after a
+configurable latency. A share of the requests can be answered with a 429
+status, and the sizes of the activities list payloads and of the TCX files
+are configurable. The number of requests received by endpoint is served as
+JSON on `/stats`.
+
+`make_api` returns a Garmin instance whose requests go to the server, so
+that the whole fetch path, rate limiting included, runs offline.
+
+Usage:
+    python benchmarks/mock_server.py [--activities 1000] [--latency 0.01]
+        [--throttle 0.0] [--unused-keys 80] [--trackpoints 0] [--port 8000]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic import (
+    UNUSED_KEYS,
+    make_activities,
+    make_evaluation,
+    make_hr_zones,
+    make_tcx,
+)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+ACTIVITIES_PATH = "/modern/proxy/activitylist-service/activities/search/"
+ACTIVITY_PATH = "/modern/proxy/activity-service/activity/"
+TCX_PATH = "/modern/proxy/download-service/export/tcx/activity/"
+
+
+class MockGarminServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering the Garmin Connect requests with
+    synthetic payloads. Connections are kept alive, as by Garmin Connect.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        activities: int,
+        latency: float = 0.0,
+        throttle: float = 0.0,
+        unused_keys: int = len(UNUSED_KEYS),
+        trackpoints: int = 0,
+        port: int = 0,
+        seed: int = 0,
+    ) -> None:
+        """
+        Args:
+            activities (int): Number of activities of the account.
+            latency (float, optional): Time taken by each response, in
+                seconds. Defaults to 0.
+            throttle (float, optional): Share of the requests answered with
+                a 429 status. Defaults to 0.
+            unused_keys (int, optional): Number of keys ignored by the
+                application in each activity of the list. Defaults to 80.
+            trackpoints (int, optional): Number of trackpoints of each TCX
+                file. Defaults to 0.
+            port (int, optional): Port to listen on. Defaults to a free one.
+            seed (int, optional): Seed of the throttled requests draw.
+                Defaults to 0.
+        """
+        super().__init__(("127.0.0.1", port), MockGarminHandler)
+        self.activities = make_activities(activities, unused_keys=unused_keys)
+        self.activity_ids = {a["activityId"] for a in self.activities}
+        self.latency = latency
+        self.throttle = throttle
+        self.trackpoints = trackpoints
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.throttled = 0
+        self.bytes_sent = 0
+
+    @property
+    def url(self) -> str:
+        """Base URL of the Garmin Connect API of the server."""
+        return f"http://127.0.0.1:{self.server_address[1]}/modern"
+
+    def stats(self) -> dict:
+        """Return the number of requests by endpoint and of 429 answers."""
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "throttled": self.throttled,
+                "bytes_sent": self.bytes_sent,
+            }
+
+    def record(self, endpoint: str) -> bool:
+        """Count a request, and return whether it is throttled."""
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            throttled = self._rng.random() < self.throttle
+            self.throttled += throttled
+        return throttled
+
+    def list_activities(self, query: dict) -> list:
+        """Return a page of the activities list, newest first."""
+        startdate = query["startDate"][0]
+        enddate = query["endDate"][0]
+        start = int(query.get("start", ["0"])[0])
+        limit = int(query.get("limit", ["20"])[0])
+        activities = [
+            activity
+            for activity in self.activities
+            if startdate <= activity["startTimeLocal"][:10] <= enddate
+        ]
+        return activities[start:start + limit]
+
+    def serve_in_thread(self) -> "MockGarminServer":
+        """Serve the requests in a daemon thread and return the server."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class MockGarminHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, which Nagle's algorithm would
+    # delay on kept alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_payload(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server._lock:
+            self.server.bytes_sent += len(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        path = url.path
+
+        if path == "/stats":
+            body = json.dumps(server.stats()).encode()
+            return self.send_payload(200, body, "application/json")
+
+        if path.startswith(ACTIVITIES_PATH):
+            endpoint = "activities"
+        elif path.startswith(TCX_PATH):
+            endpoint = "tcx"
+        elif path.startswith(ACTIVITY_PATH) and path.endswith("InZones"):
+            endpoint = "hr_zones"
+        elif path.startswith(ACTIVITY_PATH):
+            endpoint = "evaluation"
+        else:
+            return self.send_payload(404, b"", "text/plain")
+
+        time.sleep(server.latency)
+        if server.record(endpoint):
+            return self.send_payload(429, b"", "text/plain")
+
+        if endpoint == "activities":
+            payload = server.list_activities(parse_qs(url.query))
+            body = json.dumps(payload).encode()
+            return self.send_payload(200, body, "application/json")
+
+        activity_id = int(path.rstrip("/").split("/")[
+            -2 if endpoint == "hr_zones" else -1
+        ])
+        if activity_id not in server.activity_ids:
+            return self.send_payload(404, b"", "text/plain")
+
+        if endpoint == "tcx":
+            body = make_tcx(activity_id, server.trackpoints)
+            return self.send_payload(200, body, "application/xml")
+        if endpoint == "hr_zones":
+            payload = make_hr_zones(activity_id)
+        else:
+            payload = make_evaluation(activity_id)
+        body = json.dumps(payload).encode()
+        return self.send_payload(200, body, "application/json")
+
+
+def make_api(url: str, rate: float = 1000.0):
+    """
+    Return a governed Garmin instance whose requests go to a mock server,
+    as returned by `init_api` for a real account.
+
+    Args:
+        url (str): The `url` of the server.
+        rate (float, optional): Initial and highest rate of the requests,
+            per second. Defaults to 1000.
+
+    Returns:
+        GovernedGarmin: The Garmin instance.
+    """
+    from garminconnect import Garmin
+    from utils.rate_utils import GovernedGarmin, RequestGovernor
+
+    garmin = Garmin("athlete@example.com", "password")
+    client = garmin.modern_rest_client
+    client.url = lambda addurl=None: f"{url}/{addurl}" if addurl else url
+    client.session.cookies.set("SESSIONID", "mock")
+    return GovernedGarmin(
+        garmin, RequestGovernor(rate=rate, max_rate=max(rate, 20.0))
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--activities", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--throttle", type=float, default=0.0)
+    parser.add_argument("--unused-keys", type=int, default=len(UNUSED_KEYS))
+    parser.add_argument("--trackpoints", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    server = MockGarminServer(
+        args.activities,
+        latency=args.latency,
+        throttle=args.throttle,
+        unused_keys=args.unused_keys,
+        trackpoints=args.trackpoints,
+        port=args.port,
+    )
+    # The first line tells the benchmarks where the server listens
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Synthetic Garmin Connect payloads used by the benchmarks.
+
+The payloads follow the keys read by the application: the activities list
+keys of ACTIVITY_DATA_MAPPING, the evaluation `summaryDTO` and the HR zones.
+"""
+import os
+import sys
+import random
+import logging
+
+import pandas as pd
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from garminconnect import Garmin
+
+from utils.api_utils import get_activities
+from utils.constants import ACTIVITY_DATA_MAPPING
+
+# Missing evaluation fields are logged for every activity
+logging.getLogger().setLevel(logging.WARNING)
+
+TRAINING_EFFECT_LABELS = [
+    "RECOVERY",
+    "TEMPO",
+    "AEROBIC_BASE",
+    "LACTATE_THRESHOLD",
+    "UNKNOWN",
+    "VO2MAX",
+]
+
+# Keys of the real activities list payload that the application ignores
+UNUSED_KEYS = [f"unusedKey{i}" for i in range(80)]
+
+
+def make_activity(
+    activity_id: int, start: datetime, unused_keys: int = len(UNUSED_KEYS)
+) -> dict:
+    """
+    Return a synthetic activity of the activities list, with `unused_keys`
+    keys ignored by the application to reach the size of a real payload.
+    """
+    rng = random.Random(activity_id)
+    activity = {
+        f"unusedKey{i}": round(rng.uniform(0, 200), 2)
+        for i in range(unused_keys)
+    }
+    activity.update(
+        {key: round(rng.uniform(0, 200), 2) for key in ACTIVITY_DATA_MAPPING}
+    )
+    activity.update(
+        {
+            "activityId": activity_id,
+            "deviceId": 3_000_000_000 + rng.randrange(100),
+            "startTimeLocal": start.strftime("%Y-%m-%d %H:%M:%S"),
+            "activityName": f"Activité {activity_id}",
+            "favorite": rng.random() < 0.1,
+            "pr": rng.random() < 0.05,
+            "trainingEffectLabel": rng.choice(TRAINING_EFFECT_LABELS),
+            "summarizedExerciseSets": None,
+        }
+    )
+    return activity
+
+
+def make_activities(
+    n: int, start: str = "2015-01-01", unused_keys: int = len(UNUSED_KEYS)
+) -> list:
+    """Return `n` synthetic activities, one every 8 hours, newest first."""
+    first = datetime.strptime(start, "%Y-%m-%d")
+    activities = [
+        make_activity(
+            10_000_000_000 + i, first + timedelta(hours=8 * i), unused_keys
+        )
+        for i in range(n)
+    ]
+    return activities[::-1]
+
+
+def make_evaluation(activity_id: int) -> dict:
+    """Return a synthetic activity evaluation."""
+    rng = random.Random(activity_id)
+    summary_dto = {"averageMovingSpeed": round(rng.uniform(1, 12), 3)}
+    if rng.random() < 0.8:
+        summary_dto["directWorkoutFeel"] = rng.choice([0, 25, 50, 75, 100])
+        summary_dto["directWorkoutRpe"] = rng.randrange(1, 11) * 10
+    return {"activityId": activity_id, "summaryDTO": summary_dto}
+
+
+def make_hr_zones(activity_id: int) -> list:
+    """Return synthetic HR zones of an activity."""
+    rng = random.Random(activity_id)
+    return [
+        {
+            "zoneNumber": zone,
+            "secsInZone": round(rng.uniform(0, 1800), 1),
+            "zoneLowBoundary": 90 + 20 * zone,
+        }
+        for zone in range(1, 6)
+    ]
+
+
+def make_tcx(activity_id: int, trackpoints: int) -> bytes:
+    """
+    Return a synthetic TCX file of an activity, with one trackpoint per
+    second holding the fields exported by Garmin Connect.
+    """
+    rng = random.Random(activity_id)
+    start = datetime(2023, 1, 1) + timedelta(days=activity_id % 365)
+    lat, lon, altitude, distance = (48.85, 2.35, 35.0, 0.0)
+
+    points = []
+    for i in range(trackpoints):
+        lat += rng.uniform(-1e-5, 1e-5)
+        lon += rng.uniform(-1e-5, 1e-5)
+        altitude += rng.uniform(-0.2, 0.2)
+        distance += rng.uniform(2, 4)
+        time = (start + timedelta(seconds=i)).strftime("%Y-%m-%dT%H:%M:%S")
+        points.append(
+            "<Trackpoint>"
+            f"<Time>{time}.000Z</Time>"
+            "<Position>"
+            f"<LatitudeDegrees>{lat:.7f}</LatitudeDegrees>"
+            f"<LongitudeDegrees>{lon:.7f}</LongitudeDegrees>"
+            "</Position>"
+            f"<AltitudeMeters>{altitude:.1f}</AltitudeMeters>"
+            f"<DistanceMeters>{distance:.1f}</DistanceMeters>"
+            "<HeartRateBpm>"
+            f"<Value>{rng.randint(100, 180)}</Value>"
+            "</HeartRateBpm>"
+            f"<Cadence>{rng.randint(70, 100)}</Cadence>"
+            "<Extensions><ns3:TPX>"
+            f"<ns3:Speed>{rng.uniform(2, 4):.3f}</ns3:Speed>"
+            f"<ns3:Watts>{rng.randint(100, 300)}</ns3:Watts>"
+            "</ns3:TPX></Extensions>"
+            "</Trackpoint>\n"
+        )
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        "<TrainingCenterDatabase "
+        'xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2" '
+        'xmlns:ns3="http://www.garmin.com/xmlschemas/ActivityExtension/v2">'
+        '<Activities><Activity Sport="Biking">'
+        f"<Id>{start.strftime('%Y-%m-%dT%H:%M:%S')}.000Z</Id>"
+        f'<Lap StartTime="{start.strftime("%Y-%m-%dT%H:%M:%S")}.000Z">'
+        f"<TotalTimeSeconds>{trackpoints}.0</TotalTimeSeconds>"
+        f"<DistanceMeters>{distance:.1f}</DistanceMeters>"
+        "<AverageHeartRateBpm><Value>140</Value></AverageHeartRateBpm>"
+        "<Track>\n"
+        + "".join(points)
+        + "</Track></Lap></Activity></Activities></TrainingCenterDatabase>"
+    ).encode()
+
+
+class SyntheticGarmin:
+    """In-memory stand-in of the Garmin endpoints used by get_activities."""
+
+    ActivityDownloadFormat = Garmin.ActivityDownloadFormat
+
+    def __init__(self, n: int) -> None:
+        self.activities = make_activities(n)
+
+    def get_activities_by_date(self, startdate, enddate, activitytype=None):
+        return [
+            activity
+            for activity in self.activities
+            if startdate <= activity["startTimeLocal"][:10] <= enddate
+        ]
+
+    def get_activity_evaluation(self, activity_id):
+        return make_evaluation(activity_id)
+
+    def get_activity_hr_in_timezones(self, activity_id):
+        return make_hr_zones(activity_id)
+
+    def download_activity(self, activity_id, dl_fmt=None):
+        return b""
+
+
+def make_activities_data(n: int) -> pd.DataFrame:
+    """
+    Return a processed activities frame of `n` rows, as exported.
+
+    At most 1000 activities go through `get_activities`, the frame is then
+    repeated to reach `n` rows.
+    """
+    sample = min(n, 1000)
+    data, _ = get_activities(
+        SyntheticGarmin(sample), "2000-01-01", "2100-01-01"
+    )
+    repeats = -(-n // sample)
+    return pd.concat([data] * repeats, ignore_index=True).iloc[:n]
+
+
+def make_raw_activities_data(n: int) -> pd.DataFrame:
+    """
+    Return the activities frame of `n` rows built by `get_activities` before
+    `process_activities_data`, with the evaluation and HR zones columns.
+    """
+    sample = min(n, 1000)
+    with patch("utils.api_utils.process_activities_data", lambda data: data):
+        data, _ = get_activities(
+            SyntheticGarmin(sample), "2000-01-01", "2100-01-01"
+        )
+    repeats = -(-n // sample)
+    return pd.concat([data] * repeats, ignore_index=True).iloc[:n]
@@ -7,8 +7,18 @@ from datetime import datetime
 from PIL import Image, ImageTk
 
 from utils.base_utils import load_settings
-from utils.constants import ACTIVITY_TYPES_MAPPING
-from utils.app_utils import submit, update_days_combobox
+from utils.constants import (
+    ACTIVITY_TYPES_MAPPING,
+    DOWNLOAD_MODES,
+    OUTPUT_FORMATS,
+    TCX_OPTIONS,
+)
+from utils.app_utils import (
+    open_columns_picker,
+    submit,
+    update_days_combobox,
+    update_end_date_state,
+)
 
 from customtkinter import (
     CTkButton,
@@ -24,6 +34,46 @@ from customtkinter import (
 customtkinter.set_appearance_mode("dark")
 
 
+def load_assets(
+    root: CTk, image_label: CTkLabel, bundle_dir: str
+) -> CTkImage:
+    """
+    Set the icon of the window and display the Garmin logo.
+
+    The images are only opened here: PIL decodes them when they are first
+    displayed, so the logo of the unused appearance mode is never decoded.
+
+    Args:
+        root (CTk): The main customtkinter window.
+        image_label (CTkLabel): The label displaying the logo.
+        bundle_dir (str): The folder containing the 'assets' folder.
+
+    Returns:
+        CTkImage: The Garmin logo.
+    """
+    icon_path_ico = os.path.join(bundle_dir, "assets", "garmin-download.ico")
+    icon_path_png = os.path.join(bundle_dir, "assets", "garmin-download.png")
+
+    if os.name == "nt":
+        root.iconbitmap(icon_path_ico)
+    else:
+        iconpil = ImageTk.PhotoImage(Image.open(icon_path_png))
+        root.iconphoto(False, iconpil)
+
+    img_light_path = os.path.join(bundle_dir, "assets", "garmin_lightmode.png")
+    img_dark_path = os.path.join(bundle_dir, "assets", "garmin_darkmode.png")
+
+    # Both logos are scaled to the displayed size by CTkImage
+    garmin_logo = CTkImage(
+        light_image=Image.open(img_light_path),
+        dark_image=Image.open(img_dark_path),
+        size=(200, 60),
+    )
+    image_label.configure(image=garmin_logo)
+
+    return garmin_logo
+
+
 def create_main_window() -> None:
     """
     Create the main window for the Garmin activities download application.
@@ -45,37 +95,17 @@ def create_main_window() -> None:
     root.title("Téléchargement d'activités Garmin Connect")
     root.resizable(False, False)
 
-    icon_path_ico = os.path.join(bundle_dir, "assets", "garmin-download.ico")
-    icon_path_png = os.path.join(bundle_dir, "assets", "garmin-download.png")
-
-    if os.name == "nt":
-        root.iconbitmap(icon_path_ico)
-    else:
-        iconpil = ImageTk.PhotoImage(Image.open(icon_path_png))
-        root.iconphoto(False, iconpil)
-
     # Configure column weights
     root.grid_columnconfigure(0, weight=1)  # left padding column
     root.grid_columnconfigure(1, weight=2)  # main content column
     root.grid_columnconfigure(2, weight=1)  # right padding column
 
     # Configure row weights
-    for i in range(1, 15):
+    for i in range(1, 18):
         root.grid_rowconfigure(i, weight=1)
 
-    img_light_path = os.path.join(bundle_dir, "assets", "garmin_lightmode.png")
-    img_dark_path = os.path.join(bundle_dir, "assets", "garmin_darkmode.png")
-
-    img_light = Image.open(img_light_path)
-    img_dark = Image.open(img_dark_path).resize(img_light.size)
-
-    garmin_logo = CTkImage(
-        light_image=img_light,
-        dark_image=img_dark,
-        size=(200, 60),
-    )
-
-    image_label = CTkLabel(root, image=garmin_logo, text="")
+    # The logo is loaded once the window is displayed, its height is kept
+    image_label = CTkLabel(root, text="", height=60)
     image_label.grid(sticky="ew", row=0, column=0, columnspan=3, pady=(20, 20))
 
     error_message = CTkLabel(root, text="", text_color="red")
@@ -84,7 +114,7 @@ def create_main_window() -> None:
     email_label.grid(sticky="ew", row=2, column=0, columnspan=3, pady=(10, 0))
 
     email_entry = CTkEntry(root)
-    email, saved_start_date, saved_activity_type = load_settings()
+    email, saved_start_date, saved_activity_type, saved_mode = load_settings()
 
     if email:
         email_entry.insert(0, email)
@@ -232,7 +262,7 @@ def create_main_window() -> None:
         font=("SF Display", 10.5),
     )
 
-    switch_tcx = CTkSegmentedButton(root, values=["Oui", "Non"])
+    switch_tcx = CTkSegmentedButton(root, values=list(TCX_OPTIONS))
     switch_tcx.set("Non")
     switch_tcx_label.grid(
         row=12, column=0, columnspan=2, sticky="ew", pady=(12, 0), padx=(60, 0)
@@ -241,13 +271,74 @@ def create_main_window() -> None:
         row=12, column=2, columnspan=2, sticky="ew", pady=(12, 0), padx=(0, 60)
     )
 
+    switch_mode_label = CTkLabel(
+        root,
+        text="Mode de téléchargement : ",
+        justify="left",
+        anchor="w",
+        font=("SF Display", 10.5),
+    )
+
+    switch_mode = CTkSegmentedButton(
+        root,
+        values=DOWNLOAD_MODES,
+        command=lambda mode: update_end_date_state(
+            mode, [end_day, end_month, end_year]
+        ),
+    )
+    switch_mode.set(
+        saved_mode if saved_mode in DOWNLOAD_MODES else DOWNLOAD_MODES[0]
+    )
+    update_end_date_state(switch_mode.get(), [end_day, end_month, end_year])
+    switch_mode_label.grid(
+        row=13, column=0, columnspan=2, sticky="ew", pady=(12, 0), padx=(60, 0)
+    )
+    switch_mode.grid(
+        row=13, column=2, columnspan=2, sticky="ew", pady=(12, 0), padx=(0, 60)
+    )
+
+    output_format_label = CTkLabel(
+        root,
+        text="Format du fichier : ",
+        justify="left",
+        anchor="w",
+        font=("SF Display", 10.5),
+    )
+
+    output_format = CTkSegmentedButton(root, values=OUTPUT_FORMATS)
+    output_format.set(OUTPUT_FORMATS[0])
+    output_format_label.grid(
+        row=14, column=0, columnspan=2, sticky="ew", pady=(12, 0), padx=(60, 0)
+    )
+    output_format.grid(
+        row=14, column=2, columnspan=2, sticky="ew", pady=(12, 0), padx=(0, 60)
+    )
+
+    columns_label = CTkLabel(
+        root,
+        text="Colonnes exportées : ",
+        justify="left",
+        anchor="w",
+        font=("SF Display", 10.5),
+    )
+
+    columns_button = CTkButton(
+        root, text="Choisir ...", command=lambda: open_columns_picker(root)
+    )
+    columns_label.grid(
+        row=15, column=0, columnspan=2, sticky="ew", pady=(12, 0), padx=(60, 0)
+    )
+    columns_button.grid(
+        row=15, column=2, columnspan=2, sticky="ew", pady=(12, 0), padx=(0, 60)
+    )
+
     submit_button = CTkButton(
         root,
         text="Télécharger les activités ↓",
     )
     submit_button.grid(
         sticky="ew",
-        row=13,
+        row=16,
         column=0,
         columnspan=3,
         pady=(20, 60),
@@ -255,6 +346,8 @@ def create_main_window() -> None:
         padx=60,
     )
 
+    cancel_button = CTkButton(root, text="Annuler")
+
     progress_text = CTkLabel(root, text="")
 
     progress = CTkProgressBar(
@@ -269,6 +362,9 @@ def create_main_window() -> None:
     widgets = {
         "activity_type_combobox": activity_type_combobox,
         "activity_type_label": activity_type_label,
+        "cancel_button": cancel_button,
+        "columns_button": columns_button,
+        "columns_label": columns_label,
         "email_entry": email_entry,
         "email_label": email_label,
         "end_day": end_day,
@@ -276,8 +372,9 @@ def create_main_window() -> None:
         "end_year": end_year,
         "enddate_label": enddate_label,
         "error_message": error_message,
-        "garmin_logo": garmin_logo,
         "image_label": image_label,
+        "output_format": output_format,
+        "output_format_label": output_format_label,
         "password_entry": password_entry,
         "password_label": password_label,
         "progress": progress,
@@ -288,12 +385,19 @@ def create_main_window() -> None:
         "startdate_label": startdate_label,
         "switch_tcx": switch_tcx,
         "switch_tcx_label": switch_tcx_label,
+        "switch_mode": switch_mode,
+        "switch_mode_label": switch_mode_label,
         "submit_button": submit_button,
     }
 
     submit_with_args = partial(submit, root, widgets)
     submit_button.configure(command=submit_with_args)
 
+    # Draw the window before decoding the images, the largest assets
+    root.update()
+
+    widgets["garmin_logo"] = load_assets(root, image_label, bundle_dir)
+
     root.mainloop()
 
 
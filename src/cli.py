@@ -0,0 +1,474 @@
+import os
+import sys
+import asyncio
+import getpass
+import logging
+import argparse
+import importlib.util
+
+from typing import Callable, Optional
+from datetime import date, datetime
+from garminconnect import (
+    GarminConnectAuthenticationError,
+    GarminConnectTooManyRequestsError,
+)
+
+from utils.api_utils import init_api, get_activities
+from utils.base_utils import get_store_path, save_activities
+from utils.base_utils import get_report_path, get_job_key, load_columns
+from utils.metrics_utils import RunMetrics, record_run
+from utils.store_utils import ActivityStore
+from utils.tcx_utils import get_tcx_output_path
+from utils.constants import (
+    ACTIVITY_TYPES_MAPPING,
+    COLUMNS_FILENAME,
+    DATA_DIR,
+    OUTPUT_FORMATS,
+    MAX_ACCOUNTS,
+    MAX_WORKERS,
+    PAYLOADS_SETTLE_DAYS,
+    REPORTS_DIR,
+    TCX_FORMATS,
+)
+
+
+def parse_date(value: str) -> str:
+    """
+    Check that a command line date is in the 'YYYY-MM-DD' format.
+
+    Args:
+        value (str): The date given on the command line.
+
+    Returns:
+        str: The date, unchanged.
+
+    Raises:
+        argparse.ArgumentTypeError: If the date is not valid.
+    """
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid date '{value}', expected YYYY-MM-DD"
+        )
+    return value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the parser of the command line arguments.
+
+    Returns:
+        argparse.ArgumentParser: The arguments parser.
+    """
+    activity_types = [t for t in ACTIVITY_TYPES_MAPPING.values() if t]
+
+    parser = argparse.ArgumentParser(
+        description=(
+            "Download Garmin Connect activities without the graphical "
+            "interface. The password is read from the GARMIN_PASSWORD "
+            "environment variable, or prompted for when it is not set."
+        )
+    )
+    parser.add_argument(
+        "--email",
+        default=os.environ.get("GARMIN_EMAIL"),
+        help="Garmin Connect email, defaults to $GARMIN_EMAIL.",
+    )
+    parser.add_argument(
+        "--accounts",
+        metavar="CSV",
+        help=(
+            "Export several accounts instead of --email: a CSV file with an "
+            "'email' column and optional 'password' and 'athlete' columns."
+        ),
+    )
+    parser.add_argument(
+        "--start",
+        type=parse_date,
+        required=True,
+        help="First day of the export, YYYY-MM-DD.",
+    )
+    parser.add_argument(
+        "--end",
+        type=parse_date,
+        default=date.today().strftime("%Y-%m-%d"),
+        help="Last day of the export, YYYY-MM-DD. Defaults to today.",
+    )
+    parser.add_argument(
+        "--activity-type",
+        choices=activity_types,
+        default="",
+        help="Type of the exported activities. Defaults to all types.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default=OUTPUT_FORMATS[0],
+        help=f"Output format. Defaults to {OUTPUT_FORMATS[0]}.",
+    )
+    parser.add_argument(
+        "--tcx",
+        action="store_true",
+        help="Download the TCX file of each activity as well.",
+    )
+    parser.add_argument(
+        "--tcx-format",
+        choices=TCX_FORMATS,
+        default=TCX_FORMATS[0],
+        help=(
+            "How the TCX files are written: plain files, gzip compressed "
+            f"files or a single zip archive. Defaults to {TCX_FORMATS[0]}."
+        ),
+    )
+    parser.add_argument(
+        "--local-hr-zones",
+        action="store_true",
+        help=(
+            "Compute the time in HR zones from the TCX files instead of "
+            "downloading it, requires --tcx."
+        ),
+    )
+    parser.add_argument(
+        "--async-client",
+        action="store_true",
+        help=(
+            "Download with the asyncio client, which makes up to "
+            "--workers requests at once on pooled connections. "
+            "Requires aiohttp."
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help=(
+            "Number of activities downloaded concurrently. "
+            f"Defaults to {MAX_WORKERS}."
+        ),
+    )
+    parser.add_argument(
+        "--max-accounts",
+        type=int,
+        default=MAX_ACCOUNTS,
+        help=(
+            "Number of accounts exported concurrently with --accounts. "
+            f"Defaults to {MAX_ACCOUNTS}."
+        ),
+    )
+    parser.add_argument(
+        "--settle-days",
+        type=float,
+        default=PAYLOADS_SETTLE_DAYS,
+        help=(
+            "The feel, perceived effort and HR zones of an activity are "
+            "downloaded again until they were downloaded this many days "
+            "after the activity, since they can still be edited in Garmin "
+            f"Connect. Defaults to {PAYLOADS_SETTLE_DAYS}."
+        ),
+    )
+    parser.add_argument(
+        "--all-columns",
+        action="store_true",
+        help=(
+            "Export all the columns, instead of those selected in the "
+            f"graphical interface and saved to ~/{DATA_DIR}/"
+            f"{COLUMNS_FILENAME}."
+        ),
+    )
+    parser.add_argument(
+        "--report",
+        metavar="PATH",
+        help=(
+            "Path of the JSON metrics report of the run: latency histograms, "
+            "calls, retries and bytes by endpoint, and duration of each "
+            "step. Defaults to a timestamped file of ~/"
+            f"{DATA_DIR}/{REPORTS_DIR}."
+        ),
+    )
+    parser.add_argument(
+        "--prometheus",
+        action="store_true",
+        help=(
+            "Write the metrics in the Prometheus text format as well, next "
+            "to the report, with the .prom extension."
+        ),
+    )
+    return parser
+
+
+def progress_logger(prefix: str = "") -> Callable[[str, int, int], None]:
+    """
+    Return a progress callback for `get_activities` logging the status
+    messages and the first progress report of each tenth of the download,
+    to keep the logs of scheduled runs short.
+
+    Args:
+        prefix (str, optional): Prefix of the logged messages. Defaults to
+            an empty string.
+
+    Returns:
+        Callable: The progress callback.
+    """
+    logged_tenth = -1
+
+    def log_progress(message: str, done: int, total: int) -> None:
+        nonlocal logged_tenth
+        # Progress reports are rate limited, a tenth may start at any count
+        if total and done != total:
+            tenth = done * 10 // total
+            if tenth == logged_tenth:
+                return
+            logged_tenth = tenth
+        logging.info(prefix + message)
+
+    return log_progress
+
+
+def get_columns(args: argparse.Namespace) -> Optional[list]:
+    """
+    Return the exported columns: those selected in the graphical interface,
+    unless `--all-columns` is given.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        list or None: The selected columns, or None for all the columns.
+    """
+    if args.all_columns:
+        return None
+    columns = load_columns()
+    if columns is not None:
+        logging.info(f"Exporting the {len(columns)} selected columns")
+    return columns
+
+
+def write_report(metrics: RunMetrics, args: argparse.Namespace) -> None:
+    """
+    Write the metrics report of a run, to `--report` or to the reports
+    folder of the application data folder.
+
+    Args:
+        metrics (RunMetrics): The metrics of the run.
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+    try:
+        path = metrics.write_report(
+            args.report or get_report_path(), prometheus=args.prometheus
+        )
+    except OSError as e:
+        logging.warning(f"Cannot write the metrics report: {e}")
+        return
+    logging.info(f"Metrics report saved to {path}")
+
+
+def export_accounts(args: argparse.Namespace) -> int:
+    """
+    Run a batch export of the accounts listed in the `--accounts` file.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: The exit status, 0 if every account was exported.
+    """
+    from utils.batch_utils import load_accounts, run_batch
+
+    try:
+        accounts = load_accounts(args.accounts)
+    except (OSError, ValueError) as e:
+        logging.error(f"Cannot read the accounts: {e}")
+        return 1
+
+    loggers = {}
+    store = None
+    try:
+        store = ActivityStore(get_store_path(), args.settle_days)
+        dump_paths, errors, combined_path = run_batch(
+            accounts,
+            store,
+            startdate=args.start,
+            enddate=args.end,
+            activity_type=args.activity_type,
+            output_format=args.format,
+            include_tcx=args.tcx,
+            tcx_format=args.tcx_format,
+            local_hr_zones=args.local_hr_zones,
+            max_accounts=args.max_accounts,
+            max_workers=args.workers,
+            columns=get_columns(args),
+            progress_callback=lambda athlete, message, done, total: (
+                loggers.setdefault(athlete, progress_logger(f"{athlete}: "))(
+                    message, done, total
+                )
+            ),
+        )
+    except KeyboardInterrupt:
+        logging.error("Export interrupted")
+        return 130
+    finally:
+        if store:
+            store.close()
+
+    for athlete, dump_path in dump_paths.items():
+        logging.info(f"Activities of {athlete} saved to {dump_path}")
+    if combined_path:
+        logging.info(f"Activities of all athletes saved to {combined_path}")
+    if errors:
+        logging.error(f"{len(errors)}/{len(accounts)} accounts failed")
+        return 1
+
+    return 0
+
+
+def export_activities(args: argparse.Namespace, password: str) -> int:
+    """
+    Run the export of the account given by `--email`.
+
+    The export is recorded in the activities store until it is saved, so
+    that running the same command again after an interruption resumes it.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+        password (str): The password of the account.
+
+    Returns:
+        int: The exit status, 0 on success.
+    """
+    store = None
+    try:
+        store = ActivityStore(get_store_path(), args.settle_days)
+        params = dict(
+            startdate=args.start,
+            enddate=args.end,
+            activity_type=args.activity_type,
+            output_format=args.format,
+            include_tcx=args.tcx,
+            tcx_format=args.tcx_format,
+            local_hr_zones=args.local_hr_zones,
+            columns=get_columns(args),
+        )
+        job_key = get_job_key(args.email, params)
+        jobs = dict(store.get_jobs(args.email))
+        if job_key in jobs:
+            logging.info("Resuming the interrupted export")
+        elif jobs:
+            logging.info(
+                f"{len(jobs)} interrupted export(s) of this account can be "
+                "resumed by running them again with the same options"
+            )
+
+        api = init_api(email=args.email, password=password)
+        # Only jobs that logged in can be resumed
+        store.save_job(job_key, args.email, params)
+
+        options = dict(
+            api=api,
+            startdate=args.start,
+            enddate=args.end,
+            activitytype=args.activity_type,
+            include_tcx=args.tcx,
+            tcx_format=args.tcx_format,
+            local_hr_zones=args.local_hr_zones,
+            progress_callback=progress_logger(),
+            store=store,
+            job_key=job_key,
+            columns=params["columns"],
+        )
+        if args.async_client:
+            from utils.async_utils import get_activities_async
+
+            activities_data, tcx_paths = asyncio.run(
+                get_activities_async(max_concurrency=args.workers, **options)
+            )
+        else:
+            activities_data, tcx_paths = get_activities(
+                max_workers=args.workers, **options
+            )
+
+        dump_path = save_activities(
+            activities_data, args.format, args.start, args.end
+        )
+        logging.info(f"Activities saved to {dump_path}")
+        store.delete_job(job_key)
+
+        if args.tcx:
+            dump_path_tcx = get_tcx_output_path(args.tcx_format)
+            logging.info(
+                f"{len(tcx_paths)} TCX files saved to {dump_path_tcx}"
+            )
+    except GarminConnectAuthenticationError:
+        logging.error("Login failed, check the email and password")
+        return 1
+    except GarminConnectTooManyRequestsError:
+        logging.error("Too many requests, try again later")
+        return 1
+    except KeyboardInterrupt:
+        logging.error("Export interrupted")
+        return 130
+    except Exception as e:
+        logging.exception(f"Unexpected error: {e}")
+        return 1
+    finally:
+        if store:
+            store.close()
+
+    return 0
+
+
+def main(argv: list = None) -> int:
+    """
+    Run an export from the command line.
+
+    Args:
+        argv (list, optional): The command line arguments. Defaults to the
+            arguments of the process.
+
+    Returns:
+        int: The exit status, 0 on success.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.start > args.end:
+        parser.error("--start must not be after --end")
+    if args.local_hr_zones and not args.tcx:
+        parser.error("--local-hr-zones requires --tcx")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if args.async_client and importlib.util.find_spec("aiohttp") is None:
+        parser.error("--async-client requires aiohttp: pip install aiohttp")
+
+    if args.accounts:
+        if args.async_client:
+            parser.error("--async-client is not supported with --accounts")
+        if args.tcx and args.tcx_format == "zip":
+            parser.error("--tcx-format zip is not supported with --accounts")
+        if args.max_accounts < 1:
+            parser.error("--max-accounts must be at least 1")
+        metrics = RunMetrics()
+        with record_run(metrics):
+            status = export_accounts(args)
+        write_report(metrics, args)
+        return status
+
+    if not args.email or "@" not in args.email:
+        parser.error("a valid email is required, use --email or GARMIN_EMAIL")
+
+    password = os.environ.get("GARMIN_PASSWORD")
+    if not password:
+        if not sys.stdin.isatty():
+            parser.error("GARMIN_PASSWORD is required when not interactive")
+        password = getpass.getpass("Garmin Connect password: ")
+
+    metrics = RunMetrics()
+    with record_run(metrics):
+        status = export_activities(args, password)
+    write_report(metrics, args)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
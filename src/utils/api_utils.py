@@ -1,14 +1,36 @@
+import queue
 import logging
+import threading
+import numpy as np
 import pandas as pd
 
-from io import BytesIO
+from typing import Callable, Optional, Union
+from functools import partial
+from datetime import datetime, timedelta
 from itertools import zip_longest
-from garminconnect import Garmin
+from concurrent.futures import ThreadPoolExecutor
+from garminconnect import Garmin, GarminConnectTooManyRequestsError
 
+from .base_utils import load_session, save_session
+from .tcx_utils import TcxArchive, TcxFolder, LocalHrZones, open_tcx_writer
 from .data_utils import process_activities_data
-from .constants import ACTIVITY_DATA_MAPPING, AMS_ERROR, DWF_ERROR, DWR_ERROR
-
-from customtkinter import CTk, CTkProgressBar, CTkLabel
+from .store_utils import ActivityStore
+from .rate_utils import RequestGovernor, GovernedGarmin
+from .metrics_utils import timed, active_metrics
+from .progress_utils import ProgressReporter
+from .constants import (
+    ACTIVITIES_CAPACITY,
+    ACTIVITY_DATA_MAPPING,
+    AMS_ERROR,
+    DWF_ERROR,
+    DWR_ERROR,
+    EVALUATION_COLUMNS,
+    HR_ZONE_COLUMN,
+    HR_ZONES_COLUMNS,
+    MAX_WORKERS,
+    REQUIRED_COLUMNS,
+    TCX_FORMATS,
+)
 
 
 logging.basicConfig(
@@ -18,87 +40,319 @@ logging.basicConfig(
 )
 
 
-def init_api(email: str, password: str) -> Garmin:
+@timed("login")
+def init_api(
+    email: str, password: str, governor: Optional[RequestGovernor] = None
+) -> Garmin:
     """
     Initialize and log in to the Garmin API with the provided credentials.
 
+    The session saved by a previous run for this email is tried first, a
+    full login is only done if it is missing or rejected. The session of a
+    full login is saved for the next runs.
+
+    All the calls made through the returned instance, login included, are
+    rate limited and retried by a RequestGovernor.
+
     Args:
         email (str): The email address associated with the Garmin account.
         password (str): The password associated with the Garmin account.
+        governor (RequestGovernor, optional): Governor of the API calls, to
+            share a rate limit between several API instances. Defaults to a
+            new governor.
 
     Returns:
         Garmin: An authenticated Garmin API instance.
     """
+    if governor is None:
+        governor = RequestGovernor()
+
+    session_data = load_session(email)
+    if session_data:
+        api = GovernedGarmin(
+            Garmin(email, password, session_data=session_data), governor
+        )
+        try:
+            if api.login():
+                save_session(email, api.session_data)
+                return api
+        except GarminConnectTooManyRequestsError:
+            raise
+        except Exception as e:
+            logging.info(f"Saved session rejected, logging in again: {e}")
 
-    api = Garmin(email, password)
+    api = GovernedGarmin(Garmin(email, password), governor)
     api.login()
+    if api.session_data:
+        save_session(email, api.session_data)
 
     return api
 
 
-def get_activities(
+class FetchCancelledError(Exception):
+    """Raised when an activities download is cancelled by the user."""
+
+
+class JobCheckpoint:
+    """
+    Checkpoint of the date windows of an export job in the activities store.
+
+    A window is recorded once its activities list is saved to the store and
+    the details of all its activities were fetched, which saves them to the
+    store too. When the job is run again after an interruption, the recorded
+    windows are read back from the store instead of being listed again, and
+    the details of their activities are read from the store by
+    `fetch_activity_details`, so the job resumes where it stopped.
+
+    Without a store or a job key, nothing is recorded. Windows are tracked
+    by one thread at a time, see `ActivitiesDownload`.
+    """
+
+    def __init__(
+        self, store: Optional[ActivityStore], job_key: Optional[str]
+    ) -> None:
+        """
+        Args:
+            store (ActivityStore, optional): The activities store.
+            job_key (str, optional): Key of the job, see `get_job_key`.
+        """
+        self.store = store if job_key else None
+        self.job_key = job_key
+        self.windows = {}
+        if self.store:
+            self.windows = self.store.get_job_windows(job_key)
+        self._activity_ids = {}
+        self._pending = {}
+
+    def get_window(self, window: tuple) -> Optional[list]:
+        """
+        Return the activities list of a window recorded by a previous run.
+
+        Args:
+            window (tuple): First and last days of the window.
+
+        Returns:
+            list: The stored activities, or None if the window must be
+            listed.
+        """
+        activity_ids = self.windows.get(window)
+        if activity_ids is None:
+            return None
+        return self.store.get_summaries(activity_ids)
+
+    def add_window(self, window: tuple, activities: list) -> None:
+        """
+        Start tracking a listed window.
+
+        Args:
+            window (tuple): First and last days of the window.
+            activities (list): The activities listed in the window.
+        """
+        if not self.store:
+            return
+        self._activity_ids[window] = [a["activityId"] for a in activities]
+        self._pending[window] = 0
+
+    def add_activity(self, window: tuple) -> None:
+        """Count an activity of a window whose details are being fetched."""
+        if not self.store:
+            return
+        self._pending[window] += 1
+
+    def activity_done(self, window: tuple) -> None:
+        """Count an activity of a window whose details were fetched."""
+        if not self.store:
+            return
+        self._pending[window] -= 1
+        self.check_window(window)
+
+    def check_window(self, window: tuple) -> None:
+        """Record a window once the details of all its activities arrived."""
+        if not self.store or window in self.windows:
+            return
+        if self._pending[window]:
+            return
+        activity_ids = self._activity_ids.pop(window)
+        self.windows[window] = activity_ids
+        self.store.save_job_window(self.job_key, *window, activity_ids)
+
+
+def fetch_tcx_file(
     api: Garmin,
-    startdate: str,
-    enddate: str,
-    progressbar: CTkProgressBar,
-    progresstext: CTkLabel,
-    root: CTk,
-    activitytype: str = "",
-    include_tcx: bool = False,
-) -> pd.DataFrame:
+    activity_id: int,
+    tcx_writer: Union[TcxFolder, TcxArchive],
+    store: Optional[ActivityStore] = None,
+) -> tuple:
     """
-    Get activities data from the Garmin API within a specified date range.
+    Download the TCX file of an activity and write it with a TCX writer.
+
+    The download is skipped if the file was already written, unless its
+    size differs from the TCX kept in the store. The TCX kept in the store
+    is written instead of being downloaded again.
 
     Args:
         api (Garmin): Authenticated API session to the Garmin service.
-        startdate (str): Start date in the format 'YYYY-MM-DD' from which
-            activities are fetched.
-        enddate (str): End date in the format 'YYYY-MM-DD' until which
-            activities are fetched.
-        progressbar (CTkProgressBar): A progress bar widget to display
-            the progress of activities retrieval.
-        progresstext (CTkLabel): A label widget to display the progress
-            status text.
-        root (CTk): The main tkinter window or top-level window that
-            contains the widgets.
-        activitytype (str, optional): Type of activity to filter. Acceptable
-            values include: 'cycling', 'running', 'swimming', 'multi_sport',
-            'fitness_equipment', 'hiking', 'walking', and 'other'. Defaults to
-            an empty string, implying all activity types are fetched.
-        include_tcx (str, optional): Whether tcx data should be downloaded
-            along with activities data. Defaults to False.
+        activity_id (int): Garmin identifier of the activity.
+        tcx_writer (TcxFolder or TcxArchive): Writer of the TCX files, see
+            `open_tcx_writer`.
+        store (ActivityStore, optional): Local store of already downloaded
+            payloads. Defaults to None.
 
     Returns:
-        pd.DataFrame: A DataFrame containing the activities data.
+        tuple: Path to the TCX file (str) and its content (bytes, None if
+        the file was already written).
     """
-    # Initialize progress bar
-    iter_count = 1
-    message = "Initialisation du téléchargement des activités ... "
-    progresstext.configure(text=message)
-    progressbar.set(0)
-    root.update_idletasks()
+    stored_size = None
+    if store:
+        stored_size = store.get_payload_size(activity_id, "tcx")
 
-    # Download activities default data
-    activities = api.get_activities_by_date(startdate, enddate, activitytype)
+    # Files are written atomically, an existing file is complete
+    if tcx_writer.contains(activity_id, stored_size):
+        return tcx_writer.path_of(activity_id), None
 
-    # Format activities default data
-    activities_data = pd.DataFrame(activities)
-    activities_data = activities_data[ACTIVITY_DATA_MAPPING.keys()]
-    activities_data = activities_data.rename(columns=ACTIVITY_DATA_MAPPING)
+    tcx_bytes = None
+    if stored_size is not None:
+        tcx_bytes = store.get_payload(activity_id, "tcx")
+    if tcx_bytes is None:
+        tcx_bytes = api.download_activity(
+            activity_id, dl_fmt=api.ActivityDownloadFormat.TCX
+        )
+        if store:
+            store.save_payload(activity_id, "tcx", tcx_bytes)
 
-    # Add missing data
-    ams_list, dwf_list, dwr_list = ([], [], [])
-    ams_top, dwf_top, dwr_top = (False, False, False)
-    hrz_data_list, tcx_data = ([], {})
+    return tcx_writer.write(activity_id, tcx_bytes), tcx_bytes
+
+
+def fetch_activity_details(
+    api: Garmin,
+    activity_id: int,
+    tcx_writer: Optional[Union[TcxFolder, TcxArchive]] = None,
+    store: Optional[ActivityStore] = None,
+    activity_type: str = "",
+    local_hr_zones: Optional[LocalHrZones] = None,
+    evaluation: bool = True,
+    hr_zones: bool = True,
+    job_key: Optional[str] = None,
+) -> tuple:
+    """
+    Fetch the per-activity data that is not part of the activities list.
+
+    When a store is given, payloads already stored are read from it and only
+    the missing ones, or those that may have changed since, are downloaded,
+    then saved to the store.
+
+    Args:
+        api (Garmin): Authenticated API session to the Garmin service.
+        activity_id (int): Garmin identifier of the activity.
+        tcx_writer (TcxFolder or TcxArchive, optional): Writer of the TCX
+            file of the activity, see `fetch_tcx_file`. Defaults to None, in
+            which case the TCX file is not downloaded.
+        store (ActivityStore, optional): Local store of already downloaded
+            payloads. Defaults to None.
+        activity_type (str, optional): The type key of the activity, used to
+            compute its HR zones locally. Defaults to an empty string.
+        local_hr_zones (LocalHrZones, optional): When given with a TCX
+            writer, the HR zones are computed from the TCX file once the
+            zone boundaries of the activity type are known, instead of
+            being downloaded. Defaults to None.
+        evaluation (bool, optional): Whether the evaluation is fetched.
+            Defaults to True.
+        hr_zones (bool, optional): Whether the HR zones are fetched.
+            Defaults to True.
+        job_key (str, optional): Key of the job fetching the details, see
+            `ActivityStore.get_payload`. Defaults to None.
 
-    for activity in activities:
-        activity_id = activity["activityId"]
+    Returns:
+        tuple: The evaluation data (dict), the HR zones data (list) and the
+        path to the TCX file (str or None if `tcx_writer` is None). The
+        evaluation and HR zones data are None when they are not fetched.
+    """
+    details_data, hrz_data, tcx_path, tcx_bytes = (None, None, None, None)
+    if evaluation:
+        summary_dto = None
+        if store:
+            summary_dto = store.get_payload(
+                activity_id, "evaluation", job_key
+            )
+        if summary_dto is None:
+            details_data = api.get_activity_evaluation(activity_id)
+            summary_dto = details_data.get("summaryDTO", {})
+            if store:
+                store.save_payload(
+                    activity_id, "evaluation", summary_dto, job_key
+                )
+        details_data = {"summaryDTO": summary_dto}
+
+    if tcx_writer:
+        tcx_path, tcx_bytes = fetch_tcx_file(
+            api, activity_id, tcx_writer, store
+        )
 
-        details_data = api.get_activity_evaluation(activity_id)
+    if not hr_zones:
+        return details_data, hrz_data, tcx_path
+    if store:
+        hrz_data = store.get_payload(activity_id, "hr_zones", job_key)
 
+    # Computed HR zones are estimates, they are not saved to the store
+    if local_hr_zones and hrz_data is not None:
+        local_hr_zones.learn(activity_type, hrz_data)
+    if local_hr_zones and hrz_data is None and tcx_path:
+        # A TCX archive is only written once closed, it is read from the
+        # writer when the file was not downloaded again
+        if tcx_bytes is None:
+            tcx_bytes = partial(tcx_writer.read, activity_id)
+        hrz_data = local_hr_zones.compute(activity_type, tcx_bytes)
+
+    if hrz_data is None:
         hrz_data = api.get_activity_hr_in_timezones(activity_id)
-        hrz_data_list.append(hrz_data)
+        if store:
+            store.save_payload(activity_id, "hr_zones", hrz_data, job_key)
+        if local_hr_zones:
+            local_hr_zones.learn(activity_type, hrz_data)
+
+    return details_data, hrz_data, tcx_path
+
+
+def add_activities_details(
+    activities_data: pd.DataFrame,
+    activity_ids: list,
+    details_results: list,
+    columns: Optional[list] = None,
+) -> pd.DataFrame:
+    """
+    Add the evaluation and HR zones data of the activities to the activities
+    list data.
 
+    The moving speed follows the mean speed, the feel and perceived effort
+    follow the exercise load and the HR zones follow the maximum heart rate.
+    Added columns whose neighbour is not exported come last.
+
+    Args:
+        activities_data (pd.DataFrame): Renamed activities list data.
+        activity_ids (list): Garmin identifiers of the activities, in the
+            order of the rows.
+        details_results (list): Results of `fetch_activity_details` for each
+            activity, in the same order.
+        columns (list, optional): The selected columns, see `is_selected`.
+            Defaults to all the columns.
+
+    Returns:
+        pd.DataFrame: Activities data with the added columns.
+    """
+    ams_list, dwf_list, dwr_list = ([], [], [])
+    ams_top, dwf_top, dwr_top = (False, False, False)
+    hrz_data_list = []
+
+    for activity_id, (details_data, hrz_data, _) in zip(
+        activity_ids, details_results
+    ):
+        hrz_data_list.append(hrz_data or [])
+        if details_data is None:
+            # The evaluation was not fetched, see `get_details_plan`
+            ams_list.append("")
+            dwf_list.append("")
+            dwr_list.append("")
+            continue
         try:
             ams_list.append(details_data["summaryDTO"]["averageMovingSpeed"])
         except KeyError:
@@ -117,60 +371,582 @@ def get_activities(
             dwr_list.append("")
             logging.info(DWR_ERROR + f"{activity_id}")
 
-        if include_tcx:
-            tcx_bytes = api.download_activity(
-                activity_id, dl_fmt=api.ActivityDownloadFormat.TCX
-            )
-            tcx_data.update({activity_id: tcx_bytes})
-
-        # Update progress bar
-        message = "Téléchargement des activités en cours ... "
-        display_text = message + f"{iter_count}/{len(activities)}"
-        progresstext.configure(text=display_text)
-        progressbar.set(progressbar.get() + 1 / len(activities))
-        root.update_idletasks()
-        iter_count += 1
+    def index_after(column: str, offset: int = 1) -> int:
+        if column not in activities_data.columns:
+            return len(activities_data.columns)
+        return min(
+            activities_data.columns.get_loc(column) + offset,
+            len(activities_data.columns),
+        )
 
     # Add detailled data
-    meanspeed_idx = activities_data.columns.get_loc("Allure moyenne (km/h)")
     if ams_top:
         activities_data.insert(
-            meanspeed_idx + 1,
+            index_after("Allure moyenne (km/h)"),
             "Allure moyenne en déplacement (km/h)",
             ams_list,
         )
-    exload_idx = activities_data.columns.get_loc("Exercise load")
-    if dwf_top:
+    exload_idx = index_after("Exercise load")
+    if dwf_top and is_selected("Comment vous êtes-vous senti ?", columns):
         activities_data.insert(
-            exload_idx + 1,
+            exload_idx,
             "Comment vous êtes-vous senti ?",
             dwf_list,
         )
-    if dwr_top:
+    if dwr_top and is_selected("Effort perçu", columns):
         activities_data.insert(
-            exload_idx + 2,
+            min(exload_idx + 1, len(activities_data.columns)),
             "Effort perçu",
             dwr_list,
         )
 
     # Add HR zones data
-    maxhr_idx = activities_data.columns.get_loc("Fréquence cardiaque maximale (bpm)")
+    if not is_selected(HR_ZONES_COLUMNS, columns):
+        return activities_data
+    maxhr_idx = index_after("Fréquence cardiaque maximale (bpm)")
     hrzones_cols = [
         [zone.get("secsInZone", "") if zone else "" for zone in activity]
         for activity in zip_longest(*hrz_data_list)
     ]
     for i, col in enumerate(hrzones_cols):
         activities_data.insert(
-            maxhr_idx + i + 1,
-            f"Temps en Zone de FC {i + 1} (sec)",
-            col,
+            maxhr_idx + i, HR_ZONE_COLUMN.format(i + 1), col
+        )
+
+    return activities_data
+
+
+def get_details_plan(columns: Optional[list]) -> tuple:
+    """
+    Return the per-activity endpoints needed by the selected columns.
+
+    Args:
+        columns (list or None): The selected columns, among
+            SELECTABLE_COLUMNS, or None for all the columns.
+
+    Returns:
+        tuple: Whether the evaluation (bool) and the HR zones (bool) of the
+        activities are fetched.
+    """
+    if columns is None:
+        return True, True
+    evaluation = any(column in columns for column in EVALUATION_COLUMNS)
+    return evaluation, HR_ZONES_COLUMNS in columns
+
+
+def is_selected(column: str, columns: Optional[list]) -> bool:
+    """
+    Return whether a column of the activities data is exported.
+
+    Args:
+        column (str): Name of the column, HR_ZONES_COLUMNS for the HR zones
+            columns.
+        columns (list or None): The selected columns, among
+            SELECTABLE_COLUMNS, or None for all the columns.
+
+    Returns:
+        bool: Whether the column is required or selected.
+    """
+    return columns is None or column in REQUIRED_COLUMNS or column in columns
+
+
+class ActivityColumns:
+    """
+    Activities of the date windows, stored column by column as they arrive.
+
+    An activity of the activities list has more than a hundred fields, of
+    which only the mapped ones are exported. Each activity is projected on
+    the fields of the selected columns and its values are written into
+    preallocated arrays, grown by doubling, so that the activities lists can
+    be released once ingested.
+    """
+
+    def __init__(
+        self,
+        columns: Optional[list] = None,
+        capacity: int = ACTIVITIES_CAPACITY,
+    ) -> None:
+        """
+        Args:
+            columns (list, optional): The selected columns, see
+                `is_selected`. Defaults to all the columns.
+            capacity (int, optional): Initial number of rows of the arrays.
+                Defaults to ACTIVITIES_CAPACITY.
+        """
+        self.keys = [
+            key
+            for key, column in ACTIVITY_DATA_MAPPING.items()
+            if is_selected(column, columns)
+        ]
+        self.size = 0
+        capacity = max(1, capacity)
+        self._ids = np.empty(capacity, dtype="int64")
+        self._windows = np.empty(capacity, dtype="int32")
+        self._values = {
+            key: np.empty(capacity, dtype=object) for key in self.keys
+        }
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self._ids)
+
+        def resize(values: np.ndarray) -> np.ndarray:
+            resized = np.empty(capacity, dtype=values.dtype)
+            resized[: self.size] = values[: self.size]
+            return resized
+
+        self._ids = resize(self._ids)
+        self._windows = resize(self._windows)
+        self._values = {
+            key: resize(values) for key, values in self._values.items()
+        }
+
+    def add(self, window_idx: int, activity: dict) -> None:
+        """
+        Add an activity of the activities list of a window.
+
+        Args:
+            window_idx (int): Index of the window in `split_date_range`.
+            activity (dict): The activity, as listed by the API.
+        """
+        if self.size == len(self._ids):
+            self._grow()
+        row = self.size
+        self._ids[row] = activity["activityId"]
+        self._windows[row] = window_idx
+        for key, values in self._values.items():
+            values[row] = activity.get(key)
+        self.size += 1
+
+    def to_frame(self) -> tuple:
+        """
+        Return the activities in the order of the API, most recent first.
+
+        An activity listed in two windows is kept in the most recent one.
+
+        Returns:
+            tuple: A DataFrame of the selected columns and the list of the
+            activity IDs, in the same order.
+        """
+        ids = self._ids[: self.size]
+        rows = np.argsort(self._windows[: self.size], kind="stable")
+        _, first = np.unique(ids[rows], return_index=True)
+        rows = rows[np.sort(first)]
+
+        activities_data = pd.DataFrame(
+            {key: values[rows] for key, values in self._values.items()},
+            columns=self.keys,
+        ).infer_objects()
+        activities_data = activities_data.rename(
+            columns=ACTIVITY_DATA_MAPPING
+        )
+        return activities_data, ids[rows].tolist()
+
+
+def build_activities_data(
+    activities: ActivityColumns,
+    details_by_id: dict,
+    columns: Optional[list] = None,
+) -> tuple:
+    """
+    Build the activities data from the activities of the date windows and
+    the details fetched for each activity.
+
+    Args:
+        activities (ActivityColumns): The activities of the windows.
+        details_by_id (dict): Result of `fetch_activity_details` by activity
+            ID, for every activity of the lists.
+        columns (list, optional): The selected columns, see `is_selected`.
+            Defaults to all the columns.
+
+    Returns:
+        tuple: A DataFrame of the activities data, not processed yet, and
+        the paths to the TCX files by activity ID.
+    """
+    activities_data, activity_ids = activities.to_frame()
+
+    # Add missing data
+    details_results = [
+        details_by_id[activity_id] for activity_id in activity_ids
+    ]
+
+    tcx_paths = {
+        activity_id: tcx_path
+        for activity_id, (_, _, tcx_path) in zip(
+            activity_ids, details_results
+        )
+        if tcx_path is not None
+    }
+
+    # Add detailled and HR zones data
+    activities_data = add_activities_details(
+        activities_data, activity_ids, details_results, columns
+    )
+
+    return activities_data, tcx_paths
+
+
+def split_date_range(startdate: str, enddate: str) -> list:
+    """
+    Split a date range into calendar months, to fetch the activities list
+    of each month separately.
+
+    Args:
+        startdate (str): First day of the range, 'YYYY-MM-DD'.
+        enddate (str): Last day of the range, 'YYYY-MM-DD'.
+
+    Returns:
+        list: The first and last days ('YYYY-MM-DD') of each window, most
+        recent first like the activities list. The first and last windows
+        are cut to the range.
+    """
+    start = datetime.strptime(str(startdate), "%Y-%m-%d").date()
+    end = datetime.strptime(str(enddate), "%Y-%m-%d").date()
+
+    windows = []
+    window_start = start
+    while window_start <= end:
+        in_next_month = window_start.replace(day=28) + timedelta(days=4)
+        next_month = in_next_month.replace(day=1)
+        window_end = min(next_month - timedelta(days=1), end)
+        windows.append((
+            window_start.strftime("%Y-%m-%d"),
+            window_end.strftime("%Y-%m-%d"),
+        ))
+        window_start = next_month
+
+    return windows[::-1] or [(startdate, enddate)]
+
+
+class ActivitiesDownload:
+    """
+    Download of the activities of a date range, shared by `get_activities`
+    and `get_activities_async`.
+
+    The clients list the date windows and fetch the details of the
+    activities concurrently, each in its own way, and hand the results over
+    to the download. The download keeps the activities more recent than the
+    watermark, decides which details are fetched, checkpoints the job,
+    reports the progress and finally assembles the activities data.
+
+    Results are handed over by one thread at a time. The methods reading or
+    writing the store block, the async client calls them in threads.
+    """
+
+    def __init__(
+        self,
+        startdate: str,
+        enddate: str,
+        include_tcx: bool = False,
+        tcx_format: str = TCX_FORMATS[0],
+        local_hr_zones: bool = False,
+        progress_callback: Optional[Callable[[str, int, int], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        store: Optional[ActivityStore] = None,
+        newer_than: Optional[dict] = None,
+        job_key: Optional[str] = None,
+        columns: Optional[list] = None,
+    ) -> None:
+        """
+        Start the download, the TCX writer is opened until `close`. The
+        arguments are those of `get_activities`.
+
+        Raises:
+            FetchCancelledError: If `cancel_event` is already set.
+        """
+        self.cancel_event = cancel_event
+        self.progress = ProgressReporter(progress_callback)
+        self.progress.report(
+            "Initialisation du téléchargement des activités ... ", 0, 0
+        )
+        self.check_cancelled()
+
+        self.windows = split_date_range(startdate, enddate)
+        self.watermark = None
+        if newer_than:
+            self.watermark = (
+                newer_than["start_time_local"],
+                newer_than["activity_id"],
+            )
+
+        self.store = store
+        self.columns = columns
+        self.tcx_writer = open_tcx_writer(tcx_format) if include_tcx else None
+        # Per-activity endpoints whose columns are not selected are skipped
+        self.fetch_evaluation, self.fetch_hr_zones = get_details_plan(columns)
+        self.fetch_details = (
+            include_tcx or self.fetch_evaluation or self.fetch_hr_zones
+        )
+        self.hr_zones = None
+        if include_tcx and local_hr_zones and self.fetch_hr_zones:
+            self.hr_zones = LocalHrZones()
+
+        self.activities = ActivityColumns(columns)
+        self.details_by_id = {}
+        self.job_key = job_key
+        self.checkpoint = JobCheckpoint(store, job_key)
+        self._seen_ids = set()
+        self._details_count = 0
+
+    def check_cancelled(self) -> None:
+        """Raise FetchCancelledError if the download was cancelled."""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise FetchCancelledError()
+
+    def get_window(self, window: tuple) -> Optional[list]:
+        """
+        Return the activities list of a window checkpointed by a previous
+        run, see `JobCheckpoint.get_window`.
+        """
+        return self.checkpoint.get_window(window)
+
+    def add_window(self, window_idx: int, window_activities: list) -> list:
+        """
+        Ingest the activities list of a window.
+
+        The activities are saved to the store and only their exported fields
+        are kept, see `ActivityColumns`.
+
+        Args:
+            window_idx (int): Index of the window in `windows`.
+            window_activities (list): The activities listed in the window.
+
+        Returns:
+            list: The arguments of `fetch_activity_details` following the
+            API, as a tuple, for each activity whose details must be
+            fetched.
+        """
+        window = self.windows[window_idx]
+        if self.store:
+            self.store.save_summaries(window_activities)
+        self.checkpoint.add_window(window, window_activities)
+
+        details_args = []
+        for activity in window_activities:
+            # Keep only the activities more recent than the last synced one,
+            # those without a start time are kept and merged by identifier
+            activity_id = activity["activityId"]
+            start_time = activity.get("startTimeLocal")
+            if (
+                self.watermark
+                and start_time is not None
+                and (start_time, activity_id) <= self.watermark
+            ):
+                continue
+            self.activities.add(window_idx, activity)
+
+            # An activity listed in two windows is fetched once
+            if activity_id in self._seen_ids:
+                continue
+            self._seen_ids.add(activity_id)
+            if not self.fetch_details:
+                self.details_by_id[activity_id] = (None, None, None)
+                continue
+
+            activity_type = (activity.get("activityType") or {}).get(
+                "typeKey", ""
+            )
+            details_args.append(
+                (
+                    activity_id,
+                    self.tcx_writer,
+                    self.store,
+                    activity_type,
+                    self.hr_zones,
+                    self.fetch_evaluation,
+                    self.fetch_hr_zones,
+                    self.job_key,
+                )
+            )
+            self.checkpoint.add_activity(window)
+        self.checkpoint.check_window(window)
+
+        self._details_count += len(details_args)
+        return details_args
+
+    def add_details(
+        self, window_idx: int, activity_id: int, details: tuple
+    ) -> None:
+        """
+        Ingest the details of an activity, as returned by
+        `fetch_activity_details`, and report the progress.
+
+        Args:
+            window_idx (int): Index of the window of the activity.
+            activity_id (int): Garmin identifier of the activity.
+            details (tuple): The details of the activity.
+        """
+        self.details_by_id[activity_id] = details
+        self.checkpoint.activity_done(self.windows[window_idx])
+
+        # The total grows until all windows arrived
+        self.progress.advance(self._details_count)
+
+    def close(self) -> None:
+        """Close the TCX writer, once no more details are fetched."""
+        if self.tcx_writer:
+            self.tcx_writer.close()
+
+    def finish(self) -> tuple:
+        """
+        Assemble and process the activities data of the download.
+
+        Returns:
+            tuple: The processed activities data and the paths to the TCX
+            files by activity ID, see `get_activities`.
+        """
+        activities_data, tcx_paths = build_activities_data(
+            self.activities, self.details_by_id, self.columns
         )
+        activities_count = len(activities_data)
+
+        # Final update progress
+        display_text = (
+            f"Téléchargement de {activities_count} activité(s) terminé !"
+        )
+        self.progress.report(display_text, activities_count, activities_count)
+
+        metrics = active_metrics()
+        if metrics:
+            metrics.count_activities(activities_count)
+
+        # Process the data
+        activities_data = process_activities_data(activities_data)
+
+        return activities_data, tcx_paths
+
+
+@timed("fetch")
+def get_activities(
+    api: Garmin,
+    startdate: str,
+    enddate: str,
+    activitytype: str = "",
+    include_tcx: bool = False,
+    tcx_format: str = TCX_FORMATS[0],
+    local_hr_zones: bool = False,
+    max_workers: int = MAX_WORKERS,
+    progress_callback: Optional[Callable[[str, int, int], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    store: Optional[ActivityStore] = None,
+    newer_than: Optional[dict] = None,
+    job_key: Optional[str] = None,
+    columns: Optional[list] = None,
+) -> tuple:
+    """
+    Get activities data from the Garmin API within a specified date range.
+
+    The activities list is fetched by month, the months being fetched
+    concurrently, and the details of the activities of a month are fetched
+    as soon as its list arrives.
+
+    Args:
+        api (Garmin): Authenticated API session to the Garmin service.
+        startdate (str): Start date in the format 'YYYY-MM-DD' from which
+            activities are fetched.
+        enddate (str): End date in the format 'YYYY-MM-DD' until which
+            activities are fetched.
+        activitytype (str, optional): Type of activity to filter. Acceptable
+            values include: 'cycling', 'running', 'swimming', 'multi_sport',
+            'fitness_equipment', 'hiking', 'walking', and 'other'. Defaults to
+            an empty string, implying all activity types are fetched.
+        include_tcx (str, optional): Whether tcx data should be downloaded
+            along with activities data. Each TCX file is written as soon as
+            it is downloaded. Defaults to False.
+        tcx_format (str, optional): How the TCX files are written, one of
+            TCX_FORMATS, see `open_tcx_writer`. Defaults to plain files.
+        local_hr_zones (bool, optional): Whether the HR zones are computed
+            from the TCX files instead of being downloaded, see
+            `LocalHrZones`. Only used with `include_tcx`. Defaults to False.
+        max_workers (int, optional): Maximum number of activities whose
+            details are fetched concurrently. Defaults to MAX_WORKERS.
+        progress_callback (Callable, optional): Called with a status message,
+            the number of processed activities and the total number of
+            activities each time the download progresses. Defaults to None.
+        cancel_event (threading.Event, optional): When set, the download is
+            stopped and FetchCancelledError is raised. Defaults to None.
+        store (ActivityStore, optional): Local store used to skip the
+            per-activity downloads already done by a previous run. Defaults
+            to None.
+        newer_than (dict, optional): Watermark of the last synced activity,
+            as returned by `get_watermark`. Only activities started after it
+            are kept. Defaults to None.
+        job_key (str, optional): Key of the job in the store, to checkpoint
+            the download and resume it if it was interrupted, see
+            `JobCheckpoint`. Defaults to None.
+        columns (list, optional): The exported columns, among
+            SELECTABLE_COLUMNS. The evaluation and HR zones of the
+            activities are only fetched when some of their columns are
+            selected. Defaults to all the columns.
+
+    Returns:
+        tuple: A DataFrame containing the activities data, and the paths to
+        the TCX files by activity ID (empty if `include_tcx` is False).
+
+    Raises:
+        FetchCancelledError: If `cancel_event` is set during the download.
+    """
+
+    download = ActivitiesDownload(
+        startdate,
+        enddate,
+        include_tcx=include_tcx,
+        tcx_format=tcx_format,
+        local_hr_zones=local_hr_zones,
+        progress_callback=progress_callback,
+        cancel_event=cancel_event,
+        store=store,
+        newer_than=newer_than,
+        job_key=job_key,
+        columns=columns,
+    )
+
+    def list_window(window: tuple) -> list:
+        stored = download.get_window(window)
+        if stored is not None:
+            return stored
+        return api.get_activities_by_date(*window, activitytype)
 
-    # Final update progresstext
-    display_text = f"Téléchargement de {len(activities)} activité(s) terminé !"
-    progresstext.configure(text=display_text)
+    # Download the activities list by date windows, fetched concurrently,
+    # and fetch the details of each window as soon as it arrives
+    windows_executor = ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(download.windows)))
+    )
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    # Futures are put on the queue once done, waiting on all the pending
+    # futures at each completion would be quadratic in their number
+    completed = queue.Queue()
+    try:
+        window_futures = {}
+        for idx, window in enumerate(download.windows):
+            future = windows_executor.submit(list_window, window)
+            future.add_done_callback(completed.put)
+            window_futures[future] = idx
+        details_futures = {}
+        pending_count = len(window_futures)
+        while pending_count:
+            future = completed.get()
+            pending_count -= 1
+            download.check_cancelled()
+            if future in window_futures:
+                # The activities list is released once ingested
+                window_idx = window_futures.pop(future)
+                for args in download.add_window(window_idx, future.result()):
+                    details_future = executor.submit(
+                        fetch_activity_details, api, *args
+                    )
+                    details_futures[details_future] = (window_idx, args[0])
+                    details_future.add_done_callback(completed.put)
+                    pending_count += 1
+                continue
 
-    # Process the data
-    activities_data = process_activities_data(activities_data)
+            download.add_details(*details_futures.pop(future), future.result())
+    finally:
+        # Pending requests are dropped if the download stopped early
+        windows_executor.shutdown(wait=True, cancel_futures=True)
+        executor.shutdown(wait=True, cancel_futures=True)
+        download.close()
 
-    return activities_data, tcx_data
+    return download.finish()
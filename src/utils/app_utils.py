@@ -1,14 +1,26 @@
+import os
+import queue
+import inspect
+import logging
 import threading
 
-from garminconnect import Garmin
-
-from typing import Union, Optional
+from typing import Optional, Union
 
 from utils.base_utils import days_in_month
-from utils.api_utils import init_api, get_activities
-from utils.base_utils import save_settings, save_to_excel, save_tcx_files
+from utils.base_utils import save_settings, save_activities
+from utils.base_utils import get_store_path, load_export
+from utils.base_utils import load_watermark, save_watermark
+from utils.base_utils import get_report_path, get_job_key
+from utils.base_utils import load_columns, save_columns
+from utils.store_utils import ActivityStore
+from utils.metrics_utils import RunMetrics, record_run
 from utils.constants import (
     ACTIVITY_TYPES_MAPPING,
+    DOWNLOAD_MODES,
+    POLL_INTERVAL_MS,
+    SELECTABLE_COLUMNS,
+    TCX_FORMATS,
+    TCX_OPTIONS,
     DATE_ERROR,
     LOGIN_ERROR,
     WRONG_EMAIL_ERROR,
@@ -16,18 +28,25 @@ from utils.constants import (
     MISSING_PASSWORD_ERROR,
     TOO_MANY_REQUESTS_ERROR,
     SUCCESS_MSG,
+    SUCCESS_MSG_PARQUET,
     SUCCESS_MSG_TCX,
     CONNECTION_LOADING_MSG,
+    CANCELLING_MSG,
+    CANCELLED_MSG,
+    RESUME_JOB_MSG,
 )
 
-from customtkinter import CTk, CTkComboBox
+from customtkinter import (
+    CTk,
+    CTkButton,
+    CTkCheckBox,
+    CTkComboBox,
+    CTkScrollableFrame,
+    CTkToplevel,
+)
 
 from datetime import datetime, date
-from tkinter import messagebox
-from garminconnect import (
-    GarminConnectAuthenticationError,
-    GarminConnectTooManyRequestsError,
-)
+from tkinter import BooleanVar, messagebox
 
 
 def reset_interface(widgets):
@@ -81,26 +100,117 @@ def update_days_combobox(
     root.update_idletasks()
 
 
-def init_api_and_followup(
-    root: CTk,
+def update_end_date_state(mode: str, comboboxes: list) -> None:
+    """
+    Enable the end date comboboxes in period mode and disable them in
+    synchronisation mode, where the end date is always today.
+
+    Args:
+        mode (str): The selected download mode.
+        comboboxes (list): The day, month and year comboboxes of the end date.
+    """
+    state = "disabled" if mode == DOWNLOAD_MODES[1] else "normal"
+    for combobox in comboboxes:
+        combobox.configure(state=state)
+
+
+def open_columns_picker(root: CTk) -> None:
+    """
+    Open a window to choose the columns of the exports.
+
+    The selection is saved with `save_columns` when validated, and used by
+    the next downloads. The evaluation and HR zones of the activities are
+    only downloaded when some of their columns are selected.
+
+    Args:
+        root (CTk): The main customtkinter window.
+    """
+    selected = load_columns()
+
+    window = CTkToplevel(root)
+    window.title("Colonnes exportées")
+    window.resizable(False, False)
+    window.transient(root)
+
+    frame = CTkScrollableFrame(window, width=420, height=400)
+    frame.grid(row=0, column=0, columnspan=3, padx=20, pady=(20, 10))
+
+    variables = {}
+    for column in SELECTABLE_COLUMNS:
+        variable = BooleanVar(value=selected is None or column in selected)
+        CTkCheckBox(frame, text=column, variable=variable).pack(
+            anchor="w", pady=2
+        )
+        variables[column] = variable
+
+    def set_all(value: bool) -> None:
+        for variable in variables.values():
+            variable.set(value)
+
+    def validate() -> None:
+        columns = [
+            column for column, variable in variables.items() if variable.get()
+        ]
+        # All the columns are saved as no selection, to include new ones
+        if len(columns) == len(SELECTABLE_COLUMNS):
+            columns = None
+        save_columns(columns)
+        window.destroy()
+
+    CTkButton(window, text="Tout", command=lambda: set_all(True)).grid(
+        row=1, column=0, padx=(20, 5), pady=(0, 20)
+    )
+    CTkButton(window, text="Aucune", command=lambda: set_all(False)).grid(
+        row=1, column=1, padx=5, pady=(0, 20)
+    )
+    CTkButton(window, text="Valider", command=validate).grid(
+        row=1, column=2, padx=(5, 20), pady=(0, 20)
+    )
+    window.grab_set()
+
+
+def run_job(
+    events: queue.Queue,
+    cancel_event: threading.Event,
     email: str,
     password: str,
     startdate: Union[date, str],
     enddate: Union[date, str],
     activity_type: str,
-    widgets: dict,
+    include_tcx: bool,
+    sync: bool = False,
+    output_format: str = "Excel",
+    tcx_format: str = TCX_FORMATS[0],
+    columns: Optional[list] = None,
 ) -> None:
     """
-    Initialize the API using provided credentials and setup follow-up tasks.
-
-    This function attempts to initialize an API instance with the given email
-    and password. If the initialization is successful, a follow-up task
-    (`post_init`) is set up with the provided arguments. If there's an error
-    in initializing the API, the error is passed to the follow-up task.
+    Log in, download the activities and export them, off the main thread.
+
+    This function is meant to run in a worker thread: it never touches the
+    customtkinter widgets. Progress and results are sent to the GUI as tuples
+    put on the `events` queue, whose first item is the event kind:
+
+    - ("login",): the API connection succeeded.
+    - ("progress", message, done, total): the download progressed.
+    - ("done", dump_path, dump_path_tcx): the files were saved.
+    - ("cancelled",): the job was stopped through `cancel_event`.
+    - ("error", exception): the job failed.
+
+    Payloads already downloaded by a previous run are read from the local
+    activities store instead of being downloaded again. The job is recorded
+    in the store until its export is saved, so that running it again with
+    the same parameters resumes it if it was interrupted, see
+    `JobCheckpoint`.
+
+    In synchronisation mode, only the activities started after the last
+    synced one are downloaded, from its date to today, and merged into the
+    export of the previous synchronisation. The first synchronisation of an
+    account downloads everything since `startdate`. Parquet datasets are
+    appended to, they do not need to be merged.
 
     Args:
-        root (CTk): The main customtkinter window or top-level
-            window.
+        events (queue.Queue): Thread-safe queue the events are put on.
+        cancel_event (threading.Event): Event set by the GUI to stop the job.
         email (str): The email address to be used for API authentication.
         password (str): The password corresponding to the email for API
             authentication.
@@ -109,103 +219,350 @@ def init_api_and_followup(
         enddate (datetime.date or str): The end date for activity retrieval.
         activity_type (str): The type of activity to be retrieved (e.g.,
             'running', 'cycling').
-        widgets (dict): A dictionary containing all the customtkinter widgets
-            of the app.
+        include_tcx (bool): Whether TCX data should be downloaded as well.
+        sync (bool, optional): Whether the synchronisation mode is used.
+            Defaults to False.
+        output_format (str, optional): One of 'Excel', 'CSV' or 'Parquet'.
+            Defaults to 'Excel'.
+        tcx_format (str, optional): One of TCX_FORMATS, 'tcx' for plain TCX
+            files, 'gzip' for gzip compressed files or 'zip' for a single zip
+            archive. Defaults to 'tcx'.
+        columns (list, optional): The exported columns, see
+            `get_activities`. Defaults to all the columns.
     """
     try:
-        api = init_api(email=email, password=password)
-        error = None
+        export_job(
+            events,
+            cancel_event,
+            email,
+            password,
+            startdate,
+            enddate,
+            activity_type,
+            include_tcx,
+            sync,
+            output_format,
+            tcx_format,
+            columns,
+        )
     except Exception as e:
-        api = None
-        error = e
-
-    root.after(
-        0,
-        post_init,
-        root,
-        error,
-        api,
-        startdate,
-        enddate,
-        activity_type,
-        widgets,
-    )
+        # The GUI waits for an event ending the job, whatever fails
+        events.put(("error", e))
 
 
-def post_init(
-    root: CTk,
-    error: Optional[Exception],
-    api: Garmin,
+def export_job(
+    events: queue.Queue,
+    cancel_event: threading.Event,
+    email: str,
+    password: str,
     startdate: Union[date, str],
     enddate: Union[date, str],
     activity_type: str,
+    include_tcx: bool,
+    sync: bool = False,
+    output_format: str = "Excel",
+    tcx_format: str = TCX_FORMATS[0],
+    columns: Optional[list] = None,
+) -> None:
+    """
+    Run the job of `run_job`, with the same arguments. The errors of the
+    download and of the export are put on the `events` queue here, the
+    other ones by `run_job`.
+    """
+    # pandas, numpy and garminconnect are slow to import, they are only
+    # loaded once a download starts so that the window opens faster
+    from utils.api_utils import init_api, get_activities, FetchCancelledError
+    from utils.data_utils import merge_activities_data, get_watermark
+    from utils.tcx_utils import get_tcx_output_path
+
+    metrics = RunMetrics()
+    with record_run(metrics):
+        store = None
+        try:
+            store = ActivityStore(get_store_path())
+            params = dict(
+                startdate=str(startdate),
+                enddate=str(enddate),
+                activity_type=activity_type,
+                include_tcx=include_tcx,
+                sync=sync,
+                output_format=output_format,
+                tcx_format=tcx_format,
+                columns=columns,
+            )
+            job_key = get_job_key(email, params)
+
+            api = init_api(email=email, password=password)
+            if cancel_event.is_set():
+                raise FetchCancelledError()
+            events.put(("login",))
+            # Only jobs that logged in can be resumed
+            store.save_job(job_key, email, params)
+
+            watermark = load_watermark(email, activity_type) if sync else None
+            if watermark and (
+                watermark.get("output_format", "Excel") != output_format
+                or not os.path.exists(watermark["export_path"])
+            ):
+                watermark = None
+            if watermark:
+                startdate = watermark["start_time_local"][:10]
+
+            activities_data, _ = get_activities(
+                api=api,
+                startdate=startdate,
+                enddate=enddate,
+                activitytype=activity_type,
+                include_tcx=include_tcx,
+                tcx_format=tcx_format,
+                progress_callback=lambda message, done, total: events.put(
+                    ("progress", message, done, total)
+                ),
+                cancel_event=cancel_event,
+                store=store,
+                newer_than=watermark,
+                job_key=job_key,
+                columns=columns,
+            )
+
+            dump_path = None
+            if watermark:
+                dump_path = watermark["export_path"]
+            if watermark and output_format != "Parquet":
+                activities_data = merge_activities_data(
+                    activities_data, load_export(dump_path)
+                )
+
+            dump_path = save_activities(
+                activities_data,
+                output_format,
+                startdate,
+                enddate,
+                dump_path=dump_path,
+            )
+
+            if sync:
+                new_watermark = get_watermark(activities_data)
+                if new_watermark:
+                    new_watermark["export_path"] = dump_path
+                    new_watermark["output_format"] = output_format
+                    save_watermark(email, activity_type, new_watermark)
+            store.delete_job(job_key)
+
+            # TCX files are written during the download
+            dump_path_tcx = None
+            if include_tcx:
+                dump_path_tcx = get_tcx_output_path(tcx_format)
+            events.put(("done", dump_path, dump_path_tcx))
+        except FetchCancelledError:
+            events.put(("cancelled",))
+        except Exception as e:
+            events.put(("error", e))
+        finally:
+            if store:
+                store.close()
+
+    # The report is only a diagnostic, it never fails the job
+    try:
+        metrics.write_report(get_report_path())
+    except OSError as e:
+        logging.warning(f"Cannot write the metrics report: {e}")
+
+
+
+def can_resume_job(params: dict) -> bool:
+    """
+    Return whether a job recorded in the activities store can be resumed by
+    the GUI. Jobs recorded by the command line have other parameters.
+
+    Args:
+        params (dict): The parameters of the job.
+
+    Returns:
+        bool: Whether the parameters are keyword arguments of `run_job`.
+    """
+    try:
+        inspect.signature(run_job).bind(None, None, "", "", **params)
+    except TypeError:
+        return False
+    return True
+
+
+def poll_events(
+    root: CTk,
     widgets: dict,
+    events: queue.Queue,
+    include_tcx: bool,
+    output_format: str,
 ) -> None:
     """
-    Handle post-initialization tasks after attempting API connection.
+    Apply the events sent by the worker thread to the interface.
 
-    Once API initialization has been attempted, this function manages the UI
-    updates and potential errors. If there is no error and the API
-    initialization is successful, it retrieves activities and saves them to an
-    Excel file.
+    Drains the events queue, updates the widgets accordingly and reschedules
+    itself every POLL_INTERVAL_MS milliseconds until the job is over. Only
+    the last of the progress events drained at once is drawn.
 
     Args:
         root (CTk): The main customtkinter window or top-level
             window.
-        error (Optional[Exception]): Any error that occurred during API
-            initialization.
-        api (Garmin): The initialized API instance.
-        startdate (datetime.date or str): The starting date for activity
-            retrieval.
-        enddate (datetime.date or str): The end date for activity retrieval.
-        activity_type (str): The type of activity to be retrieved (e.g.,
-            'running', 'cycling').
         widgets (dict): A dictionary containing all the customtkinter widgets
             of the app.
+        events (queue.Queue): Queue filled by `run_job`.
+        include_tcx (bool): Whether TCX data was requested, used to build the
+            success message.
+        output_format (str): The selected output format, used to build the
+            success message.
     """
-    widgets["progress"].stop()
-    widgets["progress"]["mode"] = "determinate"
-    widgets["progress_text"].configure(text="")
-
-    if error:
-        if isinstance(error, GarminConnectAuthenticationError):
-            widgets["error_message"].configure(text=LOGIN_ERROR)
-        elif isinstance(error, GarminConnectTooManyRequestsError):
-            widgets["error_message"].configure(text=TOO_MANY_REQUESTS_ERROR)
-        else:
-            widgets["error_message"].configure(
-                text=f"Erreur inattendue: {str(error)}"
+    progress = None
+    while True:
+        try:
+            event = events.get_nowait()
+        except queue.Empty:
+            break
+
+        kind = event[0]
+        if kind != "progress" and progress:
+            draw_progress(widgets, *progress)
+            progress = None
+
+        if kind == "login":
+            widgets["progress"].stop()
+            widgets["progress"].configure(mode="determinate")
+            widgets["progress"].set(0)
+            widgets["progress_text"].configure(text="")
+
+        elif kind == "progress":
+            progress = event[1:]
+
+        elif kind == "done":
+            _, dump_path, dump_path_tcx = event
+            end_job(widgets)
+            if output_format == "Parquet":
+                message = SUCCESS_MSG_PARQUET + dump_path
+            else:
+                message = SUCCESS_MSG + dump_path
+            if include_tcx:
+                message += SUCCESS_MSG_TCX + dump_path_tcx
+            messagebox.showinfo("Succès", message)
+            return
+
+        elif kind == "cancelled":
+            widgets["error_message"].configure(text=CANCELLED_MSG)
+            end_job(widgets)
+            reset_interface(widgets)
+            return
+
+        elif kind == "error":
+            from garminconnect import (
+                GarminConnectAuthenticationError,
+                GarminConnectTooManyRequestsError,
             )
-        widgets["progress"].grid_forget()
-        widgets["progress_text"].grid_forget()
-        widgets["submit_button"].grid_configure(pady=(20, 60))
-        widgets["error_message"].grid(
-            sticky="ew", row=1, column=0, columnspan=3
-        )
-        return
 
-    include_tcx = dict(Oui=True, Non=False).get(widgets["switch_tcx"].get())
-
-    activities_data, tcx_data = get_activities(
-        api=api,
-        startdate=startdate,
-        enddate=enddate,
-        progressbar=widgets["progress"],
-        progresstext=widgets["progress_text"],
-        root=root,
-        activitytype=activity_type,
-        include_tcx=include_tcx,
+            error = event[1]
+            if isinstance(error, GarminConnectAuthenticationError):
+                widgets["error_message"].configure(text=LOGIN_ERROR)
+            elif isinstance(error, GarminConnectTooManyRequestsError):
+                widgets["error_message"].configure(
+                    text=TOO_MANY_REQUESTS_ERROR
+                )
+            else:
+                widgets["error_message"].configure(
+                    text=f"Erreur inattendue: {str(error)}"
+                )
+            end_job(widgets)
+            reset_interface(widgets)
+            return
+
+    if progress:
+        draw_progress(widgets, *progress)
+
+    root.after(
+        POLL_INTERVAL_MS,
+        poll_events,
+        root,
+        widgets,
+        events,
+        include_tcx,
+        output_format,
     )
 
-    dump_path = save_to_excel(activities_data, startdate, enddate)
-    dump_path_tcx = save_tcx_files(tcx_data)
 
-    if not include_tcx:
-        messagebox.showinfo("Succès", SUCCESS_MSG + dump_path)
-    else:
-        messagebox.showinfo(
-            "Succès", SUCCESS_MSG + dump_path + SUCCESS_MSG_TCX + dump_path_tcx
-        )
+def draw_progress(widgets: dict, message: str, done: int, total: int) -> None:
+    """Show the progress of the job.
+
+    Args:
+        widgets (dict): A dictionary containing all the customtkinter widgets
+            of the app.
+        message (str): The status message.
+        done (int): The number of processed activities.
+        total (int): The total number of activities.
+    """
+    widgets["progress_text"].configure(text=message)
+    widgets["progress"].set(min(done / total, 1.0) if total else 0)
+
+
+def end_job(widgets: dict) -> None:
+    """Restore the buttons once a job is finished, failed or cancelled.
+
+    Args:
+        widgets (dict): A dictionary containing all the customtkinter widgets
+            of the app.
+    """
+    widgets["progress"].stop()
+    widgets["progress"].configure(mode="determinate")
+    widgets["cancel_button"].grid_forget()
+    widgets["cancel_button"].configure(state="normal")
+    widgets["submit_button"].configure(state="normal")
+
+
+def cancel_job(widgets: dict, cancel_event: threading.Event) -> None:
+    """Ask the running job to stop.
+
+    Args:
+        widgets (dict): A dictionary containing all the customtkinter widgets
+            of the app.
+        cancel_event (threading.Event): Event checked by the worker thread.
+    """
+    cancel_event.set()
+    widgets["cancel_button"].configure(state="disabled")
+    widgets["progress_text"].configure(text=CANCELLING_MSG)
+
+
+def ask_resume_job(email: str, params: dict) -> dict:
+    """
+    Offer to resume the last interrupted job of an account, when its
+    parameters differ from the requested ones. A job with the same
+    parameters is resumed without asking. Jobs of the command line are
+    never offered, see `can_resume_job`.
+
+    Args:
+        email (str): The email address of the account.
+        params (dict): The parameters of the requested job, keyword
+            arguments of `run_job`.
+
+    Returns:
+        dict: The parameters of the interrupted job if the user chose to
+        resume it, `params` otherwise.
+    """
+    store = ActivityStore(get_store_path())
+    try:
+        jobs = [
+            (job_key, job_params)
+            for job_key, job_params in store.get_jobs(email)
+            if can_resume_job(job_params)
+        ]
+        if not jobs or any(job_params == params for _, job_params in jobs):
+            return params
+
+        job_key, job_params = jobs[0]
+        if messagebox.askyesno(
+            "Téléchargement interrompu", RESUME_JOB_MSG.format(**job_params)
+        ):
+            return job_params
+        store.delete_job(job_key)
+        return params
+    finally:
+        store.close()
 
 
 def submit(root: CTk, widgets: dict) -> None:
@@ -214,8 +571,9 @@ def submit(root: CTk, widgets: dict) -> None:
 
     This function first validates the input data, including checking email
     format, password presence, and date validity. If the inputs are valid, it
-    initiates a separate thread to call the API without blocking the GUI. The
-    progress and potential errors are reflected in the provided widgets.
+    starts a worker thread running the whole download and export job, and
+    polls the events it sends so that the GUI is never blocked. The progress
+    and potential errors are reflected in the provided widgets.
 
     Args:
         root (CTk): The main customtkinter window or top-level
@@ -241,6 +599,12 @@ def submit(root: CTk, widgets: dict) -> None:
     )
     selected_activity = widgets["activity_type_combobox"].get()
     activity_type = ACTIVITY_TYPES_MAPPING[selected_activity]
+    mode = widgets["switch_mode"].get()
+    sync = mode == DOWNLOAD_MODES[1]
+
+    # Synchronisation always goes up to today
+    if sync:
+        enddate = date.today().strftime("%Y-%m-%d")
 
     # Check if password is empty
     if not email:
@@ -270,35 +634,66 @@ def submit(root: CTk, widgets: dict) -> None:
         reset_interface(widgets)
         return
 
+    tcx_format = TCX_OPTIONS[widgets["switch_tcx"].get()]
+    include_tcx = tcx_format is not None
+    output_format = widgets["output_format"].get()
+
+    params = ask_resume_job(
+        email,
+        dict(
+            startdate=startdate,
+            enddate=enddate,
+            activity_type=activity_type,
+            include_tcx=include_tcx,
+            sync=sync,
+            output_format=output_format,
+            tcx_format=tcx_format or TCX_FORMATS[0],
+            columns=load_columns(),
+        ),
+    )
+
     widgets["error_message"].grid_forget()
 
     widgets["progress_text"].configure(text=CONNECTION_LOADING_MSG)
-    widgets["progress"]["mode"] = "indeterminate"
+    widgets["progress"].configure(mode="indeterminate")
     widgets["progress_text"].grid(
-        sticky="ew", row=14, column=0, columnspan=3, pady=(10, 0)
+        sticky="ew", row=17, column=0, columnspan=3, pady=(10, 0)
     )
     widgets["progress"].grid(
-        sticky="ew", row=15, column=0, columnspan=3, pady=(0, 50), padx=60
+        sticky="ew", row=18, column=0, columnspan=3, pady=(0, 10), padx=60
+    )
+    widgets["cancel_button"].grid(
+        sticky="ew", row=19, column=0, columnspan=3, pady=(0, 40), padx=60
     )
     widgets["submit_button"].grid_configure(pady=(30, 10))
+    widgets["submit_button"].configure(state="disabled")
 
     widgets["progress"].start()
     root.update_idletasks()
 
-    # Use threading to run the lengthy function without blocking the GUI
+    # Run the whole job in a worker thread, the GUI only polls its events
+    events = queue.Queue()
+    cancel_event = threading.Event()
+    widgets["cancel_button"].configure(
+        command=lambda: cancel_job(widgets, cancel_event)
+    )
+
     thread = threading.Thread(
-        target=init_api_and_followup,
-        args=(
-            root,
-            email,
-            password,
-            startdate,
-            enddate,
-            activity_type,
-            widgets,
-        ),
+        target=run_job,
+        args=(events, cancel_event, email, password),
+        kwargs=params,
+        daemon=True,
     )
     thread.start()
+    root.after(
+        POLL_INTERVAL_MS,
+        poll_events,
+        root,
+        widgets,
+        events,
+        params["include_tcx"],
+        params["output_format"],
+    )
 
     # If the request is successful, save settings for next request
-    save_settings(email, startdate, selected_activity)
+    save_settings(email, startdate, selected_activity, mode)
@@ -0,0 +1,452 @@
+import json
+import asyncio
+import threading
+import requests
+
+from typing import Any, Callable, Optional, Union
+from functools import partial
+from garminconnect import (
+    Garmin,
+    GarminConnectAuthenticationError,
+    GarminConnectConnectionError,
+    GarminConnectTooManyRequestsError,
+)
+
+from .api_utils import ActivitiesDownload
+from .tcx_utils import TcxArchive, TcxFolder, LocalHrZones
+from .store_utils import ActivityStore
+from .rate_utils import RequestGovernor
+from .metrics_utils import timed
+from .constants import (
+    ACTIVITIES_PAGE_SIZE,
+    MAX_CONCURRENT_REQUESTS,
+    TCX_FORMATS,
+)
+
+try:
+    import aiohttp
+except ImportError:  # optional, only needed by the async client
+    aiohttp = None
+
+
+class AsyncGarmin:
+    """
+    Async client of the Garmin Connect endpoints used by the application,
+    sharing the session of a logged in Garmin instance.
+
+    Requests go through a pool of keep-alive connections, and at most
+    `max_concurrency` of them are in flight at once. When the Garmin
+    instance is governed, see `init_api`, the requests are rate limited and
+    retried by the same RequestGovernor.
+
+    The client is used as an async context manager, which opens and closes
+    its connections.
+    """
+
+    def __init__(
+        self,
+        api: Garmin,
+        max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+        governor: Optional[RequestGovernor] = None,
+    ) -> None:
+        """
+        Args:
+            api (Garmin): Authenticated API session to the Garmin service,
+                whose cookies and headers are used by the client.
+            max_concurrency (int, optional): Maximum number of requests in
+                flight, and of pooled connections. Defaults to
+                MAX_CONCURRENT_REQUESTS.
+            governor (RequestGovernor, optional): Governor of the requests.
+                Defaults to the governor of `api`, if any.
+
+        Raises:
+            ImportError: If aiohttp is not installed.
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "The async client requires aiohttp: pip install aiohttp"
+            )
+
+        client = api.modern_rest_client
+        self.base_url = client.url()
+        self.headers = dict(client.headers)
+        self.cookies = requests.utils.dict_from_cookiejar(client.get_cookies())
+        self.activities_url = api.garmin_connect_activities
+        self.activity_url = api.garmin_connect_activity
+        self.tcx_download_url = api.garmin_connect_tcx_download
+
+        self.max_concurrency = max(1, max_concurrency)
+        self.governor = governor or getattr(api, "governor", None)
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self) -> "AsyncGarmin":
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        self._session = aiohttp.ClientSession(
+            headers=self.headers, cookies=self.cookies, connector=connector
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+
+    async def _fetch(
+        self, path: str, params: Optional[dict] = None, as_json: bool = True
+    ):
+        url = f"{self.base_url}/{path}"
+        async with self._semaphore:
+            try:
+                async with self._session.get(url, params=params) as response:
+                    if response.status < 400:
+                        body = await response.read()
+                        RequestGovernor.record_bytes(len(body))
+                        if not as_json:
+                            return body
+                        return json.loads(body) if body else None
+                    status = response.status
+            except aiohttp.ClientError as e:
+                raise GarminConnectConnectionError(
+                    f"Connection error: {url}"
+                ) from e
+
+        # Errors are those of garminconnect, with the HTTP status
+        if status == 429:
+            error = GarminConnectTooManyRequestsError(f"429: {url}")
+        elif status == 401:
+            error = GarminConnectAuthenticationError(f"401: {url}")
+        else:
+            error = GarminConnectConnectionError(f"{status}: {url}")
+        error.status = status
+        raise error
+
+    async def _get(
+        self,
+        endpoint: str,
+        path: str,
+        params: Optional[dict] = None,
+        as_json: bool = True,
+    ):
+        async def request():
+            return await self._fetch(path, params, as_json)
+
+        if self.governor is None:
+            return await request()
+        # Requests are recorded in the run metrics under the endpoint name,
+        # as those of the API methods of garminconnect
+        request.__name__ = endpoint
+        return await self.governor.call_async(request)
+
+    async def get_activities_by_date(
+        self, startdate: str, enddate: str, activitytype: str = ""
+    ) -> list:
+        """
+        Fetch the activities between two dates, page by page as
+        `Garmin.get_activities_by_date` does.
+
+        Args:
+            startdate (str): Start date in the format 'YYYY-MM-DD'.
+            enddate (str): End date in the format 'YYYY-MM-DD'.
+            activitytype (str, optional): Type of the activities. Defaults
+                to all types.
+
+        Returns:
+            list: The activities, as JSON payloads.
+        """
+        params = {
+            "startDate": str(startdate),
+            "endDate": str(enddate),
+            "limit": str(ACTIVITIES_PAGE_SIZE),
+        }
+        if activitytype:
+            params["activityType"] = str(activitytype)
+
+        activities = []
+        while True:
+            params["start"] = str(len(activities))
+            page = await self._get(
+                "get_activities_by_date", self.activities_url, dict(params)
+            )
+            if not page:
+                return activities
+            activities.extend(page)
+
+    async def get_activity_evaluation(self, activity_id: int) -> dict:
+        """Fetch the self evaluation details of an activity."""
+        return await self._get(
+            "get_activity_evaluation", f"{self.activity_url}/{activity_id}"
+        )
+
+    async def get_activity_hr_in_timezones(self, activity_id: int) -> list:
+        """Fetch the time spent in each HR zone during an activity."""
+        return await self._get(
+            "get_activity_hr_in_timezones",
+            f"{self.activity_url}/{activity_id}/hrTimeInZones",
+        )
+
+    async def download_activity(self, activity_id: int) -> bytes:
+        """Download the TCX file of an activity."""
+        return await self._get(
+            "download_activity",
+            f"{self.tcx_download_url}/{activity_id}",
+            as_json=False,
+        )
+
+
+async def fetch_tcx_file_async(
+    client: AsyncGarmin,
+    activity_id: int,
+    tcx_writer: Union[TcxFolder, TcxArchive],
+    store: Optional[ActivityStore] = None,
+) -> tuple:
+    """
+    Async version of `fetch_tcx_file`, the store is read and written and
+    the file is written in threads.
+    """
+    stored_size = None
+    if store:
+        stored_size = await asyncio.to_thread(
+            store.get_payload_size, activity_id, "tcx"
+        )
+
+    # Files are written atomically, an existing file is complete
+    if tcx_writer.contains(activity_id, stored_size):
+        return tcx_writer.path_of(activity_id), None
+
+    tcx_bytes = None
+    if stored_size is not None:
+        tcx_bytes = await asyncio.to_thread(
+            store.get_payload, activity_id, "tcx"
+        )
+    if tcx_bytes is None:
+        tcx_bytes = await client.download_activity(activity_id)
+        if store:
+            await asyncio.to_thread(
+                store.save_payload, activity_id, "tcx", tcx_bytes
+            )
+
+    tcx_path = await asyncio.to_thread(
+        tcx_writer.write, activity_id, tcx_bytes
+    )
+    return tcx_path, tcx_bytes
+
+
+async def fetch_activity_details_async(
+    client: AsyncGarmin,
+    activity_id: int,
+    tcx_writer: Optional[Union[TcxFolder, TcxArchive]] = None,
+    store: Optional[ActivityStore] = None,
+    activity_type: str = "",
+    local_hr_zones: Optional[LocalHrZones] = None,
+    evaluation: bool = True,
+    hr_zones: bool = True,
+    job_key: Optional[str] = None,
+) -> tuple:
+    """
+    Async version of `fetch_activity_details`, the evaluation, TCX file and
+    HR zones of an activity are fetched concurrently. The store is read and
+    written and the HR zones are computed from the TCX file in threads.
+    """
+    summary_dto, hrz_data = (None, None)
+    if store and evaluation:
+        summary_dto = await asyncio.to_thread(
+            store.get_payload, activity_id, "evaluation", job_key
+        )
+    if store and hr_zones:
+        hrz_data = await asyncio.to_thread(
+            store.get_payload, activity_id, "hr_zones", job_key
+        )
+    if local_hr_zones and hrz_data is not None:
+        local_hr_zones.learn(activity_type, hrz_data)
+
+    async def fetch_evaluation() -> Optional[dict]:
+        if not evaluation:
+            return None
+        if summary_dto is not None:
+            return summary_dto
+        details_data = await client.get_activity_evaluation(activity_id)
+        dto = details_data.get("summaryDTO", {})
+        if store:
+            await asyncio.to_thread(
+                store.save_payload, activity_id, "evaluation", dto, job_key
+            )
+        return dto
+
+    async def fetch_tcx_and_hr_zones() -> tuple:
+        tcx_path, tcx_bytes, zones = (None, None, hrz_data)
+        if tcx_writer:
+            tcx_path, tcx_bytes = await fetch_tcx_file_async(
+                client, activity_id, tcx_writer, store
+            )
+
+        # Computed HR zones are estimates, they are not saved to the store
+        if local_hr_zones and zones is None and tcx_path:
+            if tcx_bytes is None:
+                tcx_bytes = partial(tcx_writer.read, activity_id)
+            zones = await asyncio.to_thread(
+                local_hr_zones.compute, activity_type, tcx_bytes
+            )
+
+        if zones is None and hr_zones:
+            zones = await client.get_activity_hr_in_timezones(activity_id)
+            if store:
+                await asyncio.to_thread(
+                    store.save_payload,
+                    activity_id,
+                    "hr_zones",
+                    zones,
+                    job_key,
+                )
+            if local_hr_zones:
+                local_hr_zones.learn(activity_type, zones)
+        return tcx_path, zones
+
+    dto, (tcx_path, hrz_data) = await asyncio.gather(
+        fetch_evaluation(), fetch_tcx_and_hr_zones()
+    )
+    details_data = None if dto is None else {"summaryDTO": dto}
+    return details_data, hrz_data, tcx_path
+
+
+@timed("fetch")
+async def get_activities_async(
+    api: Garmin,
+    startdate: str,
+    enddate: str,
+    activitytype: str = "",
+    include_tcx: bool = False,
+    tcx_format: str = TCX_FORMATS[0],
+    local_hr_zones: bool = False,
+    max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+    progress_callback: Optional[Callable[[str, int, int], None]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    store: Optional[ActivityStore] = None,
+    newer_than: Optional[dict] = None,
+    job_key: Optional[str] = None,
+    columns: Optional[list] = None,
+) -> tuple:
+    """
+    Get activities data like `get_activities`, with the async client.
+
+    All the requests of the download, activities lists of the date windows
+    included, are made from a single thread through the pooled connections
+    of an `AsyncGarmin` client. The results are assembled and processed as
+    in `get_activities`.
+
+    Args:
+        api (Garmin): Authenticated API session to the Garmin service.
+        startdate (str): Start date in the format 'YYYY-MM-DD'.
+        enddate (str): End date in the format 'YYYY-MM-DD'.
+        activitytype (str, optional): Type of activity to filter. Defaults
+            to an empty string, implying all activity types are fetched.
+        include_tcx (bool, optional): Whether tcx data should be downloaded
+            along with activities data. Defaults to False.
+        tcx_format (str, optional): How the TCX files are written, one of
+            TCX_FORMATS. Defaults to plain files.
+        local_hr_zones (bool, optional): Whether the HR zones are computed
+            from the TCX files. Defaults to False.
+        max_concurrency (int, optional): Maximum number of requests in
+            flight. Defaults to MAX_CONCURRENT_REQUESTS.
+        progress_callback (Callable, optional): Called with a status message,
+            the number of processed activities and the total number of
+            activities each time the download progresses. Defaults to None.
+        cancel_event (threading.Event, optional): When set, the download is
+            stopped and FetchCancelledError is raised. Defaults to None.
+        store (ActivityStore, optional): Local store used to skip the
+            per-activity downloads already done. Defaults to None.
+        newer_than (dict, optional): Watermark of the last synced activity.
+            Only activities started after it are kept. Defaults to None.
+        job_key (str, optional): Key of the job in the store, to checkpoint
+            the download and resume it if it was interrupted. Defaults to
+            None.
+        columns (list, optional): The exported columns, see
+            `get_activities`. Defaults to all the columns.
+
+    Returns:
+        tuple: A DataFrame containing the activities data, and the paths to
+        the TCX files by activity ID (empty if `include_tcx` is False).
+
+    Raises:
+        FetchCancelledError: If `cancel_event` is set during the download.
+        ImportError: If aiohttp is not installed.
+    """
+
+    download = ActivitiesDownload(
+        startdate,
+        enddate,
+        include_tcx=include_tcx,
+        tcx_format=tcx_format,
+        local_hr_zones=local_hr_zones,
+        progress_callback=progress_callback,
+        cancel_event=cancel_event,
+        store=store,
+        newer_than=newer_than,
+        job_key=job_key,
+        columns=columns,
+    )
+
+    async def call_download(method: Callable, *args) -> Any:
+        # The download reads and writes the store, it is then called in a
+        # thread to keep the event loop running
+        if download.store:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def list_window(client: AsyncGarmin, window: tuple) -> list:
+        stored = await call_download(download.get_window, window)
+        if stored is not None:
+            return stored
+        return await client.get_activities_by_date(*window, activitytype)
+
+    async def fetch_all(client: AsyncGarmin) -> None:
+        # Tasks are put on the queue once done, see `get_activities`
+        completed = asyncio.Queue()
+        window_tasks, details_tasks = ({}, {})
+        try:
+            for idx, window in enumerate(download.windows):
+                task = asyncio.create_task(list_window(client, window))
+                task.add_done_callback(completed.put_nowait)
+                window_tasks[task] = idx
+            pending_count = len(window_tasks)
+            while pending_count:
+                task = await completed.get()
+                pending_count -= 1
+                download.check_cancelled()
+                if task in window_tasks:
+                    # The activities list is released once ingested
+                    window_idx = window_tasks.pop(task)
+                    details_args = await call_download(
+                        download.add_window, window_idx, task.result()
+                    )
+                    for args in details_args:
+                        details_task = asyncio.create_task(
+                            fetch_activity_details_async(client, *args)
+                        )
+                        details_tasks[details_task] = (window_idx, args[0])
+                        details_task.add_done_callback(completed.put_nowait)
+                        pending_count += 1
+                    continue
+
+                await call_download(
+                    download.add_details,
+                    *details_tasks.pop(task),
+                    task.result(),
+                )
+        finally:
+            # Pending requests are dropped if the download stopped early
+            pending = [
+                task
+                for task in [*window_tasks, *details_tasks]
+                if not task.done()
+            ]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    try:
+        async with AsyncGarmin(api, max_concurrency) as client:
+            await fetch_all(client)
+    finally:
+        download.close()
+
+    return download.finish()
@@ -1,6 +1,34 @@
 import os
 import sys
+import json
+import uuid
+import hashlib
+import logging
 import pathlib
+import tempfile
+
+from typing import TYPE_CHECKING, Iterable, Optional
+from datetime import datetime
+
+from .metrics_utils import timed
+from .constants import (
+    ACTIVITY_DATA_MAPPING,
+    DATA_DIR,
+    EVALUATION_COLUMNS,
+    HR_ZONE_COLUMN,
+    HR_ZONES_COUNT,
+    PARQUET_FOLDER,
+    SESSIONS_DIR,
+    COLUMNS_FILENAME,
+    REPORTS_DIR,
+    SELECTABLE_COLUMNS,
+    STORE_FILENAME,
+    SYNC_STATE_FILENAME,
+    TCX_FOLDER,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 def days_in_month(month: int, year: int) -> int:
@@ -29,7 +57,115 @@ def days_in_month(month: int, year: int) -> int:
         raise ValueError("Invalid month")
 
 
-def save_settings(email: str, start_date: str, activity_type: str) -> None:
+def get_data_dir() -> str:
+    """
+    Return the folder of the user's home directory where the application
+    keeps its local data, creating it if needed.
+
+    Returns:
+        str: Path to the application data folder.
+    """
+    path = os.path.join(pathlib.Path.home(), DATA_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_store_path() -> str:
+    """
+    Return the path of the local activities store.
+
+    Returns:
+        str: Path to the SQLite file of the activities store.
+    """
+    return os.path.join(get_data_dir(), STORE_FILENAME)
+
+
+def get_report_path() -> str:
+    """
+    Return the path of the metrics report of a run starting now.
+
+    Returns:
+        str: Path to the JSON report, in the reports folder of the
+        application data folder.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(get_data_dir(), REPORTS_DIR, f"run-{timestamp}.json")
+
+
+def get_session_path(email: str) -> str:
+    """
+    Return the path of the saved Garmin Connect session of an account.
+
+    The file name is derived from a hash of the email so that the account
+    does not appear in clear in the data folder.
+
+    Args:
+        email (str): The email address of the account.
+
+    Returns:
+        str: Path to the session file of the account.
+    """
+    sessions_dir = os.path.join(get_data_dir(), SESSIONS_DIR)
+    os.makedirs(sessions_dir, mode=0o700, exist_ok=True)
+    digest = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+    return os.path.join(sessions_dir, f"{digest}.json")
+
+
+def get_job_key(email: str, params: dict) -> str:
+    """
+    Return the key of an export job in the activities store.
+
+    Jobs of the same account with the same parameters share their key, so
+    that running an interrupted job again resumes it.
+
+    Args:
+        email (str): The email address of the account.
+        params (dict): JSON serializable parameters of the job.
+
+    Returns:
+        str: The key of the job.
+    """
+    job = json.dumps([email.strip().lower(), params], sort_keys=True)
+    return hashlib.sha256(job.encode()).hexdigest()
+
+
+def save_session(email: str, session_data: dict) -> None:
+    """
+    Save the session cookies of an account, readable by the user only.
+
+    Args:
+        email (str): The email address of the account.
+        session_data (dict): The `session_data` of a logged in Garmin
+            instance.
+    """
+    path = get_session_path(email)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(session_data, f)
+    # The mode of os.open is ignored if the file already existed
+    os.chmod(path, 0o600)
+
+
+def load_session(email: str) -> Optional[dict]:
+    """
+    Load the session cookies saved for an account.
+
+    Args:
+        email (str): The email address of the account.
+
+    Returns:
+        dict or None: The saved session data, or None if there is none.
+    """
+    try:
+        with open(get_session_path(email), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_settings(
+    email: str, start_date: str, activity_type: str, mode: str
+) -> None:
     """
     Save the settings to a file in the user's home directory.
 
@@ -37,12 +173,14 @@ def save_settings(email: str, start_date: str, activity_type: str) -> None:
         email (str): The email address.
         start_date (str): The start date in the 'YYYY-MM-DD' format.
         activity_type (str): The type of activity.
+        mode (str): The download mode, 'Période' or 'Synchronisation'.
     """
     path = os.path.join(pathlib.Path.home(), "settings-garmin-download.txt")
     with open(path, "w") as f:
         f.write(email + "\n")
         f.write(start_date + "\n")
-        f.write(activity_type)
+        f.write(activity_type + "\n")
+        f.write(mode)
 
 
 def load_settings() -> tuple:
@@ -51,8 +189,8 @@ def load_settings() -> tuple:
 
     Returns:
         tuple: A tuple containing email (str), start_date (str or None),
-        and activity_type (str or None). If the file does not exist, all
-        values in the tuple are None.
+        activity_type (str or None) and mode (str or None). If the file does
+        not exist, all values in the tuple are None.
     """
     try:
         path = os.path.join(
@@ -63,72 +201,354 @@ def load_settings() -> tuple:
             email = lines[0].strip()
             start_date = lines[1].strip() if len(lines) > 1 else None
             activity_type = lines[2].strip() if len(lines) > 2 else None
-            return email, start_date, activity_type
+            mode = lines[3].strip() if len(lines) > 3 else None
+            return email, start_date, activity_type, mode
     except FileNotFoundError:
-        return None, None, None
+        return None, None, None, None
+
+
+def save_watermark(email: str, activity_type: str, watermark: dict) -> None:
+    """
+    Save the last synced activity of an account for the synchronisation mode.
+
+    Args:
+        email (str): The email address of the account.
+        activity_type (str): The type of activity that was synced.
+        watermark (dict): The 'start_time_local' and 'activity_id' of the
+            newest exported activity, and the 'export_path' of the export.
+    """
+    path = os.path.join(get_data_dir(), SYNC_STATE_FILENAME)
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+
+    state.setdefault(email, {})[activity_type] = watermark
+
+    with open(path, "w") as f:
+        json.dump(state, f, indent=2)
+
+
+def load_watermark(email: str, activity_type: str) -> Optional[dict]:
+    """
+    Load the last synced activity of an account for the synchronisation mode.
+
+    Args:
+        email (str): The email address of the account.
+        activity_type (str): The type of activity that was synced.
+
+    Returns:
+        dict or None: The watermark saved by `save_watermark`, or None if the
+        account was never synced for this activity type.
+    """
+    path = os.path.join(get_data_dir(), SYNC_STATE_FILENAME)
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    return state.get(email, {}).get(activity_type)
+
+
+def save_columns(columns: Optional[list]) -> None:
+    """
+    Save the columns selected for the exports.
+
+    Args:
+        columns (list or None): The selected columns, among
+            SELECTABLE_COLUMNS, or None to export all the columns.
+    """
+    path = os.path.join(get_data_dir(), COLUMNS_FILENAME)
+    if columns is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+
+    with open(path, "w") as f:
+        json.dump(columns, f, indent=2, ensure_ascii=False)
 
 
-def save_to_excel(data, startdate, enddate):
+def load_columns() -> Optional[list]:
+    """
+    Load the columns selected for the exports.
+
+    Returns:
+        list or None: The selected columns saved by `save_columns`, without
+        the unknown ones, or None if all the columns are exported.
+    """
+    path = os.path.join(get_data_dir(), COLUMNS_FILENAME)
+    try:
+        with open(path, "r") as f:
+            columns = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    return [column for column in columns if column in SELECTABLE_COLUMNS]
+
+
+def load_export(path: str) -> "pd.DataFrame":
+    """Load a file previously written by `save_to_excel` or `save_to_csv`.
+
+    Args:
+        path (str): Path to the Excel or CSV file.
+
+    Returns:
+        DataFrame: Processed activities data.
+    """
+    import pandas as pd
+
+    from .data_utils import parse_activities_data
+
+    if path.endswith(".csv"):
+        data = pd.read_csv(path)
+    else:
+        data = pd.read_excel(path)
+
+    return parse_activities_data(data)
+
+
+def get_output_dir() -> str:
+    """
+    Return the folder where the exports are saved: next to the executable
+    for a bundled application, in the package folder otherwise.
+
+    Returns:
+        str: Path to the output folder.
+    """
+    if getattr(sys, "frozen", False):
+        # we are running in a bundle
+        return os.path.dirname(sys.executable)
+    # we are running in a normal Python environment
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def write_excel_rows(dump_path: str, columns: list, rows: Iterable) -> None:
+    """Stream rows to an Excel file using openpyxl's write-only mode.
+
+    Rows are written as they are consumed from `rows`, without building the
+    whole worksheet in memory, so `rows` can be a generator producing them
+    on the fly.
+
+    Args:
+        dump_path (str): Path of the Excel file to write.
+        columns (list): Column headers.
+        rows (Iterable): Rows of values, in the order of `columns`.
+    """
+    # openpyxl is slow to import and pulls in Pillow when it is installed,
+    # it is only loaded when an Excel file is written
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+    from openpyxl.cell import WriteOnlyCell
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+
+    header = []
+    for column in columns:
+        cell = WriteOnlyCell(sheet, value=column)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+
+    for row in rows:
+        sheet.append(row)
+
+    workbook.save(dump_path)
+
+
+@timed("save_excel")
+def save_to_excel(data, startdate, enddate, dump_path=None):
     """Save a DataFrame to an Excel file.
 
+    The rows are formatted for display by `iter_formatted_rows` as they are
+    streamed to the file with `write_excel_rows`.
+
     Args:
-        data (DataFrame): DataFrame containing activities data.
+        data (DataFrame): DataFrame containing processed activities data.
         startdate (str): Startdate 'YYYY-MM-DD' formatted.
         enddate (str): Enddate 'YYYY-MM-DD' formatted.
+        dump_path (str, optional): Path of the file to write, used to update
+            an existing export. Defaults to a file named after the dates.
 
     Returns:
         str: Path to the saved file.
     """
+    from .data_utils import iter_formatted_rows
 
-    output_file = f"activities_{startdate}_to_{enddate}"
+    if dump_path is None:
+        output_file = f"activities_{startdate}_to_{enddate}"
+        dump_path = os.path.join(get_output_dir(), f"{output_file}.xlsx")
 
-    if getattr(sys, "frozen", False):
-        # we are running in a bundle
-        bundle_dir = os.path.dirname(sys.executable)
-    else:
-        # we are running in a normal Python environment
-        bundle_dir = os.path.dirname(os.path.abspath(__file__))
+    write_excel_rows(dump_path, list(data.columns), iter_formatted_rows(data))
 
-    dump_path = os.path.join(bundle_dir, f"{output_file}.xlsx")
+    return dump_path
 
-    data.to_excel(dump_path, index=False)
 
-    return dump_path
+@timed("save_csv")
+def save_to_csv(data, startdate, enddate, dump_path=None):
+    """Save a DataFrame to a CSV file.
 
+    Args:
+        data (DataFrame): DataFrame containing activities data.
+        startdate (str): Startdate 'YYYY-MM-DD' formatted.
+        enddate (str): Enddate 'YYYY-MM-DD' formatted.
+        dump_path (str, optional): Path of the file to write, used to update
+            an existing export. Defaults to a file named after the dates.
 
-def save_tcx_files(tcx_data: dict) -> str:
+    Returns:
+        str: Path to the saved file.
     """
-    Save TCX byte data to .tcx files in the 'tcx_data' folder.
+    if dump_path is None:
+        output_file = f"activities_{startdate}_to_{enddate}"
+        dump_path = os.path.join(get_output_dir(), f"{output_file}.csv")
+
+    data.to_csv(dump_path, index=False)
+
+    return dump_path
+
 
-    This function determines the running environment (bundled application
-    or normal Python environment) and sets the save path accordingly. Each
-    TCX entry in the dictionary is saved as a separate file named by its
-    activity ID.
+@timed("save_parquet")
+def save_to_parquet(data, dataset_dir=None):
+    """Add activities to a Parquet dataset partitioned by year and month.
+
+    The dataset is made of `year=YYYY/month=MM` folders. Activities are
+    appended to their partition in a new file, existing files are never
+    rewritten: activities already present in a partition are skipped.
+
+    Every file is written with all the columns an export can have, those
+    not in `data` being left empty, so that the files of exports of other
+    columns share the schema of the dataset. Activities without a date
+    cannot be partitioned and are skipped.
 
     Args:
-        tcx_data (dict): A dictionary with activity IDs as keys and TCX byte
-            data as values.
+        data (DataFrame): DataFrame containing activities data.
+        dataset_dir (str, optional): Path of the dataset folder. Defaults to
+            the 'activities_parquet' folder.
 
     Returns:
-        str: The path to the 'tcx_data' folder where the files were saved.
+        str: Path to the dataset folder.
     """
-    output_folder = "tcx_data"
+    import pandas as pd
 
-    if getattr(sys, "frozen", False):
-        # we are running in a bundle
-        bundle_dir = os.path.dirname(sys.executable)
-    else:
-        # we are running in a normal Python environment
-        bundle_dir = os.path.dirname(os.path.abspath(__file__))
+    from .data_utils import cast_column
+
+    id_col = "Identifiant Garmin de l'activité"
+    if dataset_dir is None:
+        dataset_dir = os.path.join(get_output_dir(), PARQUET_FOLDER)
+
+    missing_dates = data["Date"].isna()
+    if missing_dates.any():
+        logging.warning(
+            f"{missing_dates.sum()} activities without a date are not saved"
+        )
+        data = data[~missing_dates]
+
+    # Empty columns are typed as in processed activities data
+    columns = list(
+        dict.fromkeys(
+            [
+                *ACTIVITY_DATA_MAPPING.values(),
+                *EVALUATION_COLUMNS,
+                *(HR_ZONE_COLUMN.format(i + 1) for i in range(HR_ZONES_COUNT)),
+                *data.columns,
+            ]
+        )
+    )
+    empty = pd.Series(None, index=data.index, dtype=object)
+    data = pd.DataFrame(
+        {
+            column: (
+                data[column]
+                if column in data.columns
+                else cast_column(column, empty)
+            )
+            for column in columns
+        },
+        index=data.index,
+    )
 
-    # Create the directory if it doesn't exist
-    os.makedirs(os.path.join(bundle_dir, output_folder), exist_ok=True)
+    dates = data["Date"]
 
-    for activity_id, byte_data in tcx_data.items():
-        dump_path = os.path.join(
-            bundle_dir, output_folder, f"{activity_id}.tcx"
+    for (year, month), partition in data.groupby(
+        [dates.dt.year, dates.dt.month]
+    ):
+        partition_dir = os.path.join(
+            dataset_dir, f"year={year}", f"month={month:02d}"
         )
-        with open(dump_path, "wb") as file:
-            file.write(byte_data)
 
-    return os.path.join(bundle_dir, output_folder)
+        if os.path.isdir(partition_dir):
+            existing_ids = pd.read_parquet(partition_dir, columns=[id_col])
+            partition = partition[
+                ~partition[id_col].isin(existing_ids[id_col])
+            ]
+            if partition.empty:
+                continue
+
+        os.makedirs(partition_dir, exist_ok=True)
+        partition.to_parquet(
+            os.path.join(partition_dir, f"part-{uuid.uuid4().hex}.parquet"),
+            index=False,
+        )
+
+    return dataset_dir
+
+
+def save_activities(data, output_format, startdate, enddate, dump_path=None):
+    """Save a DataFrame in the selected output format.
+
+    Args:
+        data (DataFrame): DataFrame containing activities data.
+        output_format (str): One of 'Excel', 'CSV' or 'Parquet'.
+        startdate (str): Startdate 'YYYY-MM-DD' formatted.
+        enddate (str): Enddate 'YYYY-MM-DD' formatted.
+        dump_path (str, optional): Path of the file to write, or of the
+            dataset folder for Parquet. Defaults to a file named after the
+            dates, or to the 'activities_parquet' folder.
+
+    Returns:
+        str: Path to the saved file, or dataset folder for Parquet.
+    """
+    if output_format == "Parquet":
+        return save_to_parquet(data, dataset_dir=dump_path)
+    if output_format == "CSV":
+        return save_to_csv(data, startdate, enddate, dump_path=dump_path)
+    return save_to_excel(data, startdate, enddate, dump_path=dump_path)
+
+
+def get_tcx_dir() -> str:
+    """
+    Return the 'tcx_data' folder where the TCX files are saved, creating it
+    if needed.
+
+    Returns:
+        str: Path to the TCX folder.
+    """
+    tcx_dir = os.path.join(get_output_dir(), TCX_FOLDER)
+    os.makedirs(tcx_dir, exist_ok=True)
+    return tcx_dir
+
+
+def save_tcx_file(dump_path: str, tcx_bytes: bytes) -> None:
+    """
+    Write a TCX file atomically.
+
+    The bytes are written to a temporary file of the same folder, which is
+    then renamed: an existing file is always complete, even if the
+    application stopped while writing it.
+
+    Args:
+        dump_path (str): Path of the TCX file.
+        tcx_bytes (bytes): Content of the TCX file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(dump_path), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(tcx_bytes)
+        os.replace(tmp_path, dump_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
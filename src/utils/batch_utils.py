@@ -0,0 +1,317 @@
+import os
+import re
+import csv
+import logging
+import pandas as pd
+
+from typing import Callable, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .api_utils import init_api, get_activities
+from .base_utils import get_output_dir, save_activities
+from .store_utils import ActivityStore
+from .rate_utils import RequestGovernor
+from .constants import (
+    ATHLETE_COLUMN,
+    BATCH_FOLDER,
+    MAX_ACCOUNTS,
+    MAX_WORKERS,
+    OUTPUT_FORMATS,
+    TCX_FORMATS,
+)
+
+OUTPUT_EXTENSIONS = {"Excel": ".xlsx", "CSV": ".csv", "Parquet": "_parquet"}
+
+
+def load_accounts(path: str) -> list:
+    """
+    Read the accounts of a batch export from a CSV file.
+
+    The file has an `email` column, and optional `password` and `athlete`
+    columns. The password can be left empty for an account whose session
+    was saved by a previous run. The athlete defaults to the email.
+
+    Args:
+        path (str): Path to the CSV file.
+
+    Returns:
+        list: The accounts, as dicts with 'email', 'password' and 'athlete'
+        keys.
+
+    Raises:
+        ValueError: If the file has no email column, an invalid email or
+            twice the same athlete.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        if "email" not in (reader.fieldnames or []):
+            raise ValueError(f"{path} has no 'email' column")
+
+        accounts = []
+        for row in reader:
+            email = (row.get("email") or "").strip()
+            if not email:
+                continue
+            if "@" not in email:
+                raise ValueError(f"Invalid email in {path}: {email}")
+            accounts.append({
+                "email": email,
+                "password": row.get("password") or "",
+                "athlete": (row.get("athlete") or "").strip() or email,
+            })
+
+    athletes = [account["athlete"] for account in accounts]
+    duplicates = sorted(
+        {athlete for athlete in athletes if athletes.count(athlete) > 1}
+    )
+    if duplicates:
+        raise ValueError(f"Duplicate athletes in {path}: {duplicates}")
+
+    return accounts
+
+
+def get_batch_dir(startdate: str, enddate: str) -> str:
+    """
+    Return the folder of the exports of a batch, creating it if needed.
+
+    Args:
+        startdate (str): Startdate 'YYYY-MM-DD' formatted.
+        enddate (str): Enddate 'YYYY-MM-DD' formatted.
+
+    Returns:
+        str: Path to the batch folder.
+    """
+    batch_dir = os.path.join(
+        get_output_dir(), BATCH_FOLDER, f"{startdate}_to_{enddate}"
+    )
+    os.makedirs(batch_dir, exist_ok=True)
+    return batch_dir
+
+
+def get_athlete_filename(athlete: str) -> str:
+    """
+    Turn an athlete name into a file name.
+
+    Args:
+        athlete (str): The athlete name, or email.
+
+    Returns:
+        str: The name, with the characters other than letters, digits, '.',
+        '-' and '@' replaced by '_'.
+    """
+    return re.sub(r"[^\w.@-]+", "_", athlete).strip("._") or "athlete"
+
+
+def export_account(
+    account: dict,
+    governor: RequestGovernor,
+    store: ActivityStore,
+    startdate: str,
+    enddate: str,
+    activity_type: str = "",
+    output_format: str = OUTPUT_FORMATS[0],
+    include_tcx: bool = False,
+    tcx_format: str = TCX_FORMATS[0],
+    local_hr_zones: bool = False,
+    max_workers: int = MAX_WORKERS,
+    progress_callback: Optional[Callable[[str, int, int], None]] = None,
+    columns: Optional[list] = None,
+) -> tuple:
+    """
+    Log in to an account, download its activities and save them in the
+    batch folder.
+
+    Args:
+        account (dict): The account, as returned by `load_accounts`.
+        governor (RequestGovernor): Governor shared by all the accounts.
+        store (ActivityStore): Local store shared by all the accounts.
+        startdate (str): Start date in the format 'YYYY-MM-DD'.
+        enddate (str): End date in the format 'YYYY-MM-DD'.
+        activity_type (str, optional): Type of the activities. Defaults to
+            all types.
+        output_format (str, optional): One of 'Excel', 'CSV' or 'Parquet'.
+            Defaults to 'Excel'.
+        include_tcx (bool, optional): Whether the TCX files are downloaded
+            as well. Defaults to False.
+        tcx_format (str, optional): How the TCX files are written, 'tcx' or
+            'gzip'. Defaults to 'tcx'.
+        local_hr_zones (bool, optional): Whether the HR zones are computed
+            from the TCX files, see `get_activities`. Defaults to False.
+        max_workers (int, optional): Maximum number of activities of the
+            account fetched concurrently. Defaults to MAX_WORKERS.
+        progress_callback (Callable, optional): Progress callback of
+            `get_activities`. Defaults to None.
+        columns (list, optional): The exported columns, see
+            `get_activities`. Defaults to all the columns.
+
+    Returns:
+        tuple: The activities data of the account (DataFrame) and the path
+        to its export (str).
+    """
+    api = init_api(
+        email=account["email"],
+        password=account["password"],
+        governor=governor,
+    )
+    activities_data, _ = get_activities(
+        api=api,
+        startdate=startdate,
+        enddate=enddate,
+        activitytype=activity_type,
+        include_tcx=include_tcx,
+        tcx_format=tcx_format,
+        local_hr_zones=local_hr_zones,
+        max_workers=max_workers,
+        progress_callback=progress_callback,
+        store=store,
+        columns=columns,
+    )
+
+    filename = get_athlete_filename(account["athlete"])
+    dump_path = save_activities(
+        activities_data,
+        output_format,
+        startdate,
+        enddate,
+        dump_path=os.path.join(
+            get_batch_dir(startdate, enddate),
+            filename + OUTPUT_EXTENSIONS[output_format],
+        ),
+    )
+    return activities_data, dump_path
+
+
+def run_batch(
+    accounts: list,
+    store: ActivityStore,
+    startdate: str,
+    enddate: str,
+    activity_type: str = "",
+    output_format: str = OUTPUT_FORMATS[0],
+    include_tcx: bool = False,
+    tcx_format: str = TCX_FORMATS[0],
+    local_hr_zones: bool = False,
+    max_accounts: int = MAX_ACCOUNTS,
+    max_workers: int = MAX_WORKERS,
+    progress_callback: Optional[Callable[[str, str, int, int], None]] = None,
+    columns: Optional[list] = None,
+) -> tuple:
+    """
+    Export the activities of several accounts concurrently.
+
+    Each account is exported by `export_account` to its own file of the
+    batch folder, then the activities of all the exported accounts are
+    saved together, with an athlete column, to a combined export. All the
+    requests share a single RequestGovernor, so the rate limit applies to
+    the batch as a whole, and the saved sessions are used when they are
+    still valid. An account that fails does not stop the others.
+
+    TCX files of all the accounts are written to the same folder, the zip
+    archive format is not supported as the accounts would write to the
+    same archive.
+
+    Args:
+        accounts (list): The accounts, as returned by `load_accounts`.
+        store (ActivityStore): Local store shared by all the accounts.
+        startdate (str): Start date in the format 'YYYY-MM-DD'.
+        enddate (str): End date in the format 'YYYY-MM-DD'.
+        activity_type (str, optional): Type of the activities. Defaults to
+            all types.
+        output_format (str, optional): One of 'Excel', 'CSV' or 'Parquet'.
+            Defaults to 'Excel'.
+        include_tcx (bool, optional): Whether the TCX files are downloaded
+            as well. Defaults to False.
+        tcx_format (str, optional): How the TCX files are written, 'tcx' or
+            'gzip'. Defaults to 'tcx'.
+        local_hr_zones (bool, optional): Whether the HR zones are computed
+            from the TCX files, see `get_activities`. Defaults to False.
+        max_accounts (int, optional): Maximum number of accounts exported
+            concurrently. Defaults to MAX_ACCOUNTS.
+        max_workers (int, optional): Maximum number of activities fetched
+            concurrently per account. Defaults to MAX_WORKERS.
+        progress_callback (Callable, optional): Called with the athlete and
+            the arguments of the progress callback of `get_activities`.
+            Defaults to None.
+        columns (list, optional): The exported columns, see
+            `get_activities`. Defaults to all the columns.
+
+    Returns:
+        tuple: The export paths by athlete (dict), the errors by athlete of
+        the accounts that failed (dict), and the path to the combined
+        export (str or None if no account was exported).
+
+    Raises:
+        ValueError: If `tcx_format` is 'zip' while TCX files are requested.
+    """
+    if include_tcx and tcx_format == "zip":
+        raise ValueError("The zip TCX format is not supported in batch mode")
+
+    def account_progress(athlete: str) -> Optional[Callable]:
+        if progress_callback is None:
+            return None
+        return lambda message, done, total: progress_callback(
+            athlete, message, done, total
+        )
+
+    governor = RequestGovernor()
+    dump_paths, errors, athletes_data = {}, {}, {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_accounts)) as executor:
+        futures = {
+            executor.submit(
+                export_account,
+                account,
+                governor,
+                store,
+                startdate,
+                enddate,
+                activity_type,
+                output_format,
+                include_tcx,
+                tcx_format,
+                local_hr_zones,
+                max_workers,
+                account_progress(account["athlete"]),
+                columns,
+            ): account["athlete"]
+            for account in accounts
+        }
+        for future in as_completed(futures):
+            athlete = futures[future]
+            try:
+                activities_data, dump_path = future.result()
+            except Exception as e:
+                logging.error(f"Export of {athlete} failed: {e}")
+                errors[athlete] = e
+                continue
+            athletes_data[athlete] = activities_data
+            dump_paths[athlete] = dump_path
+
+    if not athletes_data:
+        return dump_paths, errors, None
+
+    # Athletes are combined in the order of the accounts list
+    combined_data = pd.concat(
+        [
+            athletes_data[account["athlete"]].assign(
+                **{ATHLETE_COLUMN: account["athlete"]}
+            )
+            for account in accounts
+            if account["athlete"] in athletes_data
+        ],
+        ignore_index=True,
+    )
+    combined_data.insert(0, ATHLETE_COLUMN, combined_data.pop(ATHLETE_COLUMN))
+
+    combined_path = save_activities(
+        combined_data,
+        output_format,
+        startdate,
+        enddate,
+        dump_path=os.path.join(
+            get_batch_dir(startdate, enddate),
+            # Athlete file names never start with '_'
+            "_all_athletes" + OUTPUT_EXTENSIONS[output_format],
+        ),
+    )
+    return dump_paths, errors, combined_path
@@ -79,6 +79,55 @@ ACTIVITY_DATA_MAPPING = {
 
 }
 
+TRAINING_EFFECT_MAPPING = {
+    "RECOVERY": "Récupération",
+    "TEMPO": "Tempo",
+    "AEROBIC_BASE": "Base",
+    "LACTATE_THRESHOLD": "Seuil",
+    "VO2MAX": "VO2 Max",
+}  # "UNKNOWN" and other labels are left empty
+
+FEEL_MAPPING = {
+    0: "Très faible",
+    25: "Faible",
+    50: "Normal(e)",
+    75: "Fort(e)",
+    100: "Très fort(e)",
+}
+
+# Column types of the processed activities data, other columns are numeric
+INTEGER_COLUMNS = [
+    "Identifiant Garmin de l'activité",
+    "Identifiant Garmin de l'appareil",
+    "Effort perçu",
+]
+BOOLEAN_COLUMNS = ["Favori", "Présence d'un RP (Record personnel)"]
+CATEGORY_COLUMNS = {
+    "Avantage principal Training Effect": list(
+        TRAINING_EFFECT_MAPPING.values()
+    ),
+    "Comment vous êtes-vous senti ?": list(FEEL_MAPPING.values()),
+}
+TEXT_COLUMNS = ["Titre", "Ensemble d'exercices de musculation résumé"]
+SPEED_COLUMNS = [
+    "Allure moyenne (km/h)",
+    "Allure maximale (km/h)",
+    "Allure moyenne en déplacement (km/h)",
+]  # given in m/s by the API
+
+# Columns fetched with the evaluation of each activity
+EVALUATION_COLUMNS = ["Comment vous êtes-vous senti ?", "Effort perçu"]
+HR_ZONE_COLUMN = "Temps en Zone de FC {} (sec)"  # one column per HR zone
+HR_ZONES_COLUMNS = "Temps en Zones de FC (sec)"  # all the HR zones columns
+HR_ZONES_COUNT = 5  # number of HR zones of Garmin Connect
+# Columns always exported, whatever the selected columns
+REQUIRED_COLUMNS = ["Identifiant Garmin de l'activité", "Date"]
+SELECTABLE_COLUMNS = [
+    column
+    for column in dict.fromkeys(ACTIVITY_DATA_MAPPING.values())
+    if column not in REQUIRED_COLUMNS
+] + EVALUATION_COLUMNS + [HR_ZONES_COLUMNS]
+
 ACTIVITY_TYPES_MAPPING = {
     "Toutes activités": "",
     "Course": "running",
@@ -93,15 +142,66 @@ ACTIVITY_TYPES_MAPPING = {
     "Autre": "other",
 }
 
+# Settings
+MAX_WORKERS = 4  # maximum number of activities fetched concurrently
+MAX_CONCURRENT_REQUESTS = 16  # maximum requests in flight, async client
+ACTIVITIES_PAGE_SIZE = 20  # activities per page of the activities list
+POLL_INTERVAL_MS = 100  # period at which the GUI reads the job events
+PROGRESS_MAX_RATE = 10  # maximum progress reports per second
+ACTIVITIES_CAPACITY = 1024  # initial rows of the activities columns
+DATA_DIR = ".garmin-download"  # local data folder, in the home directory
+STORE_FILENAME = "activities.sqlite"  # local store of downloaded payloads
+# Evaluation and HR zones downloaded earlier after an activity are refreshed
+PAYLOADS_SETTLE_DAYS = 7
+SESSIONS_DIR = "sessions"  # saved Garmin Connect sessions, per account
+SYNC_STATE_FILENAME = "sync-state.json"  # last synced activity per account
+COLUMNS_FILENAME = "columns.json"  # columns selected for the exports
+REPORTS_DIR = "reports"  # metrics reports of the runs, in the data folder
+
+DOWNLOAD_MODES = ["Période", "Synchronisation"]
+OUTPUT_FORMATS = ["Excel", "CSV", "Parquet"]
+PARQUET_FOLDER = "activities_parquet"  # partitioned Parquet dataset
+TCX_FOLDER = "tcx_data"  # TCX files, one per activity
+TCX_ARCHIVE = "tcx_data.zip"  # TCX files in a single zip archive
+TCX_FORMATS = ["tcx", "gzip", "zip"]  # plain, gzip compressed or zip files
+TCX_OPTIONS = {"Non": None, "Oui": "tcx", "Gzip": "gzip", "Zip": "zip"}
+MAX_TRACKPOINT_GAP = 60  # longest gap counted in the local HR zones, in s
+
+# Batch exports of several accounts
+MAX_ACCOUNTS = 4  # maximum number of accounts exported concurrently
+BATCH_FOLDER = "batch"  # exports of a batch, in the output folder
+ATHLETE_COLUMN = "Athlète"  # column of the combined dataset of a batch
+
+# Rate limiting of the requests to Garmin Connect
+RATE_LIMIT = 5.0  # initial number of requests per second
+MIN_RATE_LIMIT = 0.2  # lowest rate, reached after repeated throttling
+MAX_RATE_LIMIT = 20.0  # highest rate, reached after many successes
+RATE_INCREASE = 0.05  # relative rate increase after each success
+MAX_RETRIES = 5  # retries of a throttled or failed request
+BACKOFF_BASE = 1.0  # first retry delay, in seconds, doubled each retry
+BACKOFF_MAX = 60.0  # longest retry delay, in seconds
+# Upper bounds of the latency histograms of the run reports, in seconds
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
 # Messages
 CONNECTION_LOADING_MSG = "Connexion à l'API Garmin en cours ..."
+CANCELLING_MSG = "Annulation du téléchargement en cours ..."
+CANCELLED_MSG = "Téléchargement annulé."
 SUCCESS_MSG = (
     "Activités téléchargées avec succès.\n\n"
     + "Le fichier est déposé au chemin suivant :\n\n"
 )
+SUCCESS_MSG_PARQUET = (
+    "Activités téléchargées avec succès.\n\n"
+    + "Le jeu de données Parquet est mis à jour au chemin suivant :\n\n"
+)
 SUCCESS_MSG_TCX = (
     "\n\n Les traces TCX sont déposées au chemin suivant :\n\n"
 )
+RESUME_JOB_MSG = (
+    "Le téléchargement des activités du {startdate} au {enddate} a été "
+    "interrompu.\n\nVoulez-vous le reprendre là où il s'est arrêté ?"
+)
 
 # Errors
 AMS_ERROR = "averageMovingSpeed (Allure moyenne en déplacement) not found for activity: "
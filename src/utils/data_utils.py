@@ -1,5 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from .metrics_utils import timed
+from .constants import (
+    BOOLEAN_COLUMNS,
+    CATEGORY_COLUMNS,
+    FEEL_MAPPING,
+    INTEGER_COLUMNS,
+    SPEED_COLUMNS,
+    TEXT_COLUMNS,
+    TRAINING_EFFECT_MAPPING,
+)
+
+
+def to_float_array(values):
+    """Convert values to a nullable float array, missing if not numeric.
+
+    Builds the array from a float64 buffer and its NaN mask, which is much
+    faster than `astype("Float64")`.
+
+    Args:
+        values (Series): Values to convert.
+
+    Returns:
+        FloatingArray: Converted values.
+    """
+    values = pd.to_numeric(values, errors="coerce").to_numpy(
+        dtype="float64", na_value=np.nan
+    )
+    return pd.arrays.FloatingArray(values, np.isnan(values))
+
+
+def to_integer_array(values):
+    """Convert values to a nullable integer array, missing if not numeric.
+
+    Args:
+        values (Series): Values to convert, fractional parts are dropped.
+
+    Returns:
+        IntegerArray: Converted values.
+    """
+    # Nullable integers, e.g. read back from an export, are already typed
+    if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) and (
+        pd.api.types.is_integer_dtype(values.dtype)
+    ):
+        return values.array.astype("Int64")
+
+    values = pd.to_numeric(values, errors="coerce")
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in "iu":
+        values = values.to_numpy(dtype="int64")
+        return pd.arrays.IntegerArray(values, np.zeros(len(values), bool))
+
+    mask = values.isna().to_numpy()
+    values = values.to_numpy(dtype="float64", na_value=np.nan)
+    return pd.arrays.IntegerArray(
+        np.where(mask, 0, values).astype("int64"), mask
+    )
+
+
+def cast_column(column, values):
+    """Cast a column of activities data to its type.
+
+    Dates are datetime64, identifiers and perceived effort are nullable
+    integers, flags are nullable booleans, labels are categoricals, texts are
+    strings and every other column is a nullable float. Empty strings and
+    unknown values become missing values.
+
+    Args:
+        column (str): Name of the column.
+        values (Series): Values of the column.
+
+    Returns:
+        Series: Typed values.
+    """
+    if column == "Date":
+        return pd.to_datetime(values, errors="coerce")
+    if column in INTEGER_COLUMNS:
+        return pd.Series(to_integer_array(values), index=values.index)
+    if column in BOOLEAN_COLUMNS:
+        values = values.map(
+            {True: True, False: False, "Oui": True, "Non": False}
+        )
+        return values.astype("boolean")
+    if column in CATEGORY_COLUMNS:
+        return values.astype(pd.CategoricalDtype(CATEGORY_COLUMNS[column]))
+    if column in TEXT_COLUMNS:
+        return values.where(values != "").astype("string")
+    return pd.Series(to_float_array(values), index=values.index)
+
+
+@timed("processing")
 def process_activities_data(data):
-    """Process and order the activities data.
+    """Process the activities data into typed columns.
+
+    Garmin codes are translated into their labels as categoricals, speeds
+    are converted to km/h and perceived effort to a 1-10 scale. Missing
+    values are kept as missing values: formatting for display is done at
+    export time by `format_activities_data`.
 
     Args:
         data (DataFrame): DataFrame containing raw activities data.
@@ -7,67 +104,170 @@ def process_activities_data(data):
     Returns:
         DataFrame: Processed activities data.
     """
-    data["Identifiant Garmin de l'activité"] = data[
-        "Identifiant Garmin de l'activité"
-    ].astype(str)
-    data["Identifiant Garmin de l'appareil"] = data[
-        "Identifiant Garmin de l'appareil"
-    ].astype(str)
-
-    data["Avantage principal Training Effect"] = data[
-        "Avantage principal Training Effect"
-    ].map(
-        {
-            'RECOVERY': "Récupération",
-            "TEMPO": "Tempo",
-            "AEROBIC_BASE": "Base",
-            "LACTATE_THRESHOLD": "Seuil",
-            "UNKNOWN": "",
-            "VO2MAX": "VO2 Max",
-        }
-    )
-    if "Comment vous êtes-vous senti ?" in data.columns:
-        data["Comment vous êtes-vous senti ?"] = data[
-            "Comment vous êtes-vous senti ?"
-        ].map(
-            {
-                0: "Très faible",
-                25: "Faible",
-                50: "Normal(e)",
-                75: "Fort(e)",
-                100: "Très fort(e)",
-            }
-        )
+    processed = {}
+
+    for column in data.columns:
+        values = data[column]
+
+        if column == "Avantage principal Training Effect":
+            values = pd.Categorical(
+                values, categories=list(TRAINING_EFFECT_MAPPING)
+            ).rename_categories(list(TRAINING_EFFECT_MAPPING.values()))
+            values = pd.Series(values, index=data.index)
+        elif column == "Comment vous êtes-vous senti ?":
+            values = pd.Categorical(
+                pd.to_numeric(values, errors="coerce"),
+                categories=list(FEEL_MAPPING),
+            ).rename_categories(list(FEEL_MAPPING.values()))
+            values = pd.Series(values, index=data.index)
+        elif column == "Effort perçu":
+            values = np.trunc(pd.to_numeric(values, errors="coerce") / 10)
+        elif column in SPEED_COLUMNS:
+            values = pd.to_numeric(values, errors="coerce") * 3.6
+
+        processed[column] = cast_column(column, values)
+
+    return pd.DataFrame(processed, index=data.index)
 
-    if "Effort perçu" in data.columns:
-        data["Effort perçu"] = (
-            (data["Effort perçu"].replace({"": -10}) / 10)
-            .fillna(-1)
-            .astype(int)
-            .astype(str)
-            .replace(str(-1), "")
-        )
 
-    data["Favori"] = (
-        data["Favori"]
-        .astype(str)
-        .str.lower()
-        .replace({"true": "Oui", "false": "Non"})
+def format_activities_data(data):
+    """Format processed activities data for display, as in the Excel export.
+
+    Identifiers and perceived effort become strings, flags become
+    "Oui"/"Non", dates are written as 'YYYY-MM-DD HH:MM:SS' and missing
+    values become empty strings.
+
+    Args:
+        data (DataFrame): Processed activities data.
+
+    Returns:
+        DataFrame: Formatted activities data.
+    """
+    formatted = {}
+
+    for column in data.columns:
+        values = data[column]
+        missing = values.isna()
+
+        if column == "Date":
+            values = values.dt.strftime("%Y-%m-%d %H:%M:%S")
+        elif column in INTEGER_COLUMNS:
+            values = values.astype("string")
+        elif column in BOOLEAN_COLUMNS:
+            values = values.map({True: "Oui", False: "Non"})
+
+        formatted[column] = values.astype(object).mask(missing, "")
+
+    return pd.DataFrame(formatted, index=data.index)
+
+
+def _value_formatter(column):
+    if column == "Date":
+        return lambda value: value.strftime("%Y-%m-%d %H:%M:%S")
+    if column in INTEGER_COLUMNS:
+        return str
+    if column in BOOLEAN_COLUMNS:
+        return {True: "Oui", False: "Non"}.__getitem__
+    return None
+
+
+def iter_formatted_rows(data):
+    """Iterate over the rows of processed activities data formatted for
+    display, as by `format_activities_data`.
+
+    Each row is formatted when it is consumed, without building a formatted
+    copy of the data.
+
+    Args:
+        data (DataFrame): Processed activities data.
+
+    Returns:
+        Iterator: Tuples of formatted values, in the order of the columns.
+    """
+
+    def format_column(values, missing, formatter):
+        for value, is_missing in zip(values, missing):
+            if is_missing:
+                yield ""
+            elif formatter is None:
+                yield value
+            else:
+                yield formatter(value)
+
+    return zip(
+        *(
+            format_column(
+                data[column],
+                data[column].isna().to_numpy(),
+                _value_formatter(column),
+            )
+            for column in data.columns
+        )
     )
-    data["Présence d'un RP (Record personnel)"] = (
-        data["Présence d'un RP (Record personnel)"]
-        .astype(str)
-        .str.lower()
-        .replace({"true": "Oui", "false": "Non"})
+
+
+def parse_activities_data(data):
+    """Cast activities data read back from an export to typed columns.
+
+    Args:
+        data (DataFrame): Activities data as written by an Excel or CSV
+            export.
+
+    Returns:
+        DataFrame: Processed activities data.
+    """
+    return pd.DataFrame(
+        {column: cast_column(column, data[column]) for column in data},
+        index=data.index,
     )
-    data["Allure moyenne (km/h)"] = data["Allure moyenne (km/h)"] * 3.6
-    data["Allure maximale (km/h)"] = data["Allure maximale (km/h)"] * 3.6
 
-    if "Allure moyenne en déplacement (km/h)" in data.columns:
-        data["Allure moyenne en déplacement (km/h)"] = (
-            data["Allure moyenne en déplacement (km/h)"] * 3.6
-        )
 
-    data = data.fillna("")
+def merge_activities_data(new_data, existing_data):
+    """Merge newly downloaded activities into previously exported ones.
+
+    Activities present in both frames are taken from `new_data`. New
+    activities come first, as in the order returned by the Garmin API, and
+    columns missing from one of the frames are left empty.
+
+    Args:
+        new_data (DataFrame): Processed data of the new activities.
+        existing_data (DataFrame): Processed data of the exported activities.
+
+    Returns:
+        DataFrame: Merged activities data.
+    """
+    id_col = "Identifiant Garmin de l'activité"
+
+    columns = list(existing_data.columns) + [
+        col for col in new_data.columns if col not in existing_data.columns
+    ]
+    data = pd.concat([new_data, existing_data], ignore_index=True)
+    data = data.drop_duplicates(subset=id_col, keep="first")
+    data = parse_activities_data(data.reindex(columns=columns))
+
+    return data.reset_index(drop=True)
+
+
+def get_watermark(data):
+    """Return the newest activity of processed activities data.
+
+    Args:
+        data (DataFrame): Processed activities data.
+
+    Returns:
+        dict or None: The 'start_time_local' and 'activity_id' of the newest
+        activity, or None if no activity has both a date and an identifier.
+    """
+    id_col = "Identifiant Garmin de l'activité"
+    # Edited or partially failed exports may miss dates or identifiers
+    data = data.dropna(subset=["Date", id_col])
+    if data.empty:
+        return None
+
+    ids = data[id_col].astype("int64")
+    newest_date, newest_id = max(zip(data["Date"], ids))
 
-    return data
+    return {
+        "start_time_local": newest_date.strftime("%Y-%m-%d %H:%M:%S"),
+        "activity_id": int(newest_id),
+    }
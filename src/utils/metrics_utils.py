@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import bisect
+import inspect
+import functools
+import threading
+import contextlib
+
+from typing import Any, Callable, Iterator, Optional
+from datetime import datetime
+
+from .constants import LATENCY_BUCKETS
+
+# Metrics of the run in progress, see `record_run`
+_active_metrics = None
+
+
+class Histogram:
+    """Count of the observed durations by bucket, with their count and sum."""
+
+    def __init__(self, buckets: list = LATENCY_BUCKETS) -> None:
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def to_dict(self) -> dict:
+        # Cumulative counts, as in the Prometheus histograms
+        cumulative, total = ({}, 0)
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            total += count
+            cumulative[str(bound)] = total
+        return {"count": self.count, "sum": self.sum, "buckets": cumulative}
+
+
+class RunMetrics:
+    """
+    Timings, call counts, retries and bytes received of an export run.
+
+    Requests to Garmin Connect are recorded by endpoint, under the name of
+    the API method, by the RequestGovernor. Steps of the run (login,
+    processing, saving) are recorded by the functions decorated with
+    `timed`. Both are recorded only while the run is active, see
+    `record_run`.
+
+    The metrics can be recorded from several threads.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = datetime.now()
+        self.activities = 0  # number of exported activities
+        self._start = time.perf_counter()
+        self._end = None
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._steps = {}
+
+    def observe_request(
+        self, endpoint: str, seconds: float, nbytes: int = 0, error=False
+    ) -> None:
+        """
+        Record a request to Garmin Connect.
+
+        Args:
+            endpoint (str): Name of the API method.
+            seconds (float): Duration of the request.
+            nbytes (int, optional): Size of the response body. Defaults to 0.
+            error (bool, optional): Whether the request failed. Defaults to
+                False.
+        """
+        with self._lock:
+            stats = self._requests.setdefault(endpoint, self._new_stats())
+            stats["histogram"].observe(seconds)
+            stats["bytes"] += nbytes
+            stats["errors"] += error
+
+    def count_retry(self, endpoint: str) -> None:
+        """Record the retry of a failed request to an endpoint."""
+        with self._lock:
+            stats = self._requests.setdefault(endpoint, self._new_stats())
+            stats["retries"] += 1
+
+    def count_activities(self, count: int) -> None:
+        """Record activities fetched by the run."""
+        with self._lock:
+            self.activities += count
+
+    def observe_step(self, step: str, seconds: float) -> None:
+        """Record the duration of a step of the run."""
+        with self._lock:
+            self._steps.setdefault(step, Histogram()).observe(seconds)
+
+    def finish(self) -> None:
+        """Stop the clock of the run."""
+        self._end = time.perf_counter()
+
+    @staticmethod
+    def _new_stats() -> dict:
+        return {
+            "histogram": Histogram(),
+            "errors": 0,
+            "retries": 0,
+            "bytes": 0,
+        }
+
+    def to_dict(self) -> dict:
+        """
+        Return the metrics as a JSON serializable dict.
+
+        Returns:
+            dict: The run duration and throughput, the requests by endpoint
+            and the steps, with their latency histograms in seconds.
+        """
+        duration = (self._end or time.perf_counter()) - self._start
+        with self._lock:
+            requests = {
+                endpoint: {
+                    **stats["histogram"].to_dict(),
+                    "errors": stats["errors"],
+                    "retries": stats["retries"],
+                    "bytes": stats["bytes"],
+                }
+                for endpoint, stats in sorted(self._requests.items())
+            }
+            steps = {
+                step: histogram.to_dict()
+                for step, histogram in sorted(self._steps.items())
+            }
+
+        calls = sum(stats["count"] for stats in requests.values())
+        calls_per_activity = None
+        if self.activities:
+            calls_per_activity = calls / self.activities
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration_seconds": duration,
+            "activities": self.activities,
+            "activities_per_second": self.activities / duration,
+            "calls": calls,
+            "calls_per_activity": calls_per_activity,
+            "requests": requests,
+            "steps": steps,
+        }
+
+    def to_prometheus(self) -> str:
+        """
+        Return the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, prefixed with 'garmin_fetch_'.
+        """
+        report = self.to_dict()
+        lines = [
+            "# TYPE garmin_fetch_run_duration_seconds gauge",
+            f"garmin_fetch_run_duration_seconds {report['duration_seconds']}",
+            "# TYPE garmin_fetch_activities gauge",
+            f"garmin_fetch_activities {report['activities']}",
+        ]
+
+        for kind, label in [("requests", "endpoint"), ("steps", "step")]:
+            name = f"garmin_fetch_{kind[:-1]}_duration_seconds"
+            lines.append(f"# TYPE {name} histogram")
+            for key, stats in report[kind].items():
+                for bound, count in stats["buckets"].items():
+                    lines.append(
+                        f'{name}_bucket{{{label}="{key}",le="{bound}"}} '
+                        f"{count}"
+                    )
+                lines.append(f'{name}_sum{{{label}="{key}"}} {stats["sum"]}')
+                lines.append(
+                    f'{name}_count{{{label}="{key}"}} {stats["count"]}'
+                )
+
+        for counter in ["errors", "retries", "bytes"]:
+            name = f"garmin_fetch_request_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            for endpoint, stats in report["requests"].items():
+                lines.append(
+                    f'{name}{{endpoint="{endpoint}"}} {stats[counter]}'
+                )
+
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path: str, prometheus: bool = False) -> str:
+        """
+        Write the metrics to a JSON file, and optionally to a Prometheus
+        text file next to it, with the '.prom' extension.
+
+        Args:
+            path (str): Path of the JSON file.
+            prometheus (bool, optional): Whether the Prometheus text file is
+                written as well. Defaults to False.
+
+        Returns:
+            str: Path to the JSON file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        if prometheus:
+            with open(os.path.splitext(path)[0] + ".prom", "w") as f:
+                f.write(self.to_prometheus())
+        return path
+
+
+@contextlib.contextmanager
+def record_run(metrics: RunMetrics) -> Iterator[RunMetrics]:
+    """
+    Record the requests and steps of all the threads to `metrics` within
+    the block, and stop the clock of the run at its end.
+
+    Args:
+        metrics (RunMetrics): The metrics of the run.
+    """
+    global _active_metrics
+    previous, _active_metrics = _active_metrics, metrics
+    try:
+        yield metrics
+    finally:
+        _active_metrics = previous
+        metrics.finish()
+
+
+def active_metrics() -> Optional[RunMetrics]:
+    """Return the metrics of the run in progress, if any."""
+    return _active_metrics
+
+
+def timed(step: str) -> Callable:
+    """
+    Decorator recording the duration of each call of a function as a step of
+    the run in progress.
+
+    Args:
+        step (str): Name of the step.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                metrics = _active_metrics
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    if metrics is not None:
+                        elapsed = time.perf_counter() - start
+                        metrics.observe_step(step, elapsed)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> Any:
+            metrics = _active_metrics
+            if metrics is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe_step(step, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
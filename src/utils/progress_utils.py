@@ -0,0 +1,115 @@
+import time
+
+from typing import Callable, Optional
+
+from .constants import PROGRESS_MAX_RATE
+
+PROGRESS_MSG = "Téléchargement des activités en cours ... "
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Format a duration for the progress messages.
+
+    Args:
+        seconds (float): The duration.
+
+    Returns:
+        str: The duration as 'H:MM:SS', or 'M:SS' under an hour.
+    """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class ProgressReporter:
+    """
+    Progress of an activities download, reported to a progress callback at
+    a bounded rate.
+
+    The reporter counts the processed activities exactly, and estimates the
+    throughput and the remaining time from the activities processed since
+    the first one. Whatever the rate of the updates, the callback is called
+    at most `max_rate` times per second, the status messages, such as the
+    end of the download, being always reported.
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[str, int, int], None]],
+        max_rate: float = PROGRESS_MAX_RATE,
+    ) -> None:
+        """
+        Args:
+            callback (Callable, optional): Called with a status message, the
+                number of processed activities and the total number of
+                activities. Nothing is reported when None.
+            max_rate (float, optional): Maximum number of progress reports
+                per second. Defaults to PROGRESS_MAX_RATE.
+        """
+        self.callback = callback
+        self.min_interval = 1 / max_rate if max_rate > 0 else 0.0
+        self.done = 0
+        self.total = 0
+        self._started_at = None
+        self._reported_at = None
+
+    def report(self, message: str, done: int, total: int) -> None:
+        """Report a status message, without rate limit."""
+        self._reported_at = time.monotonic()
+        if self.callback is not None:
+            self.callback(message, done, total)
+
+    def advance(self, total: int, count: int = 1) -> None:
+        """
+        Count processed activities, and report the progress unless it was
+        reported less than `1 / max_rate` seconds ago.
+
+        Args:
+            total (int): The total number of activities, which can grow
+                while the activities lists arrive.
+            count (int, optional): Number of processed activities. Defaults
+                to 1.
+        """
+        now = time.monotonic()
+        if self._started_at is None:
+            self._started_at = now
+        self.done += count
+        self.total = total
+
+        if (
+            self._reported_at is not None
+            and now - self._reported_at < self.min_interval
+        ):
+            return
+        self.report(self.message(now), self.done, self.total)
+
+    def throughput(self, now: Optional[float] = None) -> Optional[float]:
+        """Return the processed activities per second, if known yet."""
+        if self._started_at is None:
+            return None
+        elapsed = (now or time.monotonic()) - self._started_at
+        # The first activity starts the clock, it is not counted
+        if self.done < 2 or elapsed <= 0:
+            return None
+        return (self.done - 1) / elapsed
+
+    def eta(self, now: Optional[float] = None) -> Optional[float]:
+        """Return the estimated remaining time in seconds, if known yet."""
+        throughput = self.throughput(now)
+        if not throughput:
+            return None
+        return max(self.total - self.done, 0) / throughput
+
+    def message(self, now: Optional[float] = None) -> str:
+        """Return the progress message, with the throughput and ETA."""
+        text = PROGRESS_MSG + f"{self.done}/{self.total}"
+        throughput = self.throughput(now)
+        if throughput:
+            text += (
+                f" ({throughput:.1f} activités/s, reste "
+                f"{format_duration(self.eta(now))})"
+            )
+        return text
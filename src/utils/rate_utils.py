@@ -0,0 +1,300 @@
+import time
+import asyncio
+import random
+import logging
+import functools
+import threading
+import contextvars
+
+from typing import Any, Callable, Optional
+from garminconnect import (
+    Garmin,
+    GarminConnectConnectionError,
+    GarminConnectTooManyRequestsError,
+)
+
+from .metrics_utils import active_metrics
+from .constants import (
+    RATE_LIMIT,
+    MIN_RATE_LIMIT,
+    MAX_RATE_LIMIT,
+    RATE_INCREASE,
+    MAX_RETRIES,
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+)
+
+# Bytes received by the request in progress, for the run metrics
+_response_bytes = contextvars.ContextVar("response_bytes", default=0)
+
+
+class RequestGovernor:
+    """
+    Rate limiter and retry policy shared by all the calls to Garmin Connect.
+
+    Requests are spaced by a token bucket refilled at `rate` tokens per
+    second. A throttled (429) request halves the rate and pauses every
+    caller, the requests throttled during the pause not lowering it again,
+    while each successful request raises it by `RATE_INCREASE` of itself up
+    to `max_rate`, so that the rate converges to the highest one Garmin
+    accepts. Throttled, server (5xx) and connection errors are retried with
+    a jittered exponential backoff.
+
+    A single governor can be shared between threads and API instances.
+    """
+
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT,
+        min_rate: float = MIN_RATE_LIMIT,
+        max_rate: float = MAX_RATE_LIMIT,
+        max_retries: int = MAX_RETRIES,
+    ) -> None:
+        """
+        Args:
+            rate (float, optional): Initial number of requests per second.
+                Defaults to RATE_LIMIT.
+            min_rate (float, optional): Lowest rate reached when throttled.
+                Defaults to MIN_RATE_LIMIT.
+            max_rate (float, optional): Highest rate reached when requests
+                succeed. Defaults to MAX_RATE_LIMIT.
+            max_retries (int, optional): Number of retries of a failing
+                request before its error is raised. Defaults to MAX_RETRIES.
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+
+    def attach(self, api: Garmin) -> None:
+        """
+        Record the HTTP status of the responses received by an API instance.
+
+        garminconnect does not raise on server errors, the recorded status is
+        used to recognize them.
+
+        Args:
+            api (Garmin): The Garmin API instance.
+        """
+        api.session.hooks["response"].append(self._record_status)
+
+    def acquire(self) -> None:
+        """Block until a request is allowed by the token bucket."""
+        while True:
+            wait = self._take_token()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """Wait, without blocking the event loop, for a request to be
+        allowed by the token bucket."""
+        while True:
+            wait = self._take_token()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Call an API function, rate limited and retried on transient errors.
+
+        Args:
+            func (Callable): The API function.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            Any: The result of the function.
+        """
+        metrics = active_metrics()
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            self._local.status = None
+            _response_bytes.set(0)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if metrics:
+                    metrics.observe_request(
+                        func.__name__,
+                        time.perf_counter() - start,
+                        _response_bytes.get(),
+                        error=True,
+                    )
+                error_kind = self._classify(e)
+                if error_kind is None or attempt == self.max_retries:
+                    raise
+
+                delay = self._backoff(attempt)
+                if error_kind == "throttled":
+                    self._on_throttled(delay)
+                if metrics:
+                    metrics.count_retry(func.__name__)
+                logging.warning(
+                    f"{func.__name__} failed ({error_kind}), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+            else:
+                if metrics:
+                    metrics.observe_request(
+                        func.__name__,
+                        time.perf_counter() - start,
+                        _response_bytes.get(),
+                    )
+                self._on_success()
+                return result
+
+    async def call_async(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Await an async API function, rate limited and retried on transient
+        errors like `call`.
+
+        The HTTP status of a failed request is read from the `status`
+        attribute of its error, if any.
+
+        Args:
+            func (Callable): The async API function.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            Any: The result of the function.
+        """
+        metrics = active_metrics()
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async()
+            # Async requests do not record their status in the thread
+            self._local.status = None
+            _response_bytes.set(0)
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if metrics:
+                    metrics.observe_request(
+                        func.__name__, time.perf_counter() - start, error=True
+                    )
+                error_kind = self._classify(e, getattr(e, "status", None))
+                if error_kind is None or attempt == self.max_retries:
+                    raise
+
+                delay = self._backoff(attempt)
+                if error_kind == "throttled":
+                    self._on_throttled(delay)
+                if metrics:
+                    metrics.count_retry(func.__name__)
+                logging.warning(
+                    f"{func.__name__} failed ({error_kind}), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+            else:
+                if metrics:
+                    metrics.observe_request(
+                        func.__name__,
+                        time.perf_counter() - start,
+                        _response_bytes.get(),
+                    )
+                self._on_success()
+                return result
+
+    def _take_token(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._last_refill
+            self._tokens = min(1.0, self._tokens + elapsed * self.rate)
+            self._last_refill = now
+
+            wait = self._paused_until - now
+            if wait <= 0:
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return 0.0
+                wait = (1 - self._tokens) / self.rate
+            return wait
+
+    def _record_status(self, response, *args, **kwargs):
+        self._local.status = response.status_code
+        self.record_bytes(len(response.content))
+
+    @staticmethod
+    def record_bytes(nbytes: int) -> None:
+        """
+        Add the size of a response body to the bytes received by the request
+        in progress, as recorded in the run metrics.
+
+        Args:
+            nbytes (int): Size of the response body.
+        """
+        _response_bytes.set(_response_bytes.get() + nbytes)
+
+    def _classify(self, error: Exception, status: Optional[int] = None):
+        if status is None:
+            status = getattr(self._local, "status", None)
+        if isinstance(error, GarminConnectTooManyRequestsError):
+            return "throttled"
+        if status == 429:
+            return "throttled"
+        if status is not None and status >= 500:
+            return "server error"
+        if isinstance(error, GarminConnectConnectionError) and status is None:
+            return "connection error"
+        return None
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _on_throttled(self, delay: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            # The concurrent requests throttled by the same burst lower the
+            # rate once, during the pause started by the first of them
+            lowered = now >= self._paused_until
+            if lowered:
+                self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, now + delay)
+        if lowered:
+            logging.warning(f"Throttled, rate lowered to {self.rate:.2f}/s")
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate * (1 + RATE_INCREASE))
+
+
+class GovernedGarmin:
+    """
+    Wrapper of a Garmin API instance whose method calls all go through a
+    RequestGovernor. Other attributes are those of the wrapped instance.
+    """
+
+    def __init__(self, api: Garmin, governor: RequestGovernor) -> None:
+        """
+        Args:
+            api (Garmin): The Garmin API instance.
+            governor (RequestGovernor): The governor of the calls.
+        """
+        governor.attach(api)
+        self.api = api
+        self.governor = governor
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.api, name)
+        if not callable(attr) or isinstance(attr, type):
+            return attr
+
+        @functools.wraps(attr)
+        def governed(*args, **kwargs):
+            return self.governor.call(attr, *args, **kwargs)
+
+        return governed
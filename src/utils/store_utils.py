@@ -0,0 +1,370 @@
+import json
+import sqlite3
+import threading
+
+from typing import Any, Optional
+
+from .constants import PAYLOADS_SETTLE_DAYS
+
+
+# Payloads kept for each activity, JSON payloads are stored as text
+JSON_PAYLOADS = ("summary", "evaluation", "hr_zones")
+BYTES_PAYLOADS = ("tcx",)
+# Payloads the user can still change in Garmin Connect after the activity
+MUTABLE_PAYLOADS = ("evaluation", "hr_zones")
+
+
+class ActivityStore:
+    """
+    Local SQLite store of the payloads downloaded for each activity.
+
+    Every row is keyed by the Garmin `activityId` and holds the raw payload
+    returned by the activities list ("summary"), the evaluation `summaryDTO`
+    ("evaluation"), the HR zones payload ("hr_zones") and the TCX file
+    ("tcx"). A NULL column means the payload was never downloaded.
+
+    The evaluation and HR zones can still change after the activity, when
+    the user rates it in Garmin Connect for instance. They are only read
+    back from the store if they were downloaded at least `settle_days` after
+    the start of the activity, or by the job reading them, so that a resumed
+    job does not download them again. They are downloaded again otherwise.
+
+    The store also records the export jobs in progress, with the date
+    windows whose activities were all fetched, so that an interrupted job
+    can be resumed where it stopped.
+
+    The store can be shared between the threads fetching the activities.
+    """
+
+    def __init__(
+        self, path: str, settle_days: float = PAYLOADS_SETTLE_DAYS
+    ) -> None:
+        """
+        Open the store, creating the database file if needed.
+
+        Args:
+            path (str): Path of the SQLite database file.
+            settle_days (float, optional): Days after the start of an
+                activity from which its evaluation and HR zones are kept.
+                Defaults to PAYLOADS_SETTLE_DAYS.
+        """
+        self.path = path
+        self.settle_days = settle_days
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS activities (
+                activity_id INTEGER PRIMARY KEY,
+                start_time_local TEXT,
+                summary TEXT,
+                evaluation TEXT,
+                hr_zones TEXT,
+                tcx BLOB,
+                evaluation_fetched_at TEXT,
+                hr_zones_fetched_at TEXT,
+                evaluation_job_key TEXT,
+                hr_zones_job_key TEXT
+            )
+            """
+        )
+        # Stores created before the downloads of the mutable payloads were
+        # recorded
+        columns = {
+            row[1]
+            for row in self._connection.execute(
+                "PRAGMA table_info(activities)"
+            )
+        }
+        for name in MUTABLE_PAYLOADS:
+            for column in (f"{name}_fetched_at", f"{name}_job_key"):
+                if column not in columns:
+                    self._connection.execute(
+                        f"ALTER TABLE activities ADD COLUMN {column} TEXT"
+                    )
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_key TEXT PRIMARY KEY,
+                account TEXT,
+                params TEXT,
+                started_at TEXT
+            )
+            """
+        )
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_windows (
+                job_key TEXT,
+                startdate TEXT,
+                enddate TEXT,
+                activity_ids TEXT,
+                PRIMARY KEY (job_key, startdate, enddate)
+            )
+            """
+        )
+        self._connection.commit()
+
+    def get_payload(
+        self, activity_id: int, name: str, job_key: Optional[str] = None
+    ) -> Optional[Any]:
+        """
+        Return a stored payload of an activity.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+            name (str): One of 'summary', 'evaluation', 'hr_zones' or 'tcx'.
+            job_key (str, optional): Key of the job reading the payload, the
+                evaluation and HR zones it downloaded are returned even if
+                they may have changed since. Defaults to None.
+
+        Returns:
+            Any: The payload, or None if it was never stored or may have
+            changed since it was stored.
+        """
+        self._check_name(name)
+        query = f"SELECT {name} FROM activities WHERE activity_id = ?"
+        params = (activity_id,)
+        if name in MUTABLE_PAYLOADS:
+            # Payloads without a download or start date are not settled
+            query += (
+                f" AND (julianday({name}_fetched_at)"
+                f" - julianday(start_time_local) >= ? OR {name}_job_key = ?)"
+            )
+            params += (self.settle_days, job_key)
+        with self._lock:
+            row = self._connection.execute(query, params).fetchone()
+
+        if row is None or row[0] is None:
+            return None
+        if name in JSON_PAYLOADS:
+            return json.loads(row[0])
+        return bytes(row[0])
+
+    def get_payload_size(self, activity_id: int, name: str) -> Optional[int]:
+        """
+        Return the size of a stored payload without reading it.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+            name (str): One of 'summary', 'evaluation', 'hr_zones' or 'tcx'.
+
+        Returns:
+            int: The size of the payload in bytes, or None if it was never
+            stored.
+        """
+        self._check_name(name)
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT length(CAST({name} AS BLOB)) FROM activities "
+                "WHERE activity_id = ?",
+                (activity_id,),
+            ).fetchone()
+
+        if row is None:
+            return None
+        return row[0]
+
+    def save_payload(
+        self,
+        activity_id: int,
+        name: str,
+        value: Any,
+        job_key: Optional[str] = None,
+    ) -> None:
+        """
+        Store a payload of an activity, replacing any previous version.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+            name (str): One of 'summary', 'evaluation', 'hr_zones' or 'tcx'.
+            value (Any): JSON serializable payload, or bytes for 'tcx'.
+            job_key (str, optional): Key of the job downloading the payload,
+                see `get_payload`. Defaults to None.
+        """
+        self._check_name(name)
+        if name in JSON_PAYLOADS:
+            value = json.dumps(value)
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO activities (activity_id) VALUES (?)",
+                (activity_id,),
+            )
+            self._connection.execute(
+                f"UPDATE activities SET {name} = ? WHERE activity_id = ?",
+                (value, activity_id),
+            )
+            if name in MUTABLE_PAYLOADS:
+                self._connection.execute(
+                    f"UPDATE activities SET {name}_fetched_at = "
+                    f"datetime('now', 'localtime'), {name}_job_key = ? "
+                    "WHERE activity_id = ?",
+                    (job_key, activity_id),
+                )
+            self._connection.commit()
+
+    def save_summaries(self, activities: list) -> None:
+        """
+        Store the raw payloads returned by the activities list.
+
+        Args:
+            activities (list): Activities as returned by
+                `Garmin.get_activities_by_date`.
+        """
+        rows = [
+            (
+                activity["activityId"],
+                activity.get("startTimeLocal"),
+                json.dumps(activity),
+            )
+            for activity in activities
+        ]
+        with self._lock:
+            self._connection.executemany(
+                """
+                INSERT INTO activities (activity_id, start_time_local, summary)
+                VALUES (?, ?, ?)
+                ON CONFLICT (activity_id) DO UPDATE SET
+                    start_time_local = excluded.start_time_local,
+                    summary = excluded.summary
+                """,
+                rows,
+            )
+            self._connection.commit()
+
+    def get_summaries(self, activity_ids: list) -> Optional[list]:
+        """
+        Return the stored activities list payloads of several activities.
+
+        Args:
+            activity_ids (list): Garmin identifiers of the activities.
+
+        Returns:
+            list: The payloads, in the order of `activity_ids`, or None if
+            one of them was never stored.
+        """
+        summaries = {}
+        with self._lock:
+            # Ids are read by chunks, below the SQLite variables limit
+            for i in range(0, len(activity_ids), 500):
+                chunk = activity_ids[i:i + 500]
+                rows = self._connection.execute(
+                    "SELECT activity_id, summary FROM activities "
+                    f"WHERE activity_id IN ({', '.join('?' * len(chunk))}) "
+                    "AND summary IS NOT NULL",
+                    chunk,
+                ).fetchall()
+                summaries.update(rows)
+
+        if len(summaries) < len(set(activity_ids)):
+            return None
+        return [json.loads(summaries[i]) for i in activity_ids]
+
+    def save_job(self, job_key: str, account: str, params: dict) -> None:
+        """
+        Record an export job, so that it can be resumed if it is
+        interrupted. The date windows already recorded for the job are kept.
+
+        Args:
+            job_key (str): Key of the job, see `get_job_key`.
+            account (str): The email of the account.
+            params (dict): JSON serializable parameters of the job.
+        """
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT OR IGNORE INTO jobs
+                    (job_key, account, params, started_at)
+                VALUES (?, ?, ?, datetime('now'))
+                """,
+                (job_key, account, json.dumps(params)),
+            )
+            self._connection.commit()
+
+    def get_jobs(self, account: str) -> list:
+        """
+        Return the unfinished jobs of an account.
+
+        Args:
+            account (str): The email of the account.
+
+        Returns:
+            list: The key (str) and the parameters (dict) of each job, most
+            recent first.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT job_key, params FROM jobs WHERE account = ? "
+                "ORDER BY started_at DESC",
+                (account,),
+            ).fetchall()
+        return [(job_key, json.loads(params)) for job_key, params in rows]
+
+    def get_job_windows(self, job_key: str) -> dict:
+        """
+        Return the date windows of a job whose activities were all fetched.
+
+        Args:
+            job_key (str): Key of the job.
+
+        Returns:
+            dict: The activity ids (list) listed in each window, by first
+            and last day ('YYYY-MM-DD') of the window.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT startdate, enddate, activity_ids FROM job_windows "
+                "WHERE job_key = ?",
+                (job_key,),
+            ).fetchall()
+        return {
+            (startdate, enddate): json.loads(activity_ids)
+            for startdate, enddate, activity_ids in rows
+        }
+
+    def save_job_window(
+        self, job_key: str, startdate: str, enddate: str, activity_ids: list
+    ) -> None:
+        """
+        Record a date window of a job whose activities were all fetched.
+
+        Args:
+            job_key (str): Key of the job.
+            startdate (str): First day of the window, 'YYYY-MM-DD'.
+            enddate (str): Last day of the window, 'YYYY-MM-DD'.
+            activity_ids (list): Ids of the activities listed in the window,
+                in the order of the activities list.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO job_windows VALUES (?, ?, ?, ?)",
+                (job_key, startdate, enddate, json.dumps(activity_ids)),
+            )
+            self._connection.commit()
+
+    def delete_job(self, job_key: str) -> None:
+        """
+        Forget a finished or abandoned job and its date windows.
+
+        Args:
+            job_key (str): Key of the job.
+        """
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM job_windows WHERE job_key = ?", (job_key,)
+            )
+            self._connection.execute(
+                "DELETE FROM jobs WHERE job_key = ?", (job_key,)
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def _check_name(name: str) -> None:
+        if name not in JSON_PAYLOADS + BYTES_PAYLOADS:
+            raise ValueError(f"Unknown payload: {name}")
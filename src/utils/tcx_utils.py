@@ -0,0 +1,528 @@
+import io
+import os
+import gzip
+import shutil
+import logging
+import zipfile
+import threading
+import numpy as np
+
+from array import array
+from datetime import datetime, timezone
+from typing import BinaryIO, Callable, Optional, Union
+from xml.etree.ElementTree import ParseError, iterparse
+
+from .base_utils import get_output_dir, get_tcx_dir, save_tcx_file
+from .constants import MAX_TRACKPOINT_GAP, TCX_ARCHIVE, TCX_FORMATS
+
+
+class TcxFolder:
+    """
+    Writer of the TCX files in the 'tcx_data' folder, one file per activity.
+
+    Files are named `<activityId>.tcx`, or `<activityId>.tcx.gz` when they
+    are compressed. Compression is done by the threads calling `write`, so
+    that the downloads go on meanwhile. Files are written atomically, an
+    existing file is always complete.
+    """
+
+    def __init__(self, tcx_dir: str, compress: bool = False) -> None:
+        """
+        Args:
+            tcx_dir (str): Folder where the TCX files are written.
+            compress (bool, optional): Whether the files are gzip
+                compressed. Defaults to False.
+        """
+        self.path = tcx_dir
+        self.compress = compress
+
+    def path_of(self, activity_id: int) -> str:
+        """
+        Return the path of the TCX file of an activity.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+
+        Returns:
+            str: Path to the TCX file.
+        """
+        extension = ".tcx.gz" if self.compress else ".tcx"
+        return os.path.join(self.path, f"{activity_id}{extension}")
+
+    def contains(self, activity_id: int, size: Optional[int] = None) -> bool:
+        """
+        Return whether the TCX file of an activity was already written.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+            size (int, optional): Expected size of the uncompressed TCX, the
+                file is ignored if its size differs. Defaults to None.
+
+        Returns:
+            bool: Whether the file exists, with the expected size if any.
+        """
+        dump_path = self.path_of(activity_id)
+        if not os.path.exists(dump_path):
+            return False
+        if size is None:
+            return True
+
+        if not self.compress:
+            return os.path.getsize(dump_path) == size
+        # The last 4 bytes of a gzip file are the uncompressed size
+        with open(dump_path, "rb") as file:
+            file.seek(-4, os.SEEK_END)
+            isize = int.from_bytes(file.read(4), "little")
+        return isize == size % 2**32
+
+    def write(self, activity_id: int, tcx_bytes: bytes) -> str:
+        """
+        Write the TCX file of an activity.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+            tcx_bytes (bytes): Content of the TCX file.
+
+        Returns:
+            str: Path to the TCX file.
+        """
+        dump_path = self.path_of(activity_id)
+        if self.compress:
+            tcx_bytes = gzip.compress(tcx_bytes, compresslevel=6, mtime=0)
+        save_tcx_file(dump_path, tcx_bytes)
+        return dump_path
+
+    def read(self, activity_id: int) -> bytes:
+        """
+        Read the TCX file of an activity.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+
+        Returns:
+            bytes: Uncompressed content of the TCX file.
+        """
+        with open_tcx_file(self.path_of(activity_id)) as file:
+            return file.read()
+
+    def close(self) -> None:
+        """Nothing to do, files are complete once written."""
+
+
+class TcxArchive:
+    """
+    Writer of the TCX files in a single zip archive.
+
+    Entries are named `<activityId>.tcx` and deflate compressed by the
+    threads calling `write`, one at a time. The archive is built in a
+    temporary copy that replaces it when the writer is closed, so an
+    interrupted job never leaves a corrupted archive. Entries already in the
+    archive are kept.
+    """
+
+    def __init__(self, archive_path: str) -> None:
+        """
+        Open the archive, creating it if needed.
+
+        Args:
+            archive_path (str): Path of the zip archive.
+        """
+        self.path = archive_path
+        self._tmp_path = archive_path + ".tmp"
+        self._lock = threading.Lock()
+
+        if os.path.exists(archive_path):
+            shutil.copyfile(archive_path, self._tmp_path)
+            self._zip = zipfile.ZipFile(
+                self._tmp_path, "a", compression=zipfile.ZIP_DEFLATED
+            )
+        else:
+            self._zip = zipfile.ZipFile(
+                self._tmp_path, "w", compression=zipfile.ZIP_DEFLATED
+            )
+        self._sizes = {
+            info.filename: info.file_size for info in self._zip.infolist()
+        }
+
+    def path_of(self, activity_id: int) -> str:
+        """
+        Return the path of the TCX file of an activity, inside the archive.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+
+        Returns:
+            str: Path to the TCX file.
+        """
+        return os.path.join(self.path, f"{activity_id}.tcx")
+
+    def contains(self, activity_id: int, size: Optional[int] = None) -> bool:
+        """
+        Return whether the TCX file of an activity is in the archive.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+            size (int, optional): Expected size of the TCX, the entry is
+                ignored if its size differs. Defaults to None.
+
+        Returns:
+            bool: Whether the entry exists, with the expected size if any.
+        """
+        with self._lock:
+            entry_size = self._sizes.get(f"{activity_id}.tcx")
+        return entry_size is not None and size in (None, entry_size)
+
+    def write(self, activity_id: int, tcx_bytes: bytes) -> str:
+        """
+        Add the TCX file of an activity to the archive.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+            tcx_bytes (bytes): Content of the TCX file.
+
+        Returns:
+            str: Path to the TCX file, inside the archive.
+        """
+        name = f"{activity_id}.tcx"
+        with self._lock:
+            if name in self._sizes:
+                # zipfile cannot replace an entry, the archive is rebuilt
+                self._remove(name)
+            self._zip.writestr(name, tcx_bytes)
+            self._sizes[name] = len(tcx_bytes)
+        return self.path_of(activity_id)
+
+    def read(self, activity_id: int) -> bytes:
+        """
+        Read the TCX file of an activity, before the archive is written.
+
+        Args:
+            activity_id (int): Garmin identifier of the activity.
+
+        Returns:
+            bytes: Uncompressed content of the TCX file.
+        """
+        with self._lock:
+            return self._zip.read(f"{activity_id}.tcx")
+
+    def close(self) -> None:
+        """Write the archive, replacing the previous one."""
+        with self._lock:
+            self._zip.close()
+            os.replace(self._tmp_path, self.path)
+
+    def _remove(self, name: str) -> None:
+        rebuilt_path = self._tmp_path + ".rebuild"
+        with zipfile.ZipFile(
+            rebuilt_path, "w", compression=zipfile.ZIP_DEFLATED
+        ) as rebuilt:
+            for info in self._zip.infolist():
+                if info.filename != name:
+                    rebuilt.writestr(info, self._zip.read(info))
+        self._zip.close()
+        os.replace(rebuilt_path, self._tmp_path)
+        self._zip = zipfile.ZipFile(
+            self._tmp_path, "a", compression=zipfile.ZIP_DEFLATED
+        )
+        del self._sizes[name]
+
+
+def get_tcx_output_path(tcx_format: str) -> str:
+    """
+    Return where the TCX files are saved for an output format.
+
+    Args:
+        tcx_format (str): One of TCX_FORMATS: 'tcx', 'gzip' or 'zip'.
+
+    Returns:
+        str: Path to the 'tcx_data' folder, or to the zip archive.
+    """
+    if tcx_format == "zip":
+        return os.path.join(get_output_dir(), TCX_ARCHIVE)
+    return get_tcx_dir()
+
+
+def open_tcx_writer(tcx_format: str):
+    """
+    Open the writer of the TCX files for an output format.
+
+    Args:
+        tcx_format (str): One of TCX_FORMATS: 'tcx' for plain files, 'gzip'
+            for gzip compressed files or 'zip' for a single zip archive.
+
+    Returns:
+        TcxFolder or TcxArchive: The writer, to be closed once all the TCX
+        files are written.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    if tcx_format not in TCX_FORMATS:
+        raise ValueError(f"Unknown TCX format: {tcx_format}")
+    if tcx_format == "zip":
+        return TcxArchive(get_tcx_output_path(tcx_format))
+    return TcxFolder(get_tcx_dir(), compress=tcx_format == "gzip")
+
+
+TCX_NAMESPACE = "{http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2}"
+TPX_NAMESPACE = "{http://www.garmin.com/xmlschemas/ActivityExtension/v2}"
+
+# Arrays returned by `parse_tcx` and the type codes of their buffers
+TRACKPOINT_ARRAYS = {
+    "time": "d",
+    "lat": "d",
+    "lon": "d",
+    "altitude": "d",
+    "distance": "d",
+    "heart_rate": "f",
+    "cadence": "f",
+    "power": "f",
+}
+
+# Trackpoint descendants read by `parse_tcx`, by tag, and their array.
+# RunCadence and Watts are part of the TPX extension of the trackpoint.
+TRACKPOINT_FIELDS = {
+    TCX_NAMESPACE + "Time": "time",
+    TCX_NAMESPACE + "LatitudeDegrees": "lat",
+    TCX_NAMESPACE + "LongitudeDegrees": "lon",
+    TCX_NAMESPACE + "AltitudeMeters": "altitude",
+    TCX_NAMESPACE + "DistanceMeters": "distance",
+    TCX_NAMESPACE + "Value": "heart_rate",
+    TCX_NAMESPACE + "Cadence": "cadence",
+    TPX_NAMESPACE + "RunCadence": "cadence",
+    TPX_NAMESPACE + "Watts": "power",
+}
+
+
+def open_tcx_file(tcx_path: str) -> BinaryIO:
+    """
+    Open a TCX file written by a TCX writer for reading.
+
+    Args:
+        tcx_path (str): Path to a plain or gzip compressed TCX file, or to
+            an entry of a zip archive, as returned by `path_of`.
+
+    Returns:
+        BinaryIO: The uncompressed content of the TCX file.
+    """
+    if tcx_path.endswith(".gz"):
+        return gzip.open(tcx_path, "rb")
+    archive_path, entry_name = os.path.split(tcx_path)
+    if not os.path.exists(tcx_path) and zipfile.is_zipfile(archive_path):
+        # The opened entry keeps the archive file open until it is closed
+        with zipfile.ZipFile(archive_path) as archive:
+            return archive.open(entry_name)
+    return open(tcx_path, "rb")
+
+
+def parse_tcx_time(text: str) -> float:
+    """
+    Parse the time of a trackpoint, e.g. '2024-01-01T08:00:00.000Z'.
+
+    The 'Z' suffix, which `datetime.fromisoformat` only accepts from Python
+    3.11, is read as UTC, like times without an offset.
+
+    Args:
+        text (str): ISO 8601 time of the trackpoint.
+
+    Returns:
+        float: The POSIX timestamp of the time, in seconds.
+    """
+    text = text.strip()
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    time = datetime.fromisoformat(text)
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return time.timestamp()
+
+
+def parse_tcx(source: Union[str, bytes, BinaryIO]) -> dict:
+    """
+    Parse the trackpoints of a TCX file into columnar NumPy arrays.
+
+    The file is read incrementally: each trackpoint is removed from the tree
+    once its values are stored, so memory does not grow with the file size
+    beyond the arrays themselves. Missing values are NaN, or NaT for the
+    time.
+
+    Args:
+        source (str, bytes or BinaryIO): Path to a TCX file (see
+            `open_tcx_file`), content of a TCX file or binary file object.
+
+    Returns:
+        dict: Arrays with one value per trackpoint: 'time' (datetime64[ms],
+        UTC), 'lat' and 'lon' (degrees), 'altitude' and 'distance' (meters),
+        'heart_rate' (bpm), 'cadence' (rpm or spm) and 'power' (watts).
+    """
+    if isinstance(source, str):
+        with open_tcx_file(source) as file:
+            return parse_tcx(file)
+    if isinstance(source, bytes):
+        return parse_tcx(io.BytesIO(source))
+
+    buffers = {
+        name: array(typecode) for name, typecode in TRACKPOINT_ARRAYS.items()
+    }
+    trackpoint_tag = TCX_NAMESPACE + "Trackpoint"
+    track_tag = TCX_NAMESPACE + "Track"
+
+    track = None
+    for event, element in iterparse(source, events=("start", "end")):
+        if event == "start":
+            if element.tag == track_tag:
+                track = element
+            continue
+        if element.tag != trackpoint_tag:
+            continue
+
+        texts = {}
+        for child in element.iter():
+            name = TRACKPOINT_FIELDS.get(child.tag)
+            if name is not None and child.text:
+                texts[name] = child.text
+
+        for name, buffer in buffers.items():
+            text = texts.get(name)
+            if text is None:
+                buffer.append(np.nan)
+            elif name == "time":
+                buffer.append(parse_tcx_time(text))
+            else:
+                buffer.append(float(text))
+
+        # Trackpoints are removed from their track once read
+        element.clear()
+        if track is not None:
+            del track[:]
+
+    arrays = {
+        name: np.frombuffer(buffer, dtype=buffer.typecode)
+        for name, buffer in buffers.items()
+    }
+
+    seconds = arrays["time"]
+    time = np.full(len(seconds), np.datetime64("NaT"), dtype="datetime64[ms]")
+    valid = ~np.isnan(seconds)
+    time[valid] = np.round(seconds[valid] * 1000).astype("int64")
+    arrays["time"] = time
+
+    return arrays
+
+
+def compute_hr_zones(arrays: dict, boundaries: list) -> list:
+    """
+    Compute the time spent in each HR zone from the arrays of `parse_tcx`.
+
+    The time between two trackpoints is counted in the zone of the heart
+    rate of the first one. Gaps longer than MAX_TRACKPOINT_GAP seconds, such
+    as pauses, are not counted, nor are trackpoints without time or heart
+    rate, or below the first zone.
+
+    Args:
+        arrays (dict): Trackpoint arrays, as returned by `parse_tcx`.
+        boundaries (list): Lower heart rate of each zone, in ascending order.
+
+    Returns:
+        list: The HR zones, in the format of the payload of
+        `Garmin.get_activity_hr_in_timezones`.
+    """
+    time, heart_rate = arrays["time"], arrays["heart_rate"]
+    seconds = np.diff(time).astype("float64") / 1000
+    heart_rate = heart_rate[:-1]
+    zones = np.searchsorted(boundaries, heart_rate, side="right") - 1
+
+    valid = (
+        ~np.isnat(time[:-1])
+        & ~np.isnat(time[1:])
+        & ~np.isnan(heart_rate)
+        & (seconds > 0)
+        & (seconds <= MAX_TRACKPOINT_GAP)
+        & (zones >= 0)
+    )
+    secs_in_zones = np.bincount(
+        zones[valid], weights=seconds[valid], minlength=len(boundaries)
+    )
+
+    return [
+        {
+            "zoneNumber": i + 1,
+            "secsInZone": round(float(secs), 1),
+            "zoneLowBoundary": boundary,
+        }
+        for i, (secs, boundary) in enumerate(zip(secs_in_zones, boundaries))
+    ]
+
+
+class LocalHrZones:
+    """
+    Computation of the HR zones of activities from their TCX files, instead
+    of a call to `Garmin.get_activity_hr_in_timezones` per activity.
+
+    Zone boundaries depend on the sport, they are learned for each activity
+    type from the first HR zones payload obtained, from the API or the
+    store, for an activity of this type.
+
+    An instance can be shared between the threads fetching the activities.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._boundaries = {}
+
+    def learn(self, activity_type: str, hrz_data: list) -> None:
+        """
+        Learn the zone boundaries of an activity type from a payload.
+
+        Args:
+            activity_type (str): The type key of the activity.
+            hrz_data (list): The HR zones payload of an activity of this
+                type.
+        """
+        zones = sorted(hrz_data or [], key=lambda zone: zone["zoneNumber"])
+        boundaries = [zone.get("zoneLowBoundary") for zone in zones]
+        if not boundaries or None in boundaries:
+            return
+        with self._lock:
+            self._boundaries.setdefault(activity_type, boundaries)
+
+    def compute(
+        self, activity_type: str, tcx: Union[str, bytes, Callable[[], bytes]]
+    ) -> Optional[list]:
+        """
+        Compute the HR zones of an activity from its TCX file.
+
+        The file is only read once the boundaries of the activity type are
+        known. A file that cannot be read or parsed is skipped, so that the
+        HR zones of the activity are downloaded instead.
+
+        Args:
+            activity_type (str): The type key of the activity.
+            tcx (str, bytes or Callable): Path to the TCX file of the
+                activity, see `open_tcx_file`, its content, or a function
+                returning its content.
+
+        Returns:
+            list or None: The HR zones, see `compute_hr_zones`, or None if
+            the boundaries of this activity type are not known yet or the
+            file cannot be parsed.
+        """
+        with self._lock:
+            boundaries = self._boundaries.get(activity_type)
+        if boundaries is None:
+            return None
+        try:
+            if callable(tcx):
+                tcx = tcx()
+            arrays = parse_tcx(tcx)
+        except (
+            ParseError,
+            ValueError,
+            KeyError,
+            OSError,
+            EOFError,
+            zipfile.BadZipFile,
+        ) as e:
+            logging.warning(f"Cannot parse the TCX file: {e}")
+            return None
+        return compute_hr_zones(arrays, boundaries)
@@ -0,0 +1,91 @@
+import pandas as pd
+
+from utils.api_utils import JobCheckpoint, add_activities_details
+from utils.store_utils import ActivityStore
+
+
+def make_activities_data():
+    """Return renamed activities list data of two activities."""
+    return pd.DataFrame(
+        {
+            "Titre": ["Course", "Vélo"],
+            "Fréquence cardiaque maximale (bpm)": [180, 170],
+            "Exercise load": [100, 50],
+            "Training Effect aérobie": [3.0, 2.5],
+            "Training Effect anaérobie": [1.0, 0.5],
+        }
+    )
+
+
+def test_details_are_inserted_next_to_their_neighbours():
+    details_results = [
+        (
+            {"summaryDTO": {"directWorkoutFeel": 75, "directWorkoutRpe": 50}},
+            [{"secsInZone": 60}, {"secsInZone": 120}],
+            None,
+        ),
+        ({"summaryDTO": {}}, [{"secsInZone": 30}], None),
+    ]
+
+    data = add_activities_details(
+        make_activities_data(), [1, 2], details_results
+    )
+
+    assert list(data.columns) == [
+        "Titre",
+        "Fréquence cardiaque maximale (bpm)",
+        "Temps en Zone de FC 1 (sec)",
+        "Temps en Zone de FC 2 (sec)",
+        "Exercise load",
+        "Comment vous êtes-vous senti ?",
+        "Effort perçu",
+        "Training Effect aérobie",
+        "Training Effect anaérobie",
+    ]
+    assert data["Temps en Zone de FC 2 (sec)"].tolist() == [120, ""]
+    assert data["Effort perçu"].tolist() == [50, ""]
+
+
+def test_perceived_effort_without_feel_keeps_its_place():
+    details_results = [
+        ({"summaryDTO": {"directWorkoutRpe": 50}}, [], None),
+        (None, [], None),
+    ]
+
+    data = add_activities_details(
+        make_activities_data(), [1, 2], details_results
+    )
+
+    assert list(data.columns)[2:] == [
+        "Exercise load",
+        "Training Effect aérobie",
+        "Effort perçu",
+        "Training Effect anaérobie",
+    ]
+
+
+def test_interrupted_job_resumes_its_windows(tmp_path):
+    window = ("2024-01-01", "2024-01-31")
+    activities = [
+        {"activityId": 2, "startTimeLocal": "2024-01-02 08:00:00"},
+        {"activityId": 1, "startTimeLocal": "2024-01-01 08:00:00"},
+    ]
+    store = ActivityStore(str(tmp_path / "activities.sqlite"))
+    store.save_summaries(activities)
+
+    checkpoint = JobCheckpoint(store, "job")
+    assert checkpoint.get_window(window) is None
+    checkpoint.add_window(window, activities)
+    for _ in activities:
+        checkpoint.add_activity(window)
+    checkpoint.activity_done(window)
+
+    # Interrupted before the details of every activity were fetched
+    assert JobCheckpoint(store, "job").get_window(window) is None
+
+    checkpoint.activity_done(window)
+
+    assert JobCheckpoint(store, "job").get_window(window) == activities
+    assert JobCheckpoint(store, "other job").get_window(window) is None
+
+    store.close()
@@ -0,0 +1,39 @@
+import queue
+import threading
+
+from utils import app_utils
+from utils.app_utils import can_resume_job, run_job
+
+GUI_PARAMS = dict(
+    startdate="2024-01-01",
+    enddate="2024-01-31",
+    activity_type="running",
+    include_tcx=False,
+    sync=False,
+    output_format="Excel",
+    tcx_format="tcx",
+    columns=None,
+)
+
+
+def test_only_jobs_of_the_gui_can_be_resumed():
+    cli_params = dict(GUI_PARAMS, local_hr_zones=True)
+    del cli_params["sync"]
+
+    assert can_resume_job(GUI_PARAMS)
+    assert not can_resume_job(cli_params)
+    assert not can_resume_job({})
+
+
+def test_any_job_failure_is_sent_to_the_gui(monkeypatch):
+    def export_job(*args):
+        raise ImportError("No module named 'pandas'")
+
+    monkeypatch.setattr(app_utils, "export_job", export_job)
+    events = queue.Queue()
+
+    run_job(events, threading.Event(), "me@example.com", "", **GUI_PARAMS)
+
+    kind, error = events.get_nowait()
+    assert kind == "error"
+    assert isinstance(error, ImportError)
@@ -0,0 +1,30 @@
+import pandas as pd
+
+from utils.data_utils import (
+    format_activities_data,
+    iter_formatted_rows,
+    process_activities_data,
+)
+
+
+def test_rows_are_formatted_as_the_data():
+    data = process_activities_data(
+        pd.DataFrame(
+            {
+                "Identifiant Garmin de l'activité": [2, 1],
+                "Date": ["2024-01-02 08:00:00", None],
+                "Favori": [True, None],
+                "Comment vous êtes-vous senti ?": [None, 75],
+                "Effort perçu": [None, 50],
+                "Distance": [10.5, None],
+            }
+        )
+    )
+
+    rows = list(iter_formatted_rows(data))
+
+    assert rows == list(
+        format_activities_data(data).itertuples(index=False, name=None)
+    )
+    assert rows[0][:3] == ("2", "2024-01-02 08:00:00", "Oui")
+    assert rows[1][1:3] == ("", "")
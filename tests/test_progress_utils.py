@@ -0,0 +1,70 @@
+import pytest
+
+from utils import progress_utils
+from utils.progress_utils import ProgressReporter, format_duration
+
+
+class FakeClock:
+    """Monotonic clock advanced by the tests."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(progress_utils.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def test_durations_are_formatted():
+    assert format_duration(59.6) == "1:00"
+    assert format_duration(3725) == "1:02:05"
+
+
+def test_progress_is_reported_at_a_bounded_rate(clock):
+    reports = []
+    reporter = ProgressReporter(
+        lambda *report: reports.append(report), max_rate=2
+    )
+
+    for _ in range(10):
+        reporter.advance(total=100)
+        clock.now += 0.1
+
+    # One report per half second, the counts being exact
+    assert [done for _, done, _ in reports] == [1, 6]
+    assert reporter.done == 10
+
+    reporter.report("Terminé", 10, 10)
+    assert reports[-1] == ("Terminé", 10, 10)
+
+
+def test_throughput_and_eta_are_estimated(clock):
+    reports = []
+    reporter = ProgressReporter(lambda *report: reports.append(report))
+
+    reporter.advance(total=11)
+    assert reporter.throughput() is None
+    assert reports[0][0] == progress_utils.PROGRESS_MSG + "1/11"
+
+    clock.now += 2.0
+    reporter.advance(total=11)
+
+    assert reporter.throughput() == 0.5
+    assert reporter.eta() == 18.0
+    assert reports[-1][0] == (
+        progress_utils.PROGRESS_MSG + "2/11 (0.5 activités/s, reste 0:18)"
+    )
+
+
+def test_nothing_is_reported_without_callback(clock):
+    reporter = ProgressReporter(None)
+
+    reporter.advance(total=1)
+
+    assert reporter.done == 1
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+from garminconnect import (
+    GarminConnectConnectionError,
+    GarminConnectTooManyRequestsError,
+)
+
+from utils import rate_utils
+from utils.rate_utils import RequestGovernor
+
+
+class FakeClock:
+    """Clock of the governor, advanced only by its sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    async def async_sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    for name in ("monotonic", "perf_counter", "sleep"):
+        monkeypatch.setattr(rate_utils.time, name, getattr(clock, name))
+    monkeypatch.setattr(rate_utils.asyncio, "sleep", clock.async_sleep)
+    # Backoff delays without jitter
+    monkeypatch.setattr(rate_utils.random, "uniform", lambda a, b: 0.0)
+    return clock
+
+
+class FakeEndpoint:
+    """API function failing with the given errors before succeeding."""
+
+    __name__ = "get_activity_evaluation"
+
+    def __init__(self, clock, governor, errors=()):
+        self.clock = clock
+        self.governor = governor
+        self.errors = list(errors)
+        self.calls = []
+
+    def __call__(self):
+        self.calls.append(self.clock.now)
+        if self.errors:
+            status, error = self.errors.pop(0)
+            # As recorded by the response hook of the session
+            self.governor._local.status = status
+            raise error
+        return "ok"
+
+
+def test_requests_are_spaced_by_the_token_bucket(clock):
+    governor = RequestGovernor(rate=2.0, max_rate=2.0)
+    endpoint = FakeEndpoint(clock, governor)
+
+    for _ in range(3):
+        assert governor.call(endpoint) == "ok"
+
+    assert [t - 1000.0 for t in endpoint.calls] == pytest.approx(
+        [0.0, 0.5, 1.0]
+    )
+
+
+@pytest.mark.parametrize(
+    "status, error",
+    [
+        (429, GarminConnectConnectionError("Too many requests")),
+        (None, GarminConnectTooManyRequestsError("Too many requests")),
+        (503, GarminConnectConnectionError("Service unavailable")),
+        (None, GarminConnectConnectionError("Connection reset")),
+    ],
+)
+def test_transient_errors_are_retried(clock, status, error):
+    governor = RequestGovernor(rate=100.0)
+    endpoint = FakeEndpoint(clock, governor, [(status, error)])
+
+    assert governor.call(endpoint) == "ok"
+    assert len(endpoint.calls) == 2
+    # First retry delay of the exponential backoff, without jitter
+    assert endpoint.calls[1] - endpoint.calls[0] >= 0.5
+
+
+@pytest.mark.parametrize(
+    "status, error",
+    [
+        (404, GarminConnectConnectionError("Not found")),
+        (None, ValueError("Invalid payload")),
+    ],
+)
+def test_other_errors_are_raised(clock, status, error):
+    governor = RequestGovernor()
+    endpoint = FakeEndpoint(clock, governor, [(status, error)])
+
+    with pytest.raises(type(error)):
+        governor.call(endpoint)
+    assert len(endpoint.calls) == 1
+
+
+def test_retries_are_bounded(clock):
+    governor = RequestGovernor(rate=100.0, max_retries=2)
+    errors = [(503, GarminConnectConnectionError("Unavailable"))] * 5
+    endpoint = FakeEndpoint(clock, governor, errors)
+
+    with pytest.raises(GarminConnectConnectionError):
+        governor.call(endpoint)
+    assert len(endpoint.calls) == 3
+
+
+def test_throttling_burst_lowers_the_rate_once(clock):
+    governor = RequestGovernor(rate=4.0, min_rate=0.5)
+
+    # Concurrent requests throttled by the same burst
+    for _ in range(3):
+        governor._on_throttled(delay=2.0)
+    assert governor.rate == 4.0 / 2
+
+    # A request throttled after the pause lowers it again
+    clock.sleep(2.0)
+    governor._on_throttled(delay=2.0)
+    assert governor.rate == 4.0 / 4
+
+    for _ in range(10):
+        clock.sleep(2.0)
+        governor._on_throttled(delay=1.0)
+    assert governor.rate == 0.5
+
+
+def test_throttling_pauses_every_caller(clock):
+    governor = RequestGovernor(rate=100.0)
+    governor._on_throttled(delay=3.0)
+    endpoint = FakeEndpoint(clock, governor)
+
+    governor.call(endpoint)
+
+    assert endpoint.calls[0] - 1000.0 >= 3.0
+
+
+def test_successes_raise_the_rate_up_to_max_rate(clock):
+    governor = RequestGovernor(rate=1.0, max_rate=2.0)
+
+    governor._on_success()
+    assert governor.rate == pytest.approx(1.0 + rate_utils.RATE_INCREASE)
+
+    for _ in range(100):
+        governor._on_success()
+    assert governor.rate == 2.0
+
+
+def test_async_calls_read_the_status_of_the_error(clock):
+    governor = RequestGovernor(rate=100.0)
+    calls = []
+
+    async def get_activity_evaluation():
+        calls.append(clock.now)
+        if len(calls) == 1:
+            error = ConnectionError("Too many requests")
+            error.status = 429
+            raise error
+        return "ok"
+
+    assert asyncio.run(governor.call_async(get_activity_evaluation)) == "ok"
+    assert len(calls) == 2
+    assert governor.rate < 100.0
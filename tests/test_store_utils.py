@@ -0,0 +1,104 @@
+import sqlite3
+
+import pytest
+
+from utils.store_utils import ActivityStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ActivityStore(str(tmp_path / "activities.sqlite"))
+    yield store
+    store.close()
+
+
+def test_payloads_round_trip(store):
+    store.save_payload(1, "tcx", b"<tcx/>")
+    store.save_payload(1, "summary", {"activityId": 1})
+
+    assert store.get_payload(1, "tcx") == b"<tcx/>"
+    assert store.get_payload_size(1, "tcx") == 6
+    assert store.get_payload(1, "summary") == {"activityId": 1}
+    assert store.get_payload(2, "tcx") is None
+    with pytest.raises(ValueError):
+        store.get_payload(1, "unknown")
+
+
+def test_summaries_are_read_in_order(store):
+    store.save_summaries(
+        [
+            {"activityId": 1, "startTimeLocal": "2024-01-01 08:00:00"},
+            {"activityId": 2, "startTimeLocal": "2024-01-02 08:00:00"},
+        ]
+    )
+
+    summaries = store.get_summaries([2, 1])
+
+    assert [summary["activityId"] for summary in summaries] == [2, 1]
+    assert store.get_summaries([1, 3]) is None
+
+
+def test_recent_evaluations_are_not_settled(store):
+    store.save_summaries(
+        [
+            {"activityId": 1, "startTimeLocal": "2000-01-01 08:00:00"},
+            {"activityId": 2, "startTimeLocal": "2999-01-01 08:00:00"},
+        ]
+    )
+    store.save_payload(1, "evaluation", {"directWorkoutRpe": 50})
+    store.save_payload(2, "evaluation", {"directWorkoutRpe": 50})
+
+    assert store.get_payload(1, "evaluation") == {"directWorkoutRpe": 50}
+    assert store.get_payload(2, "evaluation") is None
+
+
+def test_job_reads_the_evaluations_it_downloaded(store):
+    store.save_summaries(
+        [{"activityId": 1, "startTimeLocal": "2999-01-01 08:00:00"}]
+    )
+    store.save_payload(1, "hr_zones", [{"zoneNumber": 1}], job_key="job")
+
+    assert store.get_payload(1, "hr_zones", "job") == [{"zoneNumber": 1}]
+    assert store.get_payload(1, "hr_zones", "other job") is None
+    assert store.get_payload(1, "hr_zones") is None
+
+
+def test_store_without_download_dates_is_migrated(tmp_path):
+    path = str(tmp_path / "activities.sqlite")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE activities (activity_id INTEGER PRIMARY KEY, "
+        "start_time_local TEXT, summary TEXT, evaluation TEXT, "
+        "hr_zones TEXT, tcx BLOB)"
+    )
+    connection.execute(
+        "INSERT INTO activities VALUES "
+        "(1, '2000-01-01 08:00:00', NULL, '{}', NULL, NULL)"
+    )
+    connection.commit()
+    connection.close()
+
+    store = ActivityStore(path)
+    try:
+        assert store.get_payload(1, "evaluation") is None
+        store.save_payload(1, "evaluation", {"directWorkoutFeel": 75})
+        assert store.get_payload(1, "evaluation") == {"directWorkoutFeel": 75}
+    finally:
+        store.close()
+
+
+def test_jobs_and_windows(store):
+    store.save_job("job", "me@example.com", {"startdate": "2024-01-01"})
+    store.save_job_window("job", "2024-01-01", "2024-01-31", [2, 1])
+
+    assert store.get_jobs("me@example.com") == [
+        ("job", {"startdate": "2024-01-01"})
+    ]
+    assert store.get_job_windows("job") == {
+        ("2024-01-01", "2024-01-31"): [2, 1]
+    }
+
+    store.delete_job("job")
+
+    assert store.get_jobs("me@example.com") == []
+    assert store.get_job_windows("job") == {}
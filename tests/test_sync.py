@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.api_utils import ActivitiesDownload
+from utils.base_utils import load_export, save_activities
+from utils.data_utils import (
+    get_watermark,
+    merge_activities_data,
+    process_activities_data,
+)
+
+
+def make_activities_data(activity_ids, rpe):
+    """Return processed activities data, as downloaded."""
+    return process_activities_data(
+        pd.DataFrame(
+            {
+                "Identifiant Garmin de l'activité": activity_ids,
+                "Date": [
+                    f"2024-01-{day:02d} 08:00:00"
+                    for day in range(len(activity_ids), 0, -1)
+                ],
+                "Titre": [f"Activité {i}" for i in activity_ids],
+                "Effort perçu": rpe,
+            }
+        )
+    )
+
+
+@pytest.mark.parametrize("output_format", ["Excel", "CSV"])
+def test_sync_merges_export_with_missing_rpe(tmp_path, output_format):
+    extension = ".xlsx" if output_format == "Excel" else ".csv"
+    dump_path = str(tmp_path / f"activities{extension}")
+    exported = make_activities_data([2, 1], [70, np.nan])
+    save_activities(
+        exported, output_format, "2024-01-01", "2024-01-02", dump_path
+    )
+
+    existing = load_export(dump_path)
+    new = make_activities_data([3, 2], [np.nan, 80])
+    merged = merge_activities_data(new, existing)
+
+    assert merged["Identifiant Garmin de l'activité"].tolist() == [3, 2, 1]
+    assert merged["Effort perçu"].dtype == "Int64"
+    assert merged["Effort perçu"].isna().tolist() == [True, False, True]
+    assert merged["Effort perçu"].iloc[1] == 8
+
+
+def test_watermark_ignores_activities_without_date_or_id():
+    data = make_activities_data([3, 2, 1], [np.nan, 80, 70])
+    data.loc[0, "Date"] = pd.NaT
+    data.loc[1, "Identifiant Garmin de l'activité"] = pd.NA
+
+    assert get_watermark(data) == {
+        "start_time_local": "2024-01-01 08:00:00",
+        "activity_id": 1,
+    }
+    assert get_watermark(data.iloc[:2]) is None
+
+
+def test_sync_keeps_activities_after_the_watermark():
+    download = ActivitiesDownload(
+        "2024-01-01",
+        "2024-01-31",
+        newer_than={
+            "start_time_local": "2024-01-10 08:00:00",
+            "activity_id": 2,
+        },
+        columns=[],
+    )
+
+    details_args = download.add_window(
+        0,
+        [
+            {"activityId": 4, "startTimeLocal": "2024-01-20 08:00:00"},
+            {"activityId": 3},
+            {"activityId": 2, "startTimeLocal": "2024-01-10 08:00:00"},
+            {"activityId": 1, "startTimeLocal": "2024-01-05 08:00:00"},
+        ],
+    )
+
+    assert details_args == []
+    assert download.activities.to_frame()[1] == [4, 3]
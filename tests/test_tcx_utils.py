@@ -0,0 +1,103 @@
+import numpy as np
+
+from utils.tcx_utils import LocalHrZones, parse_tcx, parse_tcx_time
+
+# Trackpoints as exported by Garmin Connect
+TCX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<TrainingCenterDatabase
+  xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2"
+  xmlns:ns3="http://www.garmin.com/xmlschemas/ActivityExtension/v2">
+  <Activities>
+    <Activity Sport="Running">
+      <Id>2024-01-01T08:00:00.000Z</Id>
+      <Lap StartTime="2024-01-01T08:00:00.000Z">
+        <TotalTimeSeconds>2.0</TotalTimeSeconds>
+        <Track>
+          <Trackpoint>
+            <Time>2024-01-01T08:00:00.000Z</Time>
+            <Position>
+              <LatitudeDegrees>48.8566</LatitudeDegrees>
+              <LongitudeDegrees>2.3522</LongitudeDegrees>
+            </Position>
+            <AltitudeMeters>35.0</AltitudeMeters>
+            <DistanceMeters>0.0</DistanceMeters>
+            <HeartRateBpm>
+              <Value>120</Value>
+            </HeartRateBpm>
+            <Extensions>
+              <ns3:TPX>
+                <ns3:Speed>2.5</ns3:Speed>
+                <ns3:RunCadence>85</ns3:RunCadence>
+              </ns3:TPX>
+            </Extensions>
+          </Trackpoint>
+          <Trackpoint>
+            <Time>2024-01-01T08:00:01.500Z</Time>
+            <DistanceMeters>3.2</DistanceMeters>
+          </Trackpoint>
+          <Trackpoint>
+            <Time>2024-01-01T08:00:02</Time>
+          </Trackpoint>
+        </Track>
+      </Lap>
+    </Activity>
+  </Activities>
+</TrainingCenterDatabase>
+"""
+
+
+def test_times_are_read_as_utc():
+    utc = 1704096000.0  # 2024-01-01T08:00:00 UTC
+
+    assert parse_tcx_time("2024-01-01T08:00:00.000Z") == utc
+    assert parse_tcx_time("2024-01-01T08:00:00") == utc
+    assert parse_tcx_time("2024-01-01T10:00:00+02:00") == utc
+
+
+def test_trackpoints_are_parsed():
+    arrays = parse_tcx(TCX)
+
+    assert arrays["time"].tolist() == [
+        np.datetime64("2024-01-01T08:00:00.000"),
+        np.datetime64("2024-01-01T08:00:01.500"),
+        np.datetime64("2024-01-01T08:00:02.000"),
+    ]
+    assert arrays["lat"][0] == 48.8566
+    assert arrays["heart_rate"][0] == 120
+    assert arrays["cadence"][0] == 85
+    assert arrays["distance"][1] == 3.2
+    assert np.isnan(arrays["heart_rate"][1:]).all()
+    assert np.isnan(arrays["power"]).all()
+
+
+def test_hr_zones_are_computed_once_boundaries_are_known():
+    hr_zones = LocalHrZones()
+    read = []
+
+    def read_tcx():
+        read.append(True)
+        return TCX
+
+    assert hr_zones.compute("running", read_tcx) is None
+    assert read == []
+
+    hr_zones.learn(
+        "running",
+        [
+            {"zoneNumber": 1, "zoneLowBoundary": 100},
+            {"zoneNumber": 2, "zoneLowBoundary": 130},
+        ],
+    )
+    zones = hr_zones.compute("running", read_tcx)
+
+    assert read == [True]
+    assert [zone["secsInZone"] for zone in zones] == [1.5, 0.0]
+
+
+def test_unparsable_tcx_files_are_skipped():
+    hr_zones = LocalHrZones()
+    hr_zones.learn("running", [{"zoneNumber": 1, "zoneLowBoundary": 100}])
+
+    assert hr_zones.compute("running", b"<TrainingCenterDatabase>") is None
+    invalid_time = TCX.replace(b"08:00:01", b"08:")
+    assert hr_zones.compute("running", invalid_time) is None